@@ -23,10 +23,19 @@
 
 import tkinter as tk
 from tkinter import simpledialog, messagebox
-import random
-import copy
 import threading
+import queue
 import time
+import json
+import argparse
+
+from chess_bitboard import (Position, WHITE, EMPTY, KNIGHT, BISHOP, KING, QUEEN, PIECE_CODES,
+                            START_FEN, FLAG_CASTLE, move_from, move_promotion, move_to_tuple, move_name, perft)
+from chess_pgn import default_headers, format_pgn, parse_pgn
+from chess_book import DEFAULT_BOOK, open_book
+from chess_tablebase import DEFAULT_DIR as DEFAULT_TABLEBASE_DIR, Tablebases
+from chess_engine import (TranspositionTable, allocate_time, iterative_deepening, create_search_pool,
+                          parallel_search, ordering_benchmark, SearchStats, multipv_search, MAX_PLY, MATE_SCORE)
 
 BOARD_SIZE = 8  # 8x8 chessboard
 
@@ -46,6 +55,14 @@ PIECE_COLORS = {
     'black': '#4040a0',  # deep blue
 }
 
+# Glyph and colour of each integer piece code of the bitboard position (color * 6 + type)
+PIECE_GLYPHS = [PIECES['white' if code[0] == 'w' else 'black'][code[1]] for code in PIECE_CODES]
+PIECE_FILLS = [PIECE_COLORS['white' if code[0] == 'w' else 'black'] for code in PIECE_CODES]
+
+# Move animation: total length and time between frames, in milliseconds
+ANIMATION_MS = 160
+FRAME_MS = 16
+
 NUM_PLAYERS = 2
 DEFAULT_TIME_MINUTES = 10
 
@@ -68,101 +85,10 @@ class Player:
         self.games_played = 0
         self.is_computer = is_computer
 
-# --- AI Section ---
-
-PIECE_VALUES = {
-    'K': 0,  # King value is handled by checkmate
-    'Q': 900,
-    'R': 500,
-    'B': 330,
-    'N': 320,
-    'P': 100
-}
-
-# Piece-square tables for positional evaluation (simplified, for both colors)
-PIECE_SQUARE_TABLES = {
-    'P': [
-        [0, 0, 0, 0, 0, 0, 0, 0],
-        [5, 10, 10, -20, -20, 10, 10, 5],
-        [5, -5, -10, 0, 0, -10, -5, 5],
-        [0, 0, 0, 20, 20, 0, 0, 0],
-        [5, 5, 10, 25, 25, 10, 5, 5],
-        [10, 10, 20, 30, 30, 20, 10, 10],
-        [50, 50, 50, 50, 50, 50, 50, 50],
-        [0, 0, 0, 0, 0, 0, 0, 0]
-    ],
-    'N': [
-        [-50, -40, -30, -30, -30, -30, -40, -50],
-        [-40, -20, 0, 0, 0, 0, -20, -40],
-        [-30, 0, 10, 15, 15, 10, 0, -30],
-        [-30, 5, 15, 20, 20, 15, 5, -30],
-        [-30, 0, 15, 20, 20, 15, 0, -30],
-        [-30, 5, 10, 15, 15, 10, 5, -30],
-        [-40, -20, 0, 5, 5, 0, -20, -40],
-        [-50, -40, -30, -30, -30, -30, -40, -50]
-    ],
-    'B': [
-        [-20, -10, -10, -10, -10, -10, -10, -20],
-        [-10, 0, 0, 0, 0, 0, 0, -10],
-        [-10, 0, 5, 10, 10, 5, 0, -10],
-        [-10, 5, 5, 10, 10, 5, 5, -10],
-        [-10, 0, 10, 10, 10, 10, 0, -10],
-        [-10, 10, 10, 10, 10, 10, 10, -10],
-        [-10, 5, 0, 0, 0, 0, 5, -10],
-        [-20, -10, -10, -10, -10, -10, -10, -20]
-    ],
-    'R': [
-        [0, 0, 0, 0, 0, 0, 0, 0],
-        [5, 10, 10, 10, 10, 10, 10, 5],
-        [-5, 0, 0, 0, 0, 0, 0, -5],
-        [-5, 0, 0, 0, 0, 0, 0, -5],
-        [-5, 0, 0, 0, 0, 0, 0, -5],
-        [-5, 0, 0, 0, 0, 0, 0, -5],
-        [-5, 0, 0, 0, 0, 0, 0, -5],
-        [0, 0, 0, 5, 5, 0, 0, 0]
-    ],
-    'Q': [
-        [-20, -10, -10, -5, -5, -10, -10, -20],
-        [-10, 0, 0, 0, 0, 0, 0, -10],
-        [-10, 0, 5, 5, 5, 5, 0, -10],
-        [-5, 0, 5, 5, 5, 5, 0, -5],
-        [0, 0, 5, 5, 5, 5, 0, -5],
-        [-10, 5, 5, 5, 5, 5, 0, -10],
-        [-10, 0, 5, 0, 0, 0, 0, -10],
-        [-20, -10, -10, -5, -5, -10, -10, -20]
-    ],
-    'K': [
-        [-30, -40, -40, -50, -50, -40, -40, -30],
-        [-30, -40, -40, -50, -50, -40, -40, -30],
-        [-30, -40, -40, -50, -50, -40, -40, -30],
-        [-30, -40, -40, -50, -50, -40, -40, -30],
-        [-20, -30, -30, -40, -40, -30, -30, -20],
-        [-10, -20, -20, -20, -20, -20, -20, -10],
-        [20, 20, 0, 0, 0, 0, 20, 20],
-        [20, 30, 10, 0, 0, 10, 30, 20]
-    ]
-}
-
-def evaluate_board(board, color):
-    # Material + piece-square tables
-    score = 0
-    for r in range(BOARD_SIZE):
-        for c in range(BOARD_SIZE):
-            code = board[r][c]
-            if code:
-                piece = code[1]
-                sign = 1 if code[0] == color else -1
-                value = PIECE_VALUES.get(piece, 0)
-                pst = PIECE_SQUARE_TABLES.get(piece, [[0]*8]*8)
-                # For black, flip the table
-                if code[0] == 'w':
-                    pst_score = pst[r][c]
-                else:
-                    pst_score = pst[7 - r][c]
-                score += sign * (value + pst_score)
-    return score
+# --- Perft comparison against the square-scan generator ---
 
-def all_legal_moves(game, board, color, en_passant_target, castling_rights):
+def _scan_legal_moves(game, board, color, en_passant_target, castling_rights):
+    # The original generator: every from-square against every to-square
     moves = []
     for r in range(BOARD_SIZE):
         for c in range(BOARD_SIZE):
@@ -174,192 +100,313 @@ def all_legal_moves(game, board, color, en_passant_target, castling_rights):
                             moves.append((r, c, rr, cc))
     return moves
 
-def is_checkmate_custom(game, board, color, en_passant_target, castling_rights):
-    opp_color = 'b' if color == 'w' else 'w'
-    king_pos = None
-    for r in range(BOARD_SIZE):
-        for c in range(BOARD_SIZE):
-            if board[r][c] == color + 'K':
-                king_pos = (r, c)
-    if not king_pos:
-        return True
-    if not game.square_attacked_custom(board, king_pos[0], king_pos[1], opp_color):
-        return False
-    for r in range(BOARD_SIZE):
-        for c in range(BOARD_SIZE):
-            code = board[r][c]
-            if code and code[0] == color:
-                for rr in range(BOARD_SIZE):
-                    for cc in range(BOARD_SIZE):
-                        if game.is_valid_move_custom(board, en_passant_target, castling_rights, r, c, rr, cc):
-                            # Try move
-                            backup = [row[:] for row in board]
-                            move_code = board[r][c]
-                            move_target = board[rr][cc]
-                            board[rr][cc] = move_code
-                            board[r][c] = None
-                            king_pos2 = (rr, cc) if move_code[1] == 'K' else king_pos
-                            in_check = game.square_attacked_custom(board, king_pos2[0], king_pos2[1], opp_color)
-                            board = [row[:] for row in backup]
-                            if not in_check:
-                                return False
-    return True
-
-def minimax(game, board, en_passant_target, castling_rights, depth, alpha, beta, maximizing, color, orig_color):
-    # Returns (score, move)
-    if depth == 0:
-        return evaluate_board(board, orig_color), None
-    moves = all_legal_moves(game, board, color, en_passant_target, castling_rights)
-    if not moves:
-        if is_checkmate_custom(game, board, color, en_passant_target, castling_rights):
-            return (-99999 if maximizing else 99999), None
-        else:
-            return 0, None  # Stalemate
-    best_move = None
-    if maximizing:
-        max_eval = -float('inf')
-        for move in moves:
-            new_board = [row[:] for row in board]
-            new_en_passant = en_passant_target
-            new_castling = dict(castling_rights)
-            # Simulate move
-            r1, c1, r2, c2 = move
-            code = new_board[r1][c1]
-            kind = code[1]
-            # Handle en passant
-            if kind == 'P' and abs(r2 - r1) == 2:
-                new_en_passant = ((r1 + r2) // 2, c1)
-            else:
-                new_en_passant = None
-            # Handle castling rights
-            if code == 'wK':
-                new_castling['wK'] = False
-                new_castling['wQ'] = False
-            if code == 'bK':
-                new_castling['bK'] = False
-                new_castling['bQ'] = False
-            if code == 'wR':
-                if r1 == 7 and c1 == 0:
-                    new_castling['wQ'] = False
-                if r1 == 7 and c1 == 7:
-                    new_castling['wK'] = False
-            if code == 'bR':
-                if r1 == 0 and c1 == 0:
-                    new_castling['bQ'] = False
-                if r1 == 0 and c1 == 7:
-                    new_castling['bK'] = False
-            # Castling move
-            if kind == 'K' and abs(c2 - c1) == 2:
-                row = r1
-                if c2 == 6:  # kingside
-                    new_board[row][4] = None
-                    new_board[row][6] = code
-                    new_board[row][7] = None
-                    new_board[row][5] = code[0] + 'R'
-                else:  # queenside
-                    new_board[row][4] = None
-                    new_board[row][2] = code
-                    new_board[row][0] = None
-                    new_board[row][3] = code[0] + 'R'
-            else:
-                # En passant capture
-                if kind == 'P' and (r2, c2) == en_passant_target and not new_board[r2][c2]:
-                    if code[0] == 'w':
-                        captured_row = r2 + 1
-                    else:
-                        captured_row = r2 - 1
-                    new_board[captured_row][c2] = None
-                # Normal move
-                new_board[r2][c2] = code
-                new_board[r1][c1] = None
-                # Pawn promotion
-                if kind == 'P' and (r2 == 0 or r2 == 7):
-                    new_board[r2][c2] = code[0] + 'Q'
-            eval_score, _ = minimax(game, new_board, new_en_passant, new_castling, depth-1, alpha, beta, False, 'b' if color == 'w' else 'w', orig_color)
-            if eval_score > max_eval:
-                max_eval = eval_score
-                best_move = move
-            alpha = max(alpha, eval_score)
-            if beta <= alpha:
-                break
-        return max_eval, best_move
+def _scan_apply_move(board, move, en_passant_target, castling_rights):
+    new_board = [row[:] for row in board]
+    new_castling = dict(castling_rights)
+    r1, c1, r2, c2 = move
+    code = new_board[r1][c1]
+    kind = code[1]
+    # Handle en passant
+    if kind == 'P' and abs(r2 - r1) == 2:
+        new_en_passant = ((r1 + r2) // 2, c1)
     else:
-        min_eval = float('inf')
-        for move in moves:
-            new_board = [row[:] for row in board]
-            new_en_passant = en_passant_target
-            new_castling = dict(castling_rights)
-            r1, c1, r2, c2 = move
-            code = new_board[r1][c1]
-            kind = code[1]
-            if kind == 'P' and abs(r2 - r1) == 2:
-                new_en_passant = ((r1 + r2) // 2, c1)
+        new_en_passant = None
+    # Handle castling rights
+    if code == 'wK':
+        new_castling['wK'] = False
+        new_castling['wQ'] = False
+    if code == 'bK':
+        new_castling['bK'] = False
+        new_castling['bQ'] = False
+    if code == 'wR':
+        if r1 == 7 and c1 == 0:
+            new_castling['wQ'] = False
+        if r1 == 7 and c1 == 7:
+            new_castling['wK'] = False
+    if code == 'bR':
+        if r1 == 0 and c1 == 0:
+            new_castling['bQ'] = False
+        if r1 == 0 and c1 == 7:
+            new_castling['bK'] = False
+    # Castling move
+    if kind == 'K' and abs(c2 - c1) == 2:
+        row = r1
+        if c2 == 6:  # kingside
+            new_board[row][4] = None
+            new_board[row][6] = code
+            new_board[row][7] = None
+            new_board[row][5] = code[0] + 'R'
+        else:  # queenside
+            new_board[row][4] = None
+            new_board[row][2] = code
+            new_board[row][0] = None
+            new_board[row][3] = code[0] + 'R'
+    else:
+        # En passant capture
+        if kind == 'P' and (r2, c2) == en_passant_target and not new_board[r2][c2]:
+            if code[0] == 'w':
+                captured_row = r2 + 1
+            else:
+                captured_row = r2 - 1
+            new_board[captured_row][c2] = None
+        # Normal move
+        new_board[r2][c2] = code
+        new_board[r1][c1] = None
+        # Pawn promotion
+        if kind == 'P' and (r2 == 0 or r2 == 7):
+            new_board[r2][c2] = code[0] + 'Q'
+    return new_board, new_en_passant, new_castling
+
+def _scan_perft(game, board, color, en_passant_target, castling_rights, depth):
+    if depth == 0:
+        return 1
+    opp_color = 'b' if color == 'w' else 'w'
+    nodes = 0
+    for move in _scan_legal_moves(game, board, color, en_passant_target, castling_rights):
+        new_board, new_ep, new_castling = _scan_apply_move(board, move, en_passant_target, castling_rights)
+        # The scan generator leaves pins and checks to the caller
+        king_pos = None
+        for r in range(BOARD_SIZE):
+            for c in range(BOARD_SIZE):
+                if new_board[r][c] == color + 'K':
+                    king_pos = (r, c)
+        if game.square_attacked_custom(new_board, king_pos[0], king_pos[1], opp_color):
+            continue
+        nodes += _scan_perft(game, new_board, opp_color, new_ep, new_castling, depth - 1)
+    return nodes
+
+def perft_compare(max_depth=3):
+    # Node counts and timings of both generators from the starting position
+    game = ChessGame.__new__(ChessGame)  # only the board-copy validators are needed, no window
+    game._patch_custom_methods()
+    board = [row[:] for row in STARTING_POSITION]
+    castling_rights = {'wK': True, 'wQ': True, 'bK': True, 'bQ': True}
+    position = Position.from_board(board, 'w', None, castling_rights)
+    results = []
+    for depth in range(1, max_depth + 1):
+        start = time.perf_counter()
+        scan_nodes = _scan_perft(game, board, 'w', None, castling_rights, depth)
+        scan_time = time.perf_counter() - start
+        start = time.perf_counter()
+        bitboard_nodes = perft(position, depth)
+        bitboard_time = time.perf_counter() - start
+        status = "OK" if scan_nodes == bitboard_nodes else "MISMATCH"
+        print(f"depth {depth}: scan {scan_nodes} nodes in {scan_time:.3f}s | "
+              f"bitboard {bitboard_nodes} nodes in {bitboard_time:.3f}s | "
+              f"{status} | speedup {scan_time / max(bitboard_time, 1e-9):.1f}x")
+        results.append((depth, scan_nodes, bitboard_nodes, scan_time, bitboard_time))
+    return results
+
+class BoardView:
+    # Canvas rendering of the board. Every square keeps the same canvas items all game (background,
+    # piece glyph, move target marker and arrow), created once and hidden when unused; render()
+    # compares the requested state with what is on screen and reconfigures only what changed.
+    # A move slides sprites across the board from root.after at a fixed frame rate, so the Tk
+    # mainloop keeps running (clocks, AI results) during the animation.
+    def __init__(self, root, canvas, square_size):
+        self.root = root
+        self.canvas = canvas
+        self.size = square_size
+        self.pieces = {}  # (row, col) -> text item
+        self.targets = {}  # (row, col) -> oval item marking a legal destination
+        self.arrows = {}  # (row, col) -> line item from the selected piece
+        for row in range(BOARD_SIZE):
+            for col in range(BOARD_SIZE):
+                x1, y1 = col * square_size, row * square_size
+                canvas.create_rectangle(x1, y1, x1 + square_size, y1 + square_size,
+                                        fill=SQUARE_COLORS[(row + col) % 2], outline='gray')
+        # Drawing order: squares, selection shadow, pieces, move hints, checkmate mark, sprites
+        self.shadow = canvas.create_oval(0, 0, 0, 0, fill="#888888", outline="", stipple="gray25",
+                                         state=tk.HIDDEN, tags="shadow")
+        for row in range(BOARD_SIZE):
+            for col in range(BOARD_SIZE):
+                x, y = self.center(row, col)
+                self.pieces[(row, col)] = canvas.create_text(x, y, text="", font=('Arial', square_size // 2),
+                                                             tags="piece")
+        for row in range(BOARD_SIZE):
+            for col in range(BOARD_SIZE):
+                x, y = self.center(row, col)
+                self.arrows[(row, col)] = canvas.create_line(x, y, x, y, fill="#00bfff", width=3, arrow=tk.LAST,
+                                                             dash=(4, 2), state=tk.HIDDEN, tags="move_line")
+                self.targets[(row, col)] = canvas.create_oval(x - 8, y - 8, x + 8, y + 8, outline="#00bfff", width=2,
+                                                              fill="", state=tk.HIDDEN, tags="move_line")
+        self.mate_mark = canvas.create_oval(0, 0, 0, 0, outline="red", width=3, state=tk.HIDDEN, tags="checkmate_mark")
+        self.sprites = [canvas.create_text(0, 0, text="", font=('Arial', square_size // 2), state=tk.HIDDEN)
+                        for _ in range(2)]  # a move slides at most two pieces (castling)
+        # What is on screen now, and what was asked for last
+        self.shown = {}  # (row, col) -> piece code
+        self.shown_selected = None
+        self.shown_targets = set()
+        self.shown_mate = None
+        self.state = (None, None, (), None)
+        self.hidden = set()  # destination squares left empty while a sprite is on its way there
+        self.slides = []  # (sprite, from (x, y), to (x, y))
+        self.frame = 0
+        self.animation = None  # after() id of the next frame
+
+    def center(self, row, col):
+        return col * self.size + self.size // 2, row * self.size + self.size // 2
+
+    def render(self, mailbox, selected=None, targets=(), mate=None):
+        # Bring the canvas in line with this state, touching only the items that differ.
+        # mailbox: the position's 64 integer piece codes
+        self.state = (mailbox, selected, targets, mate)
+        canvas = self.canvas
+        for square, item in self.pieces.items():
+            piece = EMPTY if square in self.hidden else mailbox[square[0] * BOARD_SIZE + square[1]]
+            if self.shown.get(square) != piece:
+                self.shown[square] = piece
+                if piece != EMPTY:
+                    canvas.itemconfig(item, text=PIECE_GLYPHS[piece], fill=PIECE_FILLS[piece])
+                else:
+                    canvas.itemconfig(item, text="")
+        targets = set(targets)
+        if selected != self.shown_selected:
+            for square in self.shown_targets:
+                canvas.itemconfig(self.targets[square], state=tk.HIDDEN)
+                canvas.itemconfig(self.arrows[square], state=tk.HIDDEN)
+            self.shown_targets = set()
+            if selected:
+                x, y = self.center(*selected)
+                r = self.size // 2 - 4
+                canvas.coords(self.shadow, x - r, y - r, x + r, y + r)
+                canvas.itemconfig(self.shadow, state=tk.NORMAL)
             else:
-                new_en_passant = None
-            if code == 'wK':
-                new_castling['wK'] = False
-                new_castling['wQ'] = False
-            if code == 'bK':
-                new_castling['bK'] = False
-                new_castling['bQ'] = False
-            if code == 'wR':
-                if r1 == 7 and c1 == 0:
-                    new_castling['wQ'] = False
-                if r1 == 7 and c1 == 7:
-                    new_castling['wK'] = False
-            if code == 'bR':
-                if r1 == 0 and c1 == 0:
-                    new_castling['bQ'] = False
-                if r1 == 0 and c1 == 7:
-                    new_castling['bK'] = False
-            if kind == 'K' and abs(c2 - c1) == 2:
-                row = r1
-                if c2 == 6:  # kingside
-                    new_board[row][4] = None
-                    new_board[row][6] = code
-                    new_board[row][7] = None
-                    new_board[row][5] = code[0] + 'R'
-                else:  # queenside
-                    new_board[row][4] = None
-                    new_board[row][2] = code
-                    new_board[row][0] = None
-                    new_board[row][3] = code[0] + 'R'
+                canvas.itemconfig(self.shadow, state=tk.HIDDEN)
+            self.shown_selected = selected
+        for square in self.shown_targets - targets:
+            canvas.itemconfig(self.targets[square], state=tk.HIDDEN)
+            canvas.itemconfig(self.arrows[square], state=tk.HIDDEN)
+        for square in targets - self.shown_targets:
+            canvas.coords(self.arrows[square], *self.center(*selected), *self.center(*square))
+            canvas.itemconfig(self.arrows[square], state=tk.NORMAL)
+            canvas.itemconfig(self.targets[square], state=tk.NORMAL)
+        self.shown_targets = targets
+        if mate != self.shown_mate:
+            if mate:
+                x, y = self.center(*mate)
+                r = self.size // 2 - 4
+                canvas.coords(self.mate_mark, x - r, y - r, x + r, y + r)
+                canvas.itemconfig(self.mate_mark, state=tk.NORMAL)
             else:
-                if kind == 'P' and (r2, c2) == en_passant_target and not new_board[r2][c2]:
-                    if code[0] == 'w':
-                        captured_row = r2 + 1
-                    else:
-                        captured_row = r2 - 1
-                    new_board[captured_row][c2] = None
-                new_board[r2][c2] = code
-                new_board[r1][c1] = None
-                if kind == 'P' and (r2 == 0 or r2 == 7):
-                    new_board[r2][c2] = code[0] + 'Q'
-            eval_score, _ = minimax(game, new_board, new_en_passant, new_castling, depth-1, alpha, beta, True, 'b' if color == 'w' else 'w', orig_color)
-            if eval_score < min_eval:
-                min_eval = eval_score
-                best_move = move
-            beta = min(beta, eval_score)
-            if beta <= alpha:
-                break
-        return min_eval, best_move
+                canvas.itemconfig(self.mate_mark, state=tk.HIDDEN)
+            self.shown_mate = mate
+
+    def animate(self, moves):
+        # Slide pieces along [(from (row, col), to (row, col), piece), ...]; the board passed to render()
+        # already shows them on their destinations, which stay empty until the sprites arrive.
+        # A new move finishes the running animation at once.
+        self.finish()
+        frames = max(1, ANIMATION_MS // FRAME_MS)
+        for sprite, (start, end, piece) in zip(self.sprites, moves):
+            self.canvas.itemconfig(sprite, text=PIECE_GLYPHS[piece], fill=PIECE_FILLS[piece], state=tk.NORMAL)
+            self.canvas.coords(sprite, *self.center(*start))
+            self.canvas.tag_raise(sprite)
+            self.slides.append((sprite, self.center(*start), self.center(*end)))
+            self.hidden.add(end)
+        self.render(*self.state)
+        self.frame = 0
+        self.animation = self.root.after(FRAME_MS, self._step, frames)
+
+    def _step(self, frames):
+        self.frame += 1
+        if self.frame >= frames:
+            self.animation = None
+            self.finish()
+            return
+        t = self.frame / frames
+        for sprite, (x0, y0), (x1, y1) in self.slides:
+            self.canvas.coords(sprite, x0 + (x1 - x0) * t, y0 + (y1 - y0) * t)
+        self.animation = self.root.after(FRAME_MS, self._step, frames)
+
+    def finish(self):
+        # End the running animation: sprites away, pieces shown on their squares
+        if self.animation is not None:
+            self.root.after_cancel(self.animation)
+            self.animation = None
+        if self.slides or self.hidden:
+            for sprite, _, _ in self.slides:
+                self.canvas.itemconfig(sprite, state=tk.HIDDEN)
+            self.slides = []
+            self.hidden = set()
+            self.render(*self.state)
+
+class AIWorker:
+    # Runs the computer's searches on a background thread, one at a time. Every job gets its own
+    # cancellation token (a threading.Event the search polls), and its results come back through a
+    # queue that the GUI polls with root.after, so the thread never touches Tk.
+    def __init__(self):
+        self.results = queue.Queue()
+        self.thread = None
+        self.token = None  # threading.Event of the current job
+        self.serial = 0  # tags messages; those of cancelled jobs are dropped by poll()
+        self.kind = None  # "search" or "ponder"
+
+    def start(self, kind, job):
+        # job(stop, post) runs on the worker thread; post(*message) sends a message to the GUI
+        self.cancel()
+        previous = self.thread
+        serial = self.serial
+        stop = threading.Event()
+        self.token = stop
+        self.kind = kind
+
+        def post(*message):
+            self.results.put((serial,) + message)
+
+        def run():
+            if previous is not None:
+                previous.join()  # a cancelled search stops within 1024 nodes; the table is not shared meanwhile
+            if not stop.is_set():
+                job(stop, post)
+
+        self.thread = threading.Thread(target=run, daemon=True)
+        self.thread.start()
+
+    def cancel(self):
+        # Stop the current job; anything it already posted is ignored
+        if self.token is not None:
+            self.token.set()
+            self.token = None
+        self.kind = None
+        self.serial += 1
+
+    def poll(self):
+        # (kind, ...) messages of the current job, without blocking
+        messages = []
+        while True:
+            try:
+                serial, *message = self.results.get_nowait()
+            except queue.Empty:
+                return messages
+            if serial == self.serial:
+                messages.append(message)
+
+    def shutdown(self, timeout=1.0):
+        self.cancel()
+        if self.thread is not None:
+            self.thread.join(timeout)
 
 class ChessGame:
-    def __init__(self, root, player1, player2, time_minutes=DEFAULT_TIME_MINUTES):
+    def __init__(self, root, player1, player2, time_minutes=DEFAULT_TIME_MINUTES, hash_megabytes=16, increment_seconds=0,
+                 ai_workers=1, book=None, tablebases=None, fen=None, ponder=True):
         self.root = root
         self.player1 = player1
         self.player2 = player2
         self.players = [player1, player2]
         self.current_player_idx = 0  # 0: white, 1: black
         self.time_minutes = time_minutes
-        self.board = [row[:] for row in STARTING_POSITION]
-        self.piece_ids = {}
+        self.increment_seconds = increment_seconds  # added to a player's clock after each of their moves
+        # The bitboard position is the only game state: integer piece codes, castling bits, en passant
+        # square and clocks, shared by the board display, legal-move lookups and the AI
+        self.position = Position.from_fen(START_FEN)
         self.selected = None
+        self.checkmate_square = None
         self.square_size = 60
         self.canvas = tk.Canvas(root, width=BOARD_SIZE*self.square_size, height=BOARD_SIZE*self.square_size)
         self.canvas.pack()
-        self.create_chessboard()
-        self.show_starting_position()
+        self.view = BoardView(root, self.canvas, self.square_size)
+        self.view.render(self.position.mailbox)
         self.canvas.bind("<Button-1>", self.on_click)
         self.status_label = tk.Label(root, text=self.status_text())
         self.status_label.pack()
@@ -371,26 +418,50 @@ class ChessGame:
         self.timer_labels[0].pack()
         self.timer_labels[1].pack()
         self.game_over = False
-        self.castling_rights = {'wK': True, 'wQ': True, 'bK': True, 'bQ': True}
-        self.en_passant_target = None
-        self.halfmove_clock = 0
-        self.move_history = []
-        # For visual feedback
-        self.shadow_id = None
-        self.move_line_ids = []
+        self.move_history = []  # encoded moves played
+        self._legal_moves = None  # cached legal moves of self.position, cleared by make_move
+        # Game record for FEN/PGN export
+        self.start_fen = START_FEN
+        self.san_moves = []
+        self.result = '*'
+        self.pgn_path = None  # the game is saved here as PGN when it ends
         self.update_timer()
         # AI
         self.ai_thinking = False
-        self.ai_depth = 3  # Medium-difficult: 3 plies (can increase to 4 for more difficulty)
-
-        # Patch for AI: allow custom move validation for board copies
-        self._patch_custom_methods()
+        self.ai_depth = 64  # Upper bound only: the AI deepens one ply at a time until its share of the clock is used
+        self.table = TranspositionTable(hash_megabytes)  # kept between moves, entries age out
+        self.hash_megabytes = hash_megabytes
+        self.ai_workers = ai_workers  # more than 1: split root moves across worker processes
+        self.search_pool = None  # created on the computer's first move
+        self.book = book  # OpeningBook consulted before searching, or None
+        self.tablebases = tablebases  # Tablebases for exact endgame play and draw detection, or None
+        # Search statistics of the computer's last move
+        self.last_stats = None  # SearchStats
+        self.stats_label = None  # shown live while the computer thinks, see show_search_stats()
+        self.stats_json_path = None  # one JSON object per computer move is appended here
+        self.verbose = False  # print a line per computer move (book, tablebase, search depth, pondering)
+        # Background search: cancelled when no longer needed, pondering on the opponent's time
+        self.ai = AIWorker()
+        self.ponder = ponder and ai_workers == 1  # worker processes keep their own tables, pondering would not help them
+        self.ponder_move = None  # the reply the computer is pondering on
+        # Analysis panel (show_analysis): top lines of the position on display, and the game's moves to step through
+        self.analysis = AIWorker()  # its own thread and table, so it never holds up the computer's move
+        self.analysis_table = None
+        self.analysis_panel = None
+        self.analysis_lines = 3
+        self.browse_ply = None  # number of moves into the game shown on the board, None for the current position
+        self.browse_position = None
+        self.closed = False
+        self.root.protocol("WM_DELETE_WINDOW", self.close)
+        self.root.after(50, self.poll_ai)
+        if fen:
+            self.set_position(fen)
 
         # If computer is white, start AI move
         self.root.after(100, self.check_ai_move)
 
     def _patch_custom_methods(self):
-        # Add custom move validation for board copies (for AI)
+        # Move validation on board copies for the square-scan generator, only used by perft_compare()
         def is_valid_move_custom(board, en_passant_target, castling_rights, from_row, from_col, to_row, to_col):
             code = board[from_row][from_col]
             if not code:
@@ -516,7 +587,6 @@ class ChessGame:
             dr = to_row - from_row
             dc = to_col - from_col
             color = code[0]
-            opp_color = 'b' if color == 'w' else 'w'
             if kind == 'P':
                 direction = -1 if color == 'w' else 1
                 if abs(dc) == 1 and dr == direction:
@@ -550,43 +620,17 @@ class ChessGame:
         self.square_attacked_custom = square_attacked_custom
         self._attacks_square_custom = _attacks_square_custom
 
-    def create_chessboard(self):
-        for row in range(BOARD_SIZE):
-            for col in range(BOARD_SIZE):
-                color = SQUARE_COLORS[(row + col) % 2]
-                x1 = col * self.square_size
-                y1 = row * self.square_size
-                x2 = x1 + self.square_size
-                y2 = y1 + self.square_size
-                self.canvas.create_rectangle(x1, y1, x2, y2, fill=color, outline='gray')
-
-    def show_starting_position(self):
-        for row in range(BOARD_SIZE):
-            for col in range(BOARD_SIZE):
-                code = self.board[row][col]
-                if code:
-                    kind = code[1]
-                    color = 'white' if code[0] == 'w' else 'black'
-                    piece = PIECES[color][kind]
-                    piece_id = self.create_piece(piece, row, col, color)
-                    self.piece_ids[(row, col)] = piece_id
-
-    def create_piece(self, piece, row, col, color):
-        x = col * self.square_size + self.square_size // 2
-        y = row * self.square_size + self.square_size // 2
-        return self.canvas.create_text(
-            x, y, text=piece, font=('Arial', self.square_size//2), tags="piece", fill=PIECE_COLORS[color]
-        )
-
-    def move_piece(self, from_row, from_col, to_row, to_col):
-        piece_id = self.piece_ids.pop((from_row, from_col))
-        self.piece_ids[(to_row, to_col)] = piece_id
-        x = to_col * self.square_size + self.square_size // 2
-        y = to_row * self.square_size + self.square_size // 2
-        self.canvas.coords(piece_id, x, y)
-        # Remove captured piece
-        if (to_row, to_col) in self.piece_ids and (from_row, from_col) != (to_row, to_col):
-            self.canvas.delete(self.piece_ids[(to_row, to_col)])
+    def redraw(self, moves=None):
+        # Show the board, the selected piece and its legal targets (from the cached move list);
+        # moves: [(from, to, code), ...] to slide into place
+        if self.browse_ply is not None:
+            self.view.finish()
+            self.view.render(self.browse_position.mailbox)
+            return
+        targets = self.get_legal_moves(*self.selected) if self.selected else ()
+        self.view.render(self.position.mailbox, self.selected, targets, self.checkmate_square)
+        if moves:
+            self.view.animate(moves)
 
     def on_click(self, event):
         if self.game_over:
@@ -594,382 +638,132 @@ class ChessGame:
         # If it's computer's turn, ignore clicks
         if self.players[self.current_player_idx].is_computer:
             return
+        if self.browse_ply is not None:
+            self.browse_to(len(self.move_history))  # back to the game before playing on
+            return
         col = event.x // self.square_size
         row = event.y // self.square_size
-        # Remove previous visual feedback
-        self.clear_shadow_and_lines()
         if self.selected:
             from_row, from_col = self.selected
+            self.selected = None
             if (from_row, from_col) == (row, col):
-                self.selected = None
+                self.redraw()
                 return
             if self.is_valid_move(from_row, from_col, row, col):
                 self.make_move(from_row, from_col, row, col)
-                self.selected = None
                 self.next_turn()
                 self.root.after(100, self.check_ai_move)
             else:
+                self.redraw()
                 messagebox.showinfo("Invalid Move", "That move is not allowed.")
-                self.selected = None
         else:
-            code = self.board[row][col]
-            if code and ((self.current_player_idx == 0 and code[0] == 'w') or (self.current_player_idx == 1 and code[0] == 'b')):
+            piece = self.position.mailbox[row * BOARD_SIZE + col]
+            if piece != EMPTY and piece // 6 == self.current_player_idx:
+                # Shadow under the piece and arrows to its legal targets
                 self.selected = (row, col)
-                # Draw shadow and move lines
-                self.draw_shadow(row, col)
-                self.draw_move_lines(row, col)
-
-    def draw_shadow(self, row, col):
-        # Draw a semi-transparent oval under the selected piece
-        x = col * self.square_size + self.square_size // 2
-        y = row * self.square_size + self.square_size // 2
-        r = self.square_size // 2 - 4
-        # Use stipple for shadow effect
-        self.shadow_id = self.canvas.create_oval(
-            x - r, y - r, x + r, y + r,
-            fill="#888888", outline="", stipple="gray25", tags="shadow"
-        )
-        # Raise the piece above the shadow
-        if (row, col) in self.piece_ids:
-            self.canvas.tag_raise(self.piece_ids[(row, col)])
-
-    def draw_move_lines(self, from_row, from_col):
-        # Draw lines from the selected piece to all legal destination squares
-        legal_moves = self.get_legal_moves(from_row, from_col)
-        x0 = from_col * self.square_size + self.square_size // 2
-        y0 = from_row * self.square_size + self.square_size // 2
-        for to_row, to_col in legal_moves:
-            x1 = to_col * self.square_size + self.square_size // 2
-            y1 = to_row * self.square_size + self.square_size // 2
-            line_id = self.canvas.create_line(
-                x0, y0, x1, y1,
-                fill="#00bfff", width=3, arrow=tk.LAST, dash=(4, 2), tags="move_line"
-            )
-            self.move_line_ids.append(line_id)
-            # Optionally, draw a small circle at the destination
-            r = 8
-            circ_id = self.canvas.create_oval(
-                x1 - r, y1 - r, x1 + r, y1 + r,
-                outline="#00bfff", width=2, fill="", tags="move_line"
-            )
-            self.move_line_ids.append(circ_id)
-
-    def clear_shadow_and_lines(self):
-        if self.shadow_id:
-            self.canvas.delete(self.shadow_id)
-            self.shadow_id = None
-        for lid in self.move_line_ids:
-            self.canvas.delete(lid)
-        self.move_line_ids = []
+                self.redraw()
+
+    def set_position(self, fen):
+        # Set the board up from a FEN string; the move record starts again from there
+        self.ai.cancel()
+        self.ponder_move = None
+        position = Position.from_fen(fen)
+        self.position = position
+        self.current_player_idx = position.side
+        self._legal_moves = None
+        self.move_history = []
+        self.start_fen = position.fen()
+        self.san_moves = []
+        self.result = '*'
+        self.game_over = False
+        self.selected = None
+        self.checkmate_square = None
+        self.view.finish()
+        self.browse_ply = self.browse_position = None
+        self.redraw()
+        self.status_label.config(text=self.status_text())
+        self.update_analysis()
+
+    def fen(self):
+        return self.position.fen()
+
+    def export_pgn(self):
+        headers = default_headers(self.player1.name, self.player2.name, self.result, start_fen=self.start_fen)
+        return format_pgn(headers, self.san_moves, self.result, self.start_fen)
+
+    def load_pgn(self, text):
+        # Replay the first game of a PGN string on the board (from its FEN tag if it has one)
+        games = parse_pgn(text)
+        if not games:
+            raise ValueError("No game found in PGN")
+        game = games[0]
+        self.set_position(game.start_fen)
+        for san in game.moves:
+            if self.game_over:
+                break
+            move = self.position.parse_san(san)
+            from_row, from_col, to_row, to_col = move_to_tuple(move)
+            self.make_move(from_row, from_col, to_row, to_col, move_promotion(move) or QUEEN)
+            if not self.game_over:
+                self.current_player_idx = 1 - self.current_player_idx
+        self.status_label.config(text=self.status_text())
+        return game
+
+    def legal_moves(self):
+        # All legal moves of the side to move, generated once per position and shared by the move
+        # highlighting, click validation, checkmate/stalemate detection and the AI's root
+        if self._legal_moves is None:
+            self._legal_moves = self.position.legal_moves()
+        return self._legal_moves
 
     def get_legal_moves(self, from_row, from_col):
         # Return a list of (to_row, to_col) for all legal moves for the piece at (from_row, from_col)
-        code = self.board[from_row][from_col]
-        if not code:
+        if self.position.mailbox[from_row * BOARD_SIZE + from_col] == EMPTY:
             return []
-        color = code[0]
-        opp_color = 'b' if color == 'w' else 'w'
+        from_sq = from_row * BOARD_SIZE + from_col
         moves = []
-        for to_row in range(BOARD_SIZE):
-            for to_col in range(BOARD_SIZE):
-                if self.is_valid_move(from_row, from_col, to_row, to_col):
-                    # Simulate move to check for king safety
-                    backup = [row[:] for row in self.board]
-                    move_code = self.board[from_row][from_col]
-                    move_target = self.board[to_row][to_col]
-                    self.board[to_row][to_col] = move_code
-                    self.board[from_row][from_col] = None
-                    king_pos = None
-                    for r in range(BOARD_SIZE):
-                        for c in range(BOARD_SIZE):
-                            if self.board[r][c] == color + 'K':
-                                king_pos = (r, c)
-                    if move_code[1] == 'K':
-                        king_pos = (to_row, to_col)
-                    in_check = self.square_attacked(king_pos[0], king_pos[1], opp_color)
-                    self.board = [row[:] for row in backup]
-                    if not in_check:
-                        moves.append((to_row, to_col))
+        for move in self.legal_moves():
+            if move_from(move) == from_sq and move_promotion(move) in (0, QUEEN):
+                moves.append(move_to_tuple(move)[2:])
         return moves
 
     def is_valid_move(self, from_row, from_col, to_row, to_col):
-        code = self.board[from_row][from_col]
-        if not code:
-            return False
-        if (from_row, from_col) == (to_row, to_col):
-            return False
-        target = self.board[to_row][to_col]
-        if target and target[0] == code[0]:
-            return False
-        kind = code[1]
-        dr = to_row - from_row
-        dc = to_col - from_col
-        color = code[0]
-        opp_color = 'b' if color == 'w' else 'w'
-
-        # Pawn moves
-        if kind == 'P':
-            direction = -1 if color == 'w' else 1
-            start_row = 6 if color == 'w' else 1
-            # Normal move
-            if dc == 0 and dr == direction and not target:
-                return True
-            # Double move from start
-            if dc == 0 and dr == 2*direction and from_row == start_row and not target and not self.board[from_row+direction][from_col]:
-                return True
-            # Capture
-            if abs(dc) == 1 and dr == direction and target and target[0] == opp_color:
-                return True
-            # En passant
-            if abs(dc) == 1 and dr == direction and not target and self.en_passant_target == (to_row, to_col):
-                return True
-            return False
-        # Knight moves
-        elif kind == 'N':
-            if (abs(dr), abs(dc)) in [(2, 1), (1, 2)]:
-                return True
-            return False
-        # Bishop moves
-        elif kind == 'B':
-            if abs(dr) == abs(dc) and self.clear_path(from_row, from_col, to_row, to_col):
-                return True
-            return False
-        # Rook moves
-        elif kind == 'R':
-            if (dr == 0 or dc == 0) and self.clear_path(from_row, from_col, to_row, to_col):
-                return True
-            return False
-        # Queen moves
-        elif kind == 'Q':
-            if ((dr == 0 or dc == 0) or abs(dr) == abs(dc)) and self.clear_path(from_row, from_col, to_row, to_col):
-                return True
-            return False
-        # King moves
-        elif kind == 'K':
-            if max(abs(dr), abs(dc)) == 1:
-                # Normal king move
-                if not self.square_attacked(to_row, to_col, opp_color):
-                    return True
-                return False
-            # Castling
-            if from_row == to_row and abs(dc) == 2:
-                if self.can_castle(color, dc > 0):
-                    return True
-            return False
-        return False
-
-    def clear_path(self, from_row, from_col, to_row, to_col):
-        dr = to_row - from_row
-        dc = to_col - from_col
-        step_r = (dr > 0) - (dr < 0)
-        step_c = (dc > 0) - (dc < 0)
-        r, c = from_row + step_r, from_col + step_c
-        while (r, c) != (to_row, to_col):
-            if self.board[r][c]:
-                return False
-            r += step_r
-            c += step_c
-        return True
-
-    def can_castle(self, color, kingside):
-        row = 7 if color == 'w' else 0
-        if kingside:
-            if not self.castling_rights[color + 'K']:
-                return False
-            if self.board[row][5] or self.board[row][6]:
-                return False
-            if self.square_attacked(row, 4, 'b' if color == 'w' else 'w') or \
-               self.square_attacked(row, 5, 'b' if color == 'w' else 'w') or \
-               self.square_attacked(row, 6, 'b' if color == 'w' else 'w'):
-                return False
-            rook = self.board[row][7]
-            if rook != color + 'R':
-                return False
-            return True
-        else:
-            if not self.castling_rights[color + 'Q']:
-                return False
-            if self.board[row][1] or self.board[row][2] or self.board[row][3]:
-                return False
-            if self.square_attacked(row, 4, 'b' if color == 'w' else 'w') or \
-               self.square_attacked(row, 3, 'b' if color == 'w' else 'w') or \
-               self.square_attacked(row, 2, 'b' if color == 'w' else 'w'):
-                return False
-            rook = self.board[row][0]
-            if rook != color + 'R':
-                return False
-            return True
-
-    def square_attacked(self, row, col, by_color):
-        for r in range(BOARD_SIZE):
-            for c in range(BOARD_SIZE):
-                code = self.board[r][c]
-                if code and code[0] == by_color:
-                    if self._attacks_square(r, c, row, col):
-                        return True
-        return False
-
-    def _attacks_square(self, from_row, from_col, to_row, to_col):
-        code = self.board[from_row][from_col]
-        if not code:
-            return False
-        kind = code[1]
-        dr = to_row - from_row
-        dc = to_col - from_col
-        color = code[0]
-        opp_color = 'b' if color == 'w' else 'w'
-        if kind == 'P':
-            direction = -1 if color == 'w' else 1
-            if abs(dc) == 1 and dr == direction:
-                return True
-            return False
-        elif kind == 'N':
-            if (abs(dr), abs(dc)) in [(2, 1), (1, 2)]:
-                return True
-            return False
-        elif kind == 'B':
-            if abs(dr) == abs(dc) and self.clear_path(from_row, from_col, to_row, to_col):
-                return True
-            return False
-        elif kind == 'R':
-            if (dr == 0 or dc == 0) and self.clear_path(from_row, from_col, to_row, to_col):
-                return True
-            return False
-        elif kind == 'Q':
-            if ((dr == 0 or dc == 0) or abs(dr) == abs(dc)) and self.clear_path(from_row, from_col, to_row, to_col):
-                return True
-            return False
-        elif kind == 'K':
-            if max(abs(dr), abs(dc)) == 1:
-                return True
-            return False
-        return False
-
-    def make_move(self, from_row, from_col, to_row, to_col):
-        code = self.board[from_row][from_col]
-        target = self.board[to_row][to_col]
-        color = code[0]
-        opp_color = 'b' if color == 'w' else 'w'
-        kind = code[1]
-        move = (from_row, from_col, to_row, to_col, code, target, self.en_passant_target, dict(self.castling_rights), self.halfmove_clock)
+        return (to_row, to_col) in self.get_legal_moves(from_row, from_col)
+
+    def make_move(self, from_row, from_col, to_row, to_col, promotion=QUEEN):
+        # Play a legal move: the position updates castling rights, en passant and the clocks itself
+        move = self.position.find_move(from_row, from_col, to_row, to_col, promotion)
+        mailbox = self.position.mailbox
+        slides = [((from_row, from_col), (to_row, to_col), mailbox[move_from(move)])]
+        if move & FLAG_CASTLE:
+            rook_from, rook_to = (7, 5) if to_col > from_col else (0, 3)
+            slides.append(((from_row, rook_from), (from_row, rook_to), mailbox[from_row * BOARD_SIZE + rook_from]))
         self.move_history.append(move)
-        self.halfmove_clock = 0 if (kind == 'P' or target) else self.halfmove_clock + 1
-
-        # Castling
-        if kind == 'K' and abs(to_col - from_col) == 2:
-            row = from_row
-            if to_col == 6:  # kingside
-                self.board[row][4] = None
-                self.board[row][6] = color + 'K'
-                self.board[row][7] = None
-                self.board[row][5] = color + 'R'
-                king_id = self.piece_ids.pop((row, 4))
-                rook_id = self.piece_ids.pop((row, 7))
-                self.piece_ids[(row, 6)] = king_id
-                self.piece_ids[(row, 5)] = rook_id
-                self.canvas.coords(king_id, 6 * self.square_size + self.square_size // 2, row * self.square_size + self.square_size // 2)
-                self.canvas.coords(rook_id, 5 * self.square_size + self.square_size // 2, row * self.square_size + self.square_size // 2)
-            else:  # queenside
-                self.board[row][4] = None
-                self.board[row][2] = color + 'K'
-                self.board[row][0] = None
-                self.board[row][3] = color + 'R'
-                king_id = self.piece_ids.pop((row, 4))
-                rook_id = self.piece_ids.pop((row, 0))
-                self.piece_ids[(row, 2)] = king_id
-                self.piece_ids[(row, 3)] = rook_id
-                self.canvas.coords(king_id, 2 * self.square_size + self.square_size // 2, row * self.square_size + self.square_size // 2)
-                self.canvas.coords(rook_id, 3 * self.square_size + self.square_size // 2, row * self.square_size + self.square_size // 2)
-            self.castling_rights[color + 'K'] = False
-            self.castling_rights[color + 'Q'] = False
-            self.en_passant_target = None
-            self.clear_shadow_and_lines()
-            return
-
-        # En passant
-        if kind == 'P' and (to_row, to_col) == self.en_passant_target:
-            if color == 'w':
-                captured_row = to_row + 1
-            else:
-                captured_row = to_row - 1
-            self.board[captured_row][to_col] = None
-            if (captured_row, to_col) in self.piece_ids:
-                self.canvas.delete(self.piece_ids[(captured_row, to_col)])
-                del self.piece_ids[(captured_row, to_col)]
-
-        # Update castling rights
-        if code == 'wK':
-            self.castling_rights['wK'] = False
-            self.castling_rights['wQ'] = False
-        if code == 'bK':
-            self.castling_rights['bK'] = False
-            self.castling_rights['bQ'] = False
-        if code == 'wR':
-            if from_row == 7 and from_col == 0:
-                self.castling_rights['wQ'] = False
-            if from_row == 7 and from_col == 7:
-                self.castling_rights['wK'] = False
-        if code == 'bR':
-            if from_row == 0 and from_col == 0:
-                self.castling_rights['bQ'] = False
-            if from_row == 0 and from_col == 7:
-                self.castling_rights['bK'] = False
-
-        # Set en_passant target
-        if kind == 'P' and abs(to_row - from_row) == 2:
-            self.en_passant_target = ((from_row + to_row) // 2, from_col)
-        else:
-            self.en_passant_target = None
-
-        # Remove captured piece from canvas
-        if (to_row, to_col) in self.piece_ids:
-            self.canvas.delete(self.piece_ids[(to_row, to_col)])
-            del self.piece_ids[(to_row, to_col)]
-        # Move piece on canvas
-        piece_id = self.piece_ids.pop((from_row, from_col))
-        self.piece_ids[(to_row, to_col)] = piece_id
-        x = to_col * self.square_size + self.square_size // 2
-        y = to_row * self.square_size + self.square_size // 2
-        self.canvas.coords(piece_id, x, y)
-        # Update board
-        self.board[to_row][to_col] = code
-        self.board[from_row][from_col] = None
-
-        # Pawn promotion (default: Queen)
-        if kind == 'P' and (to_row == 0 or to_row == 7):
-            color_name = 'white' if color == 'w' else 'black'
-            self.board[to_row][to_col] = color + 'Q'
-            self.canvas.itemconfig(piece_id, text=PIECES[color_name]['Q'], fill=PIECE_COLORS[color_name])
-
-        self.clear_shadow_and_lines()
+        self.san_moves.append(self.position.san(move))
+        self.position.make_move(move)
+        self._legal_moves = None
+        self.redraw(slides)
+        self.update_analysis()
 
         # Check for endgame
         if self.is_checkmate():
             self.mark_king_in_checkmate()
-            self.end_game(f"Checkmate! {self.players[self.current_player_idx].name} wins!")
+            self.end_game(f"Checkmate! {self.players[self.current_player_idx].name} wins!",
+                          '1-0' if self.current_player_idx == 0 else '0-1')
         elif self.is_stalemate():
-            self.end_game("Stalemate! Draw.")
+            self.end_game("Stalemate! Draw.", '1/2-1/2')
         elif self.is_draw():
-            self.end_game("Draw!")
+            self.end_game("Draw!", '1/2-1/2')
 
     def mark_king_in_checkmate(self):
-        # Draw a red circle around the checkmated king
-        color = 'w' if self.current_player_idx == 0 else 'b'
-        king_pos = None
-        for r in range(BOARD_SIZE):
-            for c in range(BOARD_SIZE):
-                if self.board[r][c] == color + 'K':
-                    king_pos = (r, c)
-        if king_pos and king_pos in self.piece_ids:
-            x = king_pos[1] * self.square_size + self.square_size // 2
-            y = king_pos[0] * self.square_size + self.square_size // 2
-            radius = self.square_size // 2 - 4
-            self.canvas.create_oval(
-                x - radius, y - radius, x + radius, y + radius,
-                outline="red", width=3, tags="checkmate_mark"
-            )
+        # Red circle around the checkmated king (the side to move in the position)
+        king = self.position.king_square(self.position.side)
+        if king >= 0:
+            self.checkmate_square = divmod(king, BOARD_SIZE)
+            self.redraw()
 
     def next_turn(self):
+        self.timers[self.current_player_idx] += self.increment_seconds
         self.current_player_idx = 1 - self.current_player_idx
         self.status_label.config(text=self.status_text())
 
@@ -987,95 +781,45 @@ class ChessGame:
         for i, label in enumerate(self.timer_labels):
             label.config(text=f"{self.players[i].name} Time: {self.format_time(self.timers[i])}")
         if self.timers[self.current_player_idx] <= 0:
-            self.end_game(f"Time out! {self.players[1 - self.current_player_idx].name} wins!")
+            self.end_game(f"Time out! {self.players[1 - self.current_player_idx].name} wins!",
+                          '0-1' if self.current_player_idx == 0 else '1-0')
             return
         self.root.after(1000, self.update_timer)
 
     def is_checkmate(self):
-        # Check if current player's king is in check and has no legal moves or protection
-        color = 'w' if self.current_player_idx == 0 else 'b'
-        opp_color = 'b' if color == 'w' else 'w'
-        king_pos = None
-        for r in range(BOARD_SIZE):
-            for c in range(BOARD_SIZE):
-                if self.board[r][c] == color + 'K':
-                    king_pos = (r, c)
-        if not king_pos:
-            return True  # King is missing (should not happen)
-        if not self.square_attacked(king_pos[0], king_pos[1], opp_color):
-            return False
-        # Check if any legal move exists for king or any piece to protect
-        for r in range(BOARD_SIZE):
-            for c in range(BOARD_SIZE):
-                code = self.board[r][c]
-                if code and code[0] == color:
-                    for rr in range(BOARD_SIZE):
-                        for cc in range(BOARD_SIZE):
-                            if self.is_valid_move(r, c, rr, cc):
-                                # Try move and see if king is still in check
-                                backup = [row[:] for row in self.board]
-                                move_code = self.board[r][c]
-                                move_target = self.board[rr][cc]
-                                self.board[rr][cc] = move_code
-                                self.board[r][c] = None
-                                king_pos2 = (rr, cc) if move_code[1] == 'K' else king_pos
-                                in_check = self.square_attacked(king_pos2[0], king_pos2[1], opp_color)
-                                self.board = [row[:] for row in backup]
-                                if not in_check:
-                                    return False
-        return True
+        # make_move has already been applied, so the side to move is the player who must answer it
+        return self.position.in_check() and not self.legal_moves()
 
     def is_stalemate(self):
         # Stalemate: not in check, but no legal moves
-        color = 'w' if self.current_player_idx == 0 else 'b'
-        opp_color = 'b' if color == 'w' else 'w'
-        king_pos = None
-        for r in range(BOARD_SIZE):
-            for c in range(BOARD_SIZE):
-                if self.board[r][c] == color + 'K':
-                    king_pos = (r, c)
-        if not king_pos:
-            return False
-        if self.square_attacked(king_pos[0], king_pos[1], opp_color):
-            return False
-        for r in range(BOARD_SIZE):
-            for c in range(BOARD_SIZE):
-                code = self.board[r][c]
-                if code and code[0] == color:
-                    for rr in range(BOARD_SIZE):
-                        for cc in range(BOARD_SIZE):
-                            if self.is_valid_move(r, c, rr, cc):
-                                # Try move and see if king is in check
-                                backup = [row[:] for row in self.board]
-                                move_code = self.board[r][c]
-                                move_target = self.board[rr][cc]
-                                self.board[rr][cc] = move_code
-                                self.board[r][c] = None
-                                king_pos2 = (rr, cc) if move_code[1] == 'K' else king_pos
-                                in_check = self.square_attacked(king_pos2[0], king_pos2[1], opp_color)
-                                self.board = [row[:] for row in backup]
-                                if not in_check:
-                                    return False
-        return True
+        return not self.position.in_check() and not self.legal_moves()
 
     def is_draw(self):
         # 50-move rule
-        if self.halfmove_clock >= 100:
+        if self.position.halfmove >= 100:
             return True
         # Insufficient material
-        pieces = []
-        for row in self.board:
-            for code in row:
-                if code:
-                    pieces.append(code[1])
-        if all(p in ('K', 'N', 'B') for p in pieces):
-            if pieces.count('N') <= 2 and pieces.count('B') <= 2:
+        pieces = [piece % 6 for piece in self.position.mailbox if piece != EMPTY]
+        if all(p in (KING, KNIGHT, BISHOP) for p in pieces):
+            # The tablebases know which minor-piece endings can still be won (e.g. K+B+N vs K)
+            result = self.tablebases.probe(self.position) if self.tablebases is not None else None
+            if result is not None:
+                if result[0] == 0:
+                    return True
+            elif pieces.count(KNIGHT) <= 2 and pieces.count(BISHOP) <= 2:
                 return True
-        # TODO: Threefold repetition (not implemented)
+        # Threefold repetition
+        if self.position.repetitions() >= 3:
+            return True
         return False
 
-    def end_game(self, message):
+    def end_game(self, message, result='*'):
         self.game_over = True
+        self.result = result
+        self.ai.cancel()
+        if self.pgn_path:
+            with open(self.pgn_path, 'w') as f:
+                f.write(self.export_pgn())
         messagebox.showinfo("Game Over", message)
         self.players[self.current_player_idx].score += 1
         self.players[0].games_played += 1
@@ -1085,6 +829,7 @@ class ChessGame:
         if self.game_over:
             return
         if self.players[self.current_player_idx].is_computer:
+            self.stop_pondering()
             self.ai_thinking = True
             self.status_label.config(text=f"{self.players[self.current_player_idx].name} (Computer) is thinking...")
             self.root.after(100, self.do_ai_move)
@@ -1092,28 +837,237 @@ class ChessGame:
             self.ai_thinking = False
 
     def do_ai_move(self):
-        # Run AI in a thread to avoid freezing GUI
-        def ai_thread():
-            # Use minimax with alpha-beta pruning
-            color = 'w' if self.current_player_idx == 0 else 'b'
-            # For difficulty, you can increase self.ai_depth
-            _, move = minimax(self, [row[:] for row in self.board], self.en_passant_target, dict(self.castling_rights), self.ai_depth, -float('inf'), float('inf'), True, color, color)
-            if move is None:
-                # No move (should be checkmate or stalemate)
+        # Book moves are played straight away, no search needed
+        if self.book is not None:
+            move = self.book.choose(self.position)
+            if move is not None:
+                self.log(f"AI book move {move_name(move)}")
+                self.root.after(100, lambda: self._do_ai_move_on_main_thread(move))
                 return
-            r1, c1, r2, c2 = move
-            # Make move on main thread
-            self.root.after(100, lambda: self._do_ai_move_on_main_thread(r1, c1, r2, c2))
-        threading.Thread(target=ai_thread, daemon=True).start()
+        # So are tablebase moves once few enough pieces are left
+        if self.tablebases is not None:
+            move = self.tablebases.best_move(self.position)
+            if move is not None:
+                self.log(f"AI tablebase move {move_name(move)}")
+                self.root.after(100, lambda: self._do_ai_move_on_main_thread(move))
+                return
+        # Search on the worker thread so the GUI stays responsive; the move comes back through poll_ai
+        root_moves = list(self.legal_moves())  # the AI's first ply reuses the game's move list
+        position = self.position.copy()  # private copy, the GUI's position is never touched from the thread
+        budget = allocate_time(self.timers[self.current_player_idx], self.increment_seconds)
+        if self.ai_workers > 1 and self.search_pool is None:
+            self.search_pool = create_search_pool(self.ai_workers, self.hash_megabytes,
+                                                  self.tablebases and self.tablebases.directory)
+
+        def job(stop, post):
+            # Iterative deepening with alpha-beta, budgeted from the computer's remaining clock
+            stats = SearchStats()
+            start = time.perf_counter()
+            if self.ai_workers > 1:
+                # Worker processes cannot see the token: a cancelled parallel search runs out its budget
+                # and its result is dropped
+                _, move, depth = parallel_search(self.search_pool, position, self.ai_depth, budget, self.ai_workers,
+                                                 root_moves, stats)
+                self.log(f"AI depth {depth} in {time.perf_counter() - start:.2f}s (budget {budget:.2f}s, {self.ai_workers} workers)")
+            else:
+                def on_iteration(depth, score, move, search):
+                    if self.stats_label is not None:
+                        stats.update(search)
+                        post("stats", stats.summary())
+
+                self.table.new_search()
+                _, move, depth = iterative_deepening(position, self.ai_depth, budget, self.table, root_moves,
+                                                     on_iteration, stop, self.tablebases, stats)
+                self.log(f"AI depth {depth} in {time.perf_counter() - start:.2f}s (budget {budget:.2f}s): {self.table.report()}")
+            if stop.is_set():
+                return  # cancelled: the game ended or the window closed
+            self.log(f"AI search: {stats.summary()}")
+            post("move", move, stats)
+
+        self.ai.start("search", job)
+
+    def start_pondering(self, stats):
+        # Search the position after the reply the computer expects (the second move of its principal
+        # variation) until the opponent moves. Results go into the shared table, so when the opponent
+        # plays the expected move the next search finds its deeper iterations ready.
+        if not self.ponder or self.game_over or len(stats.pv) < 2 or self.players[self.current_player_idx].is_computer:
+            return
+        position = self.position.copy()
+        try:
+            move = position.parse_move(stats.pv[1])
+        except ValueError:
+            return
+        if move not in position.legal_moves():
+            return
+        position.make_move(move)
+        self.ponder_move = move
 
-    def _do_ai_move_on_main_thread(self, r1, c1, r2, c2):
+        def job(stop, post):
+            ponder_stats = SearchStats()
+            self.table.new_search()
+            iterative_deepening(position, self.ai_depth, None, self.table, None, None, stop, self.tablebases,
+                                ponder_stats)
+            post("ponder", ponder_stats)
+
+        self.ai.start("ponder", job)
+
+    def stop_pondering(self):
+        # The opponent has moved: stop the ponder search and report whether it guessed the move
+        if self.ponder_move is None:
+            return
+        expected, self.ponder_move = self.ponder_move, None
+        if self.ai.kind == "ponder":
+            self.ai.cancel()
+        hit = bool(self.move_history) and self.move_history[-1] == expected
+        self.log(f"AI ponder {'hit' if hit else 'miss'} (expected {move_name(expected)})")
+
+    def poll_ai(self):
+        # Main thread: handle what the worker thread posted, then look again shortly
+        if self.closed:
+            return
+        for kind, *message in self.analysis.poll():
+            if kind == "analysis" and self.analysis_panel is not None:
+                self.analysis_text.config(text=message[0])
+        for kind, *message in self.ai.poll():
+            if kind == "stats" and self.stats_label is not None:
+                self.stats_label.config(text=message[0])
+            elif kind == "move":
+                move, stats = message
+                self.record_search_stats(stats)
+                if move is not None:  # None: no legal move (should be checkmate or stalemate)
+                    self._do_ai_move_on_main_thread(move)
+                    self.start_pondering(stats)
+            elif kind == "ponder":
+                self.log(f"AI ponder finished: {message[0].summary()}")
+        self.root.after(50, self.poll_ai)
+
+    def close(self):
+        # Window closed: stop the search threads and worker processes before Tk goes away
+        self.closed = True
+        self.ai.shutdown()
+        self.analysis.shutdown()
+        if self.search_pool is not None:
+            self.search_pool.shutdown(wait=False, cancel_futures=True)
+        self.root.destroy()
+
+    def show_analysis(self, lines=3):
+        # Side panel with the game's moves and the best `lines` moves of the position on the board,
+        # deepening in the background. Selecting a move in the list (or Left/Right) shows and analyses the
+        # position after it; the table is kept between positions, so stepping through a game stays quick.
+        if self.analysis_panel is not None:
+            return
+        self.analysis_lines = lines
+        self.analysis_table = TranspositionTable(self.hash_megabytes)
+        panel = tk.Frame(self.root)
+        panel.pack(side=tk.RIGHT, fill=tk.Y, before=self.canvas)
+        self.history_list = tk.Listbox(panel, height=14, width=28, exportselection=False)
+        self.history_list.pack(fill=tk.Y, expand=True)
+        self.history_list.bind("<<ListboxSelect>>", self.on_history_select)
+        self.analysis_text = tk.Label(panel, text="", font=("Courier", 9), justify=tk.LEFT, anchor="w", width=36)
+        self.analysis_text.pack(fill=tk.X)
+        self.root.bind("<Left>", lambda event: self.browse_step(-1))
+        self.root.bind("<Right>", lambda event: self.browse_step(1))
+        self.analysis_panel = panel
+        self.update_analysis()
+
+    def update_analysis(self):
+        # The game changed or another position was chosen: refresh the move list and restart the analysis
+        if self.analysis_panel is None:
+            return
+        self.history_list.delete(0, tk.END)
+        self.history_list.insert(tk.END, "start")
+        black_first = self.start_fen.split()[1] == "b"
+        for i, san in enumerate(self.san_moves):
+            number = (i + black_first) // 2 + 1
+            self.history_list.insert(tk.END, f"{number}. {san}" if (i + black_first) % 2 == 0 else f"{number}... {san}")
+        shown = len(self.move_history) if self.browse_ply is None else self.browse_ply
+        self.history_list.selection_clear(0, tk.END)
+        self.history_list.selection_set(shown)
+        self.history_list.see(shown)
+        position = (self.position if self.browse_ply is None else self.browse_position).copy()
+        count = self.analysis_lines
+        table = self.analysis_table
+
+        def job(stop, post):
+            def on_iteration(depth, lines, search):
+                post("analysis", f"depth {depth}, {search.nodes} nodes\n" + format_analysis(position, lines))
+
+            table.new_search()
+            multipv_search(position, MAX_PLY - 1, count, table, on_iteration, stop, self.tablebases)
+
+        self.analysis_text.config(text="thinking...")
+        self.analysis.start("analysis", job)
+
+    def on_history_select(self, event):
+        selection = self.history_list.curselection()
+        if selection:
+            self.browse_to(selection[0])
+
+    def browse_step(self, delta):
+        current = len(self.move_history) if self.browse_ply is None else self.browse_ply
+        self.browse_to(min(max(current + delta, 0), len(self.move_history)))
+
+    def browse_to(self, ply):
+        # Show the position after `ply` moves of the game; the last one is the live game again
+        if ply >= len(self.move_history):
+            self.browse_ply = self.browse_position = None
+        else:
+            position = Position.from_fen(self.start_fen)
+            for move in self.move_history[:ply]:
+                position.make_move(move)
+            self.browse_ply, self.browse_position = ply, position
+        self.selected = None
+        self.redraw()
+        self.update_analysis()
+
+    def show_search_stats(self):
+        # A label under the clocks with the computer's search counters, updated while it thinks
+        if self.stats_label is None:
+            self.stats_label = tk.Label(self.root, text="", font=("Courier", 9), justify=tk.LEFT, wraplength=480)
+            self.stats_label.pack()
+
+    def log(self, text):
+        # Engine reports go to stdout only when asked for; the stats label and --stats-json carry the numbers
+        if self.verbose:
+            print(text)
+
+    def record_search_stats(self, stats):
+        self.last_stats = stats
+        if self.stats_label is not None:
+            self.stats_label.config(text=stats.summary())
+        if self.stats_json_path:
+            record = {"ply": len(self.san_moves), "fen": self.position.fen(), **stats.to_dict()}
+            with open(self.stats_json_path, "a") as f:
+                f.write(json.dumps(record) + "\n")
+
+    def _do_ai_move_on_main_thread(self, move):
+        # The encoded move is passed on whole so the computer's underpromotions are kept
         if self.game_over:
             return
-        self.make_move(r1, c1, r2, c2)
+        r1, c1, r2, c2 = move_to_tuple(move)
+        self.make_move(r1, c1, r2, c2, move_promotion(move) or QUEEN)
         self.next_turn()
         self.ai_thinking = False
         self.root.after(100, self.check_ai_move)
 
+def format_analysis(position, lines):
+    # One text line per analysed move: score for White in pawns (or moves to mate) and the line in SAN
+    sign = 1 if position.side == WHITE else -1
+    text = []
+    for score, pv in lines:
+        if abs(score) > MATE_SCORE - 1000:
+            moves = (MATE_SCORE - abs(score) + 1) // 2
+            shown = f"#{moves}" if score * sign > 0 else f"#-{moves}"
+        else:
+            shown = f"{score * sign / 100:+.2f}"
+        line = position.copy()
+        san = []
+        for move in pv:
+            san.append(line.san(move))
+            line.make_move(move)
+        text.append(f"{shown:>7} {' '.join(san)}")
+    return "\n".join(text)
+
 def get_player_info(root, player_num):
     if player_num == 2:
         # Ask if player 2 is computer
@@ -1129,10 +1083,58 @@ def get_time_setting(root):
     return time or DEFAULT_TIME_MINUTES
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Chess game")
+    parser.add_argument("--perft-compare", type=int, metavar="DEPTH",
+                        help="compare node counts and speed of the scan and bitboard move generators, then exit")
+    parser.add_argument("--bench-ordering", type=int, metavar="DEPTH",
+                        help="report search node counts with and without move ordering on fixed positions, then exit")
+    parser.add_argument("--hash", type=float, default=16, metavar="MB",
+                        help="transposition table memory budget for the computer player, per process (default 16)")
+    parser.add_argument("--workers", type=int, default=1, metavar="N",
+                        help="worker processes for the computer's search, root moves are split between them (default 1)")
+    parser.add_argument("--increment", type=float, default=0, metavar="SECONDS",
+                        help="seconds added to a player's clock after each move (default 0)")
+    parser.add_argument("--book", default=DEFAULT_BOOK, metavar="PATH",
+                        help="opening book for the computer player (default chess_book.bin next to this script, "
+                             "build it with chess_book.py; pass '' for no book)")
+    parser.add_argument("--tablebases", default=DEFAULT_TABLEBASE_DIR, metavar="DIR",
+                        help="endgame tablebase directory, built with chess_tablebase.py (default tablebases/)")
+    parser.add_argument("--fen", metavar="FEN", help="start from this position instead of the initial one")
+    parser.add_argument("--load-pgn", metavar="FILE", help="replay the first game of a PGN file, then play on")
+    parser.add_argument("--save-pgn", metavar="FILE", help="write the game as PGN when it ends")
+    parser.add_argument("--no-ponder", action="store_true",
+                        help="do not let the computer think on its opponent's time")
+    parser.add_argument("--analysis", type=int, metavar="N",
+                        help="side panel with the best N moves of the position, and the game's moves to step through")
+    parser.add_argument("--show-stats", action="store_true",
+                        help="show the computer's search statistics (nodes, nps, cutoffs, TT hits, PV) while it thinks")
+    parser.add_argument("--verbose", action="store_true",
+                        help="print the computer's book, tablebase, search and pondering reports")
+    parser.add_argument("--stats-json", metavar="FILE",
+                        help="append the search statistics of every computer move to FILE, one JSON object per line")
+    args = parser.parse_args()
+    if args.perft_compare:
+        perft_compare(args.perft_compare)
+        raise SystemExit
+    if args.bench_ordering:
+        ordering_benchmark(args.bench_ordering)
+        raise SystemExit
     root = tk.Tk()
     root.title("Chess Game")
     player1 = get_player_info(root, 1)
     player2 = get_player_info(root, 2)
     time_minutes = get_time_setting(root)
-    game = ChessGame(root, player1, player2, time_minutes)
+    game = ChessGame(root, player1, player2, time_minutes, args.hash, args.increment, args.workers,
+                     open_book(args.book), Tablebases(args.tablebases) if args.tablebases else None, args.fen,
+                     not args.no_ponder)
+    if args.load_pgn:
+        with open(args.load_pgn) as f:
+            game.load_pgn(f.read())
+    game.pgn_path = args.save_pgn
+    game.stats_json_path = args.stats_json
+    game.verbose = args.verbose
+    if args.show_stats:
+        game.show_search_stats()
+    if args.analysis:
+        game.show_analysis(args.analysis)
     root.mainloop()
\ No newline at end of file
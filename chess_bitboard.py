@@ -0,0 +1,965 @@
+## **BITBOARD POSITION AND MOVE GENERATOR**
+## Used by the chess AI (chess.py) instead of scanning every from/to square pair.
+## 1- Squares are numbered like the GUI board: square = row * 8 + col, so a8 = 0 and h1 = 63.
+## 2- A position keeps one 64-bit integer per piece (12 bitboards) plus occupancy per side.
+## 3- Knight, king and pawn attacks come from precomputed tables; sliding pieces use ray tables
+##    cut at the first blocker.
+## 4- Moves are packed into a single int: from | to << 6 | promotion << 12 | flags.
+## 5- make_move/unmake_move update one shared position in place; the state a move destroys
+##    (captured piece, castling rights, en passant square, halfmove clock) goes on an undo stack.
+## 6- Every position carries a Zobrist key that make_move updates incrementally.
+## 7- Material plus piece-square score is kept as a running total (white minus black) from
+##    per-piece flattened tables, so evaluating a leaf is a single attribute read.
+## 8- Each position caches an attack map (enemy-attacked squares, checkers, pinned pieces) the first
+##    time it is asked for; legal moves, check and castling tests read it instead of making every move.
+## 9- A key -> count table of every position reached so far (kept in step by make/unmake) answers
+##    repetition questions in O(1), both for the game's threefold rule and inside the search.
+## 10- `python chess_bitboard.py --suite` runs perft on the standard test positions (castling,
+##    en passant, promotions) against known node counts; `--fen ... --depth N --divide` for one position.
+
+import sys
+import time
+import argparse
+import random
+import re
+
+BOARD_SIZE = 8
+FULL = (1 << 64) - 1
+
+WHITE, BLACK = 0, 1
+COLOR_CODES = ('w', 'b')
+
+# Piece types, a piece is color * 6 + type
+PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING = range(6)
+PIECE_TYPES = 'PNBRQK'
+EMPTY = -1
+
+PIECE_CODES = ['wP', 'wN', 'wB', 'wR', 'wQ', 'wK', 'bP', 'bN', 'bB', 'bR', 'bQ', 'bK']
+CODE_TO_PIECE = {code: i for i, code in enumerate(PIECE_CODES)}
+
+# Castling rights bitmask
+CASTLE_WK, CASTLE_WQ, CASTLE_BK, CASTLE_BQ = 1, 2, 4, 8
+CASTLING_KEYS = (('wK', CASTLE_WK), ('wQ', CASTLE_WQ), ('bK', CASTLE_BK), ('bQ', CASTLE_BQ))
+
+START_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+
+# Standard algebraic notation: piece, origin file/rank, capture, destination, promotion
+SAN_RE = re.compile(r'^([NBRQK])?([a-h])?([1-8])?x?([a-h][1-8])(?:=?([NBRQ]))?$')
+
+# Move flags
+FLAG_EP = 1 << 15
+FLAG_CASTLE = 1 << 16
+FLAG_DOUBLE = 1 << 17
+
+
+def encode_move(from_sq, to_sq, promotion=0, flags=0):
+    return from_sq | (to_sq << 6) | (promotion << 12) | flags
+
+
+def move_from(move):
+    return move & 63
+
+
+def move_to(move):
+    return (move >> 6) & 63
+
+
+def move_promotion(move):
+    return (move >> 12) & 7
+
+
+def move_to_tuple(move):
+    # (from_row, from_col, to_row, to_col) as used by the GUI
+    f = move & 63
+    t = (move >> 6) & 63
+    return (f >> 3, f & 7, t >> 3, t & 7)
+
+
+def square_name(sq):
+    return 'abcdefgh'[sq & 7] + str(8 - (sq >> 3))
+
+
+def move_name(move):
+    # Long algebraic notation, e.g. e2e4 or e7e8q
+    promo = move_promotion(move)
+    text = square_name(move & 63) + square_name((move >> 6) & 63)
+    if promo:
+        text += PIECE_TYPES[promo].lower()
+    return text
+
+
+# --- Zobrist keys ---
+
+_zobrist_rng = random.Random(20240601)  # fixed seed: keys must not change between runs
+ZOBRIST_PIECE = [[_zobrist_rng.getrandbits(64) for _ in range(64)] for _ in range(12)]
+ZOBRIST_CASTLING = [_zobrist_rng.getrandbits(64) for _ in range(16)]
+ZOBRIST_EP = [_zobrist_rng.getrandbits(64) for _ in range(8)]  # by file
+ZOBRIST_SIDE = _zobrist_rng.getrandbits(64)  # xored in when black is to move
+
+
+# --- Evaluation tables ---
+
+# PSQ[piece][square] = material + piece-square value for that piece, black tables already mirrored.
+# Filled by set_evaluation_tables (chess.py passes its PIECE_VALUES and PIECE_SQUARE_TABLES).
+PSQ = [[0] * 64 for _ in range(12)]
+
+
+def set_evaluation_tables(piece_values, piece_square_tables):
+    # Tables are updated in place; create positions after calling this so their running scores match
+    for piece, code in enumerate(PIECE_CODES):
+        kind = code[1]
+        value = piece_values.get(kind, 0)
+        pst = piece_square_tables.get(kind, [[0] * 8] * 8)
+        row = PSQ[piece]
+        for sq in range(64):
+            r, c = sq >> 3, sq & 7
+            row[sq] = value + (pst[r][c] if code[0] == 'w' else pst[7 - r][c])
+
+
+# --- Attack tables ---
+
+def _leaper_table(offsets):
+    table = []
+    for sq in range(64):
+        r, c = sq >> 3, sq & 7
+        bb = 0
+        for dr, dc in offsets:
+            rr, cc = r + dr, c + dc
+            if 0 <= rr < 8 and 0 <= cc < 8:
+                bb |= 1 << (rr * 8 + cc)
+        table.append(bb)
+    return table
+
+
+KNIGHT_ATTACKS = _leaper_table([(2, 1), (1, 2), (-1, 2), (-2, 1), (-2, -1), (-1, -2), (1, -2), (2, -1)])
+KING_ATTACKS = _leaper_table([(1, 0), (1, 1), (0, 1), (-1, 1), (-1, 0), (-1, -1), (0, -1), (1, -1)])
+# White pawns move towards row 0, black pawns towards row 7
+PAWN_ATTACKS = [
+    _leaper_table([(-1, -1), (-1, 1)]),
+    _leaper_table([(1, -1), (1, 1)]),
+]
+
+
+def _ray_table(dr, dc):
+    table = []
+    for sq in range(64):
+        r, c = sq >> 3, sq & 7
+        bb = 0
+        rr, cc = r + dr, c + dc
+        while 0 <= rr < 8 and 0 <= cc < 8:
+            bb |= 1 << (rr * 8 + cc)
+            rr += dr
+            cc += dc
+        table.append(bb)
+    return table
+
+
+# Rays towards higher square numbers are cut at their lowest blocker, the others at their highest
+RAY_S = _ray_table(1, 0)
+RAY_E = _ray_table(0, 1)
+RAY_SE = _ray_table(1, 1)
+RAY_SW = _ray_table(1, -1)
+RAY_N = _ray_table(-1, 0)
+RAY_W = _ray_table(0, -1)
+RAY_NE = _ray_table(-1, 1)
+RAY_NW = _ray_table(-1, -1)
+
+
+def rook_attacks(sq, occ):
+    attacks = 0
+    ray = RAY_S[sq]
+    blockers = ray & occ
+    if blockers:
+        ray ^= RAY_S[(blockers & -blockers).bit_length() - 1]
+    attacks |= ray
+    ray = RAY_E[sq]
+    blockers = ray & occ
+    if blockers:
+        ray ^= RAY_E[(blockers & -blockers).bit_length() - 1]
+    attacks |= ray
+    ray = RAY_N[sq]
+    blockers = ray & occ
+    if blockers:
+        ray ^= RAY_N[blockers.bit_length() - 1]
+    attacks |= ray
+    ray = RAY_W[sq]
+    blockers = ray & occ
+    if blockers:
+        ray ^= RAY_W[blockers.bit_length() - 1]
+    return attacks | ray
+
+
+def bishop_attacks(sq, occ):
+    attacks = 0
+    ray = RAY_SE[sq]
+    blockers = ray & occ
+    if blockers:
+        ray ^= RAY_SE[(blockers & -blockers).bit_length() - 1]
+    attacks |= ray
+    ray = RAY_SW[sq]
+    blockers = ray & occ
+    if blockers:
+        ray ^= RAY_SW[(blockers & -blockers).bit_length() - 1]
+    attacks |= ray
+    ray = RAY_NE[sq]
+    blockers = ray & occ
+    if blockers:
+        ray ^= RAY_NE[blockers.bit_length() - 1]
+    attacks |= ray
+    ray = RAY_NW[sq]
+    blockers = ray & occ
+    if blockers:
+        ray ^= RAY_NW[blockers.bit_length() - 1]
+    return attacks | ray
+
+
+def iter_bits(bb):
+    while bb:
+        lsb = bb & -bb
+        yield lsb.bit_length() - 1
+        bb ^= lsb
+
+
+ROW_MASKS = [0xFF << (8 * r) for r in range(8)]
+NOT_FILE_A = FULL ^ sum(1 << (r * 8) for r in range(8))
+NOT_FILE_H = FULL ^ sum(1 << (r * 8 + 7) for r in range(8))
+
+
+def _line_tables():
+    # BETWEEN[a][b]: squares strictly between a and b; LINE[a][b]: the whole line through both (0 if not aligned)
+    between = [[0] * 64 for _ in range(64)]
+    line = [[0] * 64 for _ in range(64)]
+    for ray, opposite in ((RAY_N, RAY_S), (RAY_S, RAY_N), (RAY_E, RAY_W), (RAY_W, RAY_E),
+                          (RAY_NE, RAY_SW), (RAY_SW, RAY_NE), (RAY_NW, RAY_SE), (RAY_SE, RAY_NW)):
+        for a in range(64):
+            full_line = ray[a] | opposite[a] | (1 << a)
+            for b in iter_bits(ray[a]):
+                between[a][b] = ray[a] & ~ray[b] & ~(1 << b)
+                line[a][b] = full_line
+    return between, line
+
+
+BETWEEN, LINE = _line_tables()
+
+
+class AttackMap:
+    # What the side to move needs about the enemy, computed once per position:
+    #   danger   - squares the enemy attacks, sliders seeing through our king (where our king may not go)
+    #   checkers - enemy pieces giving check
+    #   pinned   - our pieces pinned to our king
+    #   attacked - per-color attacked squares, filled on demand by Position.attacked_by
+    __slots__ = ('danger', 'checkers', 'pinned', 'attacked')
+
+    def __init__(self):
+        self.danger = 0
+        self.checkers = 0
+        self.pinned = 0
+        self.attacked = [None, None]
+
+# Castling rights that survive a move touching each square
+CASTLE_MASK = [15] * 64
+CASTLE_MASK[56] &= ~CASTLE_WQ
+CASTLE_MASK[63] &= ~CASTLE_WK
+CASTLE_MASK[60] &= ~(CASTLE_WK | CASTLE_WQ)
+CASTLE_MASK[0] &= ~CASTLE_BQ
+CASTLE_MASK[7] &= ~CASTLE_BK
+CASTLE_MASK[4] &= ~(CASTLE_BK | CASTLE_BQ)
+
+
+class Position:
+    # Fixed attribute slots: no per-instance __dict__, and attribute access in make/unmake is a slot lookup.
+    # The mailbox stays a list: small ints are shared objects, and list indexing is about three times
+    # faster than array('b') or bytearray indexing in CPython, which the search does at every node.
+    __slots__ = ('bb', 'occ', 'mailbox', 'side', 'castling', 'ep', 'halfmove', 'fullmove', 'stack', 'key',
+                 'key_stack', 'seen', 'score', '_attack_map', 'map_stack')
+
+    def __init__(self):
+        self.bb = [0] * 12
+        self.occ = [0, 0]
+        self.mailbox = [EMPTY] * 64  # piece code (color * 6 + type) per square, EMPTY if none
+        self.side = WHITE
+        self.castling = 0
+        self.ep = -1
+        self.halfmove = 0
+        self.fullmove = 1
+        self.stack = []
+        self.key = 0
+        self.key_stack = []
+        self.seen = {}  # key -> times it occurs in the game so far (played moves and the search line)
+        self.score = 0  # material + piece-square, white minus black
+        self._attack_map = None
+        self.map_stack = []
+
+    @classmethod
+    def from_board(cls, board, color, en_passant_target=None, castling_rights=None, halfmove_clock=0):
+        # Build a position from the GUI representation (8x8 grid of 'wP'-style codes)
+        pos = cls()
+        for r in range(BOARD_SIZE):
+            for c in range(BOARD_SIZE):
+                code = board[r][c]
+                if code:
+                    pos._put(CODE_TO_PIECE[code], r * 8 + c)
+        pos.side = WHITE if color == 'w' else BLACK
+        if castling_rights:
+            for key, bit in CASTLING_KEYS:
+                if castling_rights.get(key):
+                    pos.castling |= bit
+        if en_passant_target:
+            pos.ep = en_passant_target[0] * 8 + en_passant_target[1]
+        pos.halfmove = halfmove_clock
+        pos._drop_dead_ep()
+        pos.key = pos.compute_key()
+        pos.seen = {pos.key: 1}
+        return pos
+
+    @classmethod
+    def from_fen(cls, fen):
+        # Piece placement, side to move, castling, en passant, halfmove clock, fullmove number
+        fields = fen.split()
+        if len(fields) < 4:
+            raise ValueError(f"Invalid FEN: {fen!r}")
+        pos = cls()
+        rows = fields[0].split('/')
+        if len(rows) != BOARD_SIZE:
+            raise ValueError(f"Invalid FEN piece placement: {fields[0]!r}")
+        for r, row in enumerate(rows):
+            c = 0
+            for ch in row:
+                if ch.isdigit():
+                    c += int(ch)
+                else:
+                    code = ('w' if ch.isupper() else 'b') + ch.upper()
+                    if code not in CODE_TO_PIECE or c >= BOARD_SIZE:
+                        raise ValueError(f"Invalid FEN piece placement: {fields[0]!r}")
+                    pos._put(CODE_TO_PIECE[code], r * 8 + c)
+                    c += 1
+        if pos.bb[KING].bit_count() != 1 or pos.bb[6 + KING].bit_count() != 1:
+            raise ValueError(f"Invalid FEN: each side needs one king: {fields[0]!r}")
+        if fields[1] not in ('w', 'b'):
+            raise ValueError(f"Invalid FEN side to move: {fields[1]!r}")
+        pos.side = WHITE if fields[1] == 'w' else BLACK
+        for ch, bit in zip('KQkq', (CASTLE_WK, CASTLE_WQ, CASTLE_BK, CASTLE_BQ)):
+            if ch in fields[2]:
+                pos.castling |= bit
+        if fields[3] != '-':
+            if len(fields[3]) != 2 or fields[3][0] not in 'abcdefgh' or fields[3][1] not in '36':
+                raise ValueError(f"Invalid FEN en passant square: {fields[3]!r}")
+            pos.ep = (8 - int(fields[3][1])) * 8 + 'abcdefgh'.index(fields[3][0])
+        try:
+            if len(fields) > 4:
+                pos.halfmove = int(fields[4])
+            if len(fields) > 5:
+                pos.fullmove = int(fields[5])
+        except ValueError:
+            raise ValueError(f"Invalid FEN move counters: {' '.join(fields[4:6])!r}") from None
+        pos._drop_dead_ep()
+        pos.key = pos.compute_key()
+        pos.seen = {pos.key: 1}
+        return pos
+
+    def _drop_dead_ep(self):
+        # Only keep an en passant square a pawn can actually capture on, so transpositions share a key
+        if self.ep >= 0 and not PAWN_ATTACKS[self.side ^ 1][self.ep] & self.bb[self.side * 6 + PAWN]:
+            self.ep = -1
+
+    def fen(self):
+        # FEN of the position (the en passant square only when a capture there is possible)
+        rows = []
+        for r in range(BOARD_SIZE):
+            row, empty = '', 0
+            for piece in self.mailbox[r * 8:r * 8 + 8]:
+                if piece == EMPTY:
+                    empty += 1
+                    continue
+                if empty:
+                    row += str(empty)
+                    empty = 0
+                letter = PIECE_TYPES[piece % 6]
+                row += letter if piece < 6 else letter.lower()
+            rows.append(row + (str(empty) if empty else ''))
+        castling = ''.join(ch for ch, bit in zip('KQkq', (CASTLE_WK, CASTLE_WQ, CASTLE_BK, CASTLE_BQ))
+                           if self.castling & bit) or '-'
+        ep = square_name(self.ep) if self.ep >= 0 else '-'
+        return f"{'/'.join(rows)} {COLOR_CODES[self.side]} {castling} {ep} {self.halfmove} {self.fullmove}"
+
+    def compute_score(self):
+        # Running score from scratch, for checking the incremental updates
+        score = 0
+        for sq, piece in enumerate(self.mailbox):
+            if piece != EMPTY:
+                score += PSQ[piece][sq] if piece < 6 else -PSQ[piece][sq]
+        return score
+
+    def compute_key(self):
+        # Full Zobrist key from scratch; make_move keeps self.key up to date incrementally
+        key = ZOBRIST_CASTLING[self.castling]
+        for sq, piece in enumerate(self.mailbox):
+            if piece != EMPTY:
+                key ^= ZOBRIST_PIECE[piece][sq]
+        if self.ep >= 0:
+            key ^= ZOBRIST_EP[self.ep & 7]
+        if self.side == BLACK:
+            key ^= ZOBRIST_SIDE
+        return key
+
+    def copy(self):
+        pos = Position.__new__(Position)
+        pos.bb = self.bb[:]
+        pos.occ = self.occ[:]
+        pos.mailbox = self.mailbox[:]
+        pos.side = self.side
+        pos.castling = self.castling
+        pos.ep = self.ep
+        pos.halfmove = self.halfmove
+        pos.fullmove = self.fullmove
+        pos.stack = self.stack[:]
+        pos.key = self.key
+        pos.key_stack = self.key_stack[:]
+        pos.seen = dict(self.seen)
+        pos.score = self.score
+        pos._attack_map = self._attack_map
+        pos.map_stack = self.map_stack[:]
+        return pos
+
+    def _put(self, piece, sq):
+        bit = 1 << sq
+        self.bb[piece] |= bit
+        self.mailbox[sq] = piece
+        if piece < 6:
+            self.occ[WHITE] |= bit
+            self.score += PSQ[piece][sq]
+        else:
+            self.occ[BLACK] |= bit
+            self.score -= PSQ[piece][sq]
+
+    def _remove(self, sq):
+        piece = self.mailbox[sq]
+        bit = 1 << sq
+        self.bb[piece] ^= bit
+        self.mailbox[sq] = EMPTY
+        if piece < 6:
+            self.occ[WHITE] ^= bit
+            self.score -= PSQ[piece][sq]
+        else:
+            self.occ[BLACK] ^= bit
+            self.score += PSQ[piece][sq]
+        return piece
+
+    def king_square(self, color):
+        kings = self.bb[color * 6 + KING]
+        return kings.bit_length() - 1 if kings else -1
+
+    def is_attacked(self, sq, by_color):
+        bb = self.bb
+        base = by_color * 6
+        if PAWN_ATTACKS[by_color ^ 1][sq] & bb[base + PAWN]:
+            return True
+        if KNIGHT_ATTACKS[sq] & bb[base + KNIGHT]:
+            return True
+        if KING_ATTACKS[sq] & bb[base + KING]:
+            return True
+        occ = self.occ[0] | self.occ[1]
+        if bishop_attacks(sq, occ) & (bb[base + BISHOP] | bb[base + QUEEN]):
+            return True
+        if rook_attacks(sq, occ) & (bb[base + ROOK] | bb[base + QUEEN]):
+            return True
+        return False
+
+    def attacked_squares(self, color, occ=None):
+        # Bitboard of every square attacked by color's pieces
+        if occ is None:
+            occ = self.occ[0] | self.occ[1]
+        bb = self.bb
+        base = color * 6
+        pawns = bb[base + PAWN]
+        if color == WHITE:
+            attacks = ((pawns >> 9) & NOT_FILE_H) | ((pawns >> 7) & NOT_FILE_A)
+        else:
+            attacks = (((pawns << 7) & NOT_FILE_H) | ((pawns << 9) & NOT_FILE_A)) & FULL
+        for sq in iter_bits(bb[base + KNIGHT]):
+            attacks |= KNIGHT_ATTACKS[sq]
+        for sq in iter_bits(bb[base + BISHOP] | bb[base + QUEEN]):
+            attacks |= bishop_attacks(sq, occ)
+        for sq in iter_bits(bb[base + ROOK] | bb[base + QUEEN]):
+            attacks |= rook_attacks(sq, occ)
+        king = bb[base + KING]
+        if king:
+            attacks |= KING_ATTACKS[king.bit_length() - 1]
+        return attacks
+
+    def attack_map(self):
+        # Cached for the current position; make_move stacks it and unmake_move restores it
+        amap = self._attack_map
+        if amap is None:
+            amap = self._attack_map = self._compute_attack_map()
+        return amap
+
+    def attacked_by(self, color):
+        # Squares attacked by color, computed at most once per position
+        amap = self.attack_map()
+        attacked = amap.attacked[color]
+        if attacked is None:
+            attacked = amap.attacked[color] = self.attacked_squares(color)
+        return attacked
+
+    def _compute_attack_map(self):
+        us = self.side
+        them = us ^ 1
+        own = self.occ[us]
+        enemy = self.occ[them]
+        occ = own | enemy
+        amap = AttackMap()
+        king = self.king_square(us)
+        if king < 0:
+            amap.danger = self.attacked_squares(them, occ)
+            return amap
+        # Sliders see through our king, so it cannot step back along a checking line
+        amap.danger = self.attacked_squares(them, occ ^ (1 << king))
+        bb = self.bb
+        base = them * 6
+        checkers = (KNIGHT_ATTACKS[king] & bb[base + KNIGHT]) | (PAWN_ATTACKS[us][king] & bb[base + PAWN])
+        pinned = 0
+        # Enemy sliders on a line with our king, looking through our own pieces
+        snipers = ((rook_attacks(king, enemy) & (bb[base + ROOK] | bb[base + QUEEN]))
+                   | (bishop_attacks(king, enemy) & (bb[base + BISHOP] | bb[base + QUEEN])))
+        for sq in iter_bits(snipers):
+            between = BETWEEN[king][sq] & occ
+            if not between:
+                checkers |= 1 << sq
+            elif not between & (between - 1) and between & own:
+                pinned |= between
+        amap.checkers = checkers
+        amap.pinned = pinned
+        return amap
+
+    def in_check(self, color=None):
+        if color is None or color == self.side:
+            return self.king_square(self.side) < 0 or self.attack_map().checkers != 0
+        king = self.king_square(color)
+        return king < 0 or self.is_attacked(king, color ^ 1)
+
+    def _piece_moves(self, moves, targets, push_mask, captures_only, pinned, king):
+        # Pawn, knight, bishop, rook and queen moves onto targets (pawn pushes onto push_mask).
+        # Pinned pieces only move along the line through their king. En passant is not checked here.
+        us = self.side
+        bb = self.bb
+        enemy = self.occ[us ^ 1]
+        empty = ~(self.occ[0] | self.occ[1]) & FULL
+        occ = ~empty & FULL
+        promotions = (QUEEN,) if captures_only else (QUEEN, ROOK, BISHOP, KNIGHT)
+        base = us * 6
+        line = LINE[king] if king >= 0 else None
+
+        # Pawns
+        pawns = bb[base + PAWN]
+        if us == WHITE:
+            single = (pawns >> 8) & empty
+            double = ((single & ROW_MASKS[5]) >> 8) & empty & push_mask
+            step = 8
+            promo_row = ROW_MASKS[0]
+        else:
+            single = (pawns << 8) & empty
+            double = ((single & ROW_MASKS[2]) << 8) & empty & push_mask
+            step = -8
+            promo_row = ROW_MASKS[7]
+        single &= push_mask
+        if not captures_only:
+            for to in iter_bits(single & ~promo_row):
+                if pinned and pinned >> (to + step) & 1 and not line[to + step] >> to & 1:
+                    continue
+                moves.append((to + step) | (to << 6))
+            for to in iter_bits(double):
+                if pinned and pinned >> (to + 2 * step) & 1 and not line[to + 2 * step] >> to & 1:
+                    continue
+                moves.append((to + 2 * step) | (to << 6) | FLAG_DOUBLE)
+        for to in iter_bits(single & promo_row):
+            if pinned and pinned >> (to + step) & 1 and not line[to + step] >> to & 1:
+                continue
+            for promo in promotions:
+                moves.append((to + step) | (to << 6) | (promo << 12))
+        pawn_attacks = PAWN_ATTACKS[us]
+        ep_bit = (1 << self.ep) if self.ep >= 0 else 0
+        capture_mask = enemy & targets
+        for sq in iter_bits(pawns):
+            attacks = pawn_attacks[sq]
+            captures = attacks & capture_mask
+            if pinned and pinned >> sq & 1:
+                captures &= line[sq]
+            for to in iter_bits(captures):
+                if (1 << to) & promo_row:
+                    for promo in promotions:
+                        moves.append(sq | (to << 6) | (promo << 12))
+                else:
+                    moves.append(sq | (to << 6))
+            if attacks & ep_bit:
+                moves.append(sq | (self.ep << 6) | FLAG_EP)
+
+        # Knights (a pinned knight can never move)
+        for sq in iter_bits(bb[base + KNIGHT] & ~pinned):
+            for to in iter_bits(KNIGHT_ATTACKS[sq] & targets):
+                moves.append(sq | (to << 6))
+        # Bishops and queens (diagonals)
+        for sq in iter_bits(bb[base + BISHOP] | bb[base + QUEEN]):
+            allowed = bishop_attacks(sq, occ) & targets
+            if pinned and pinned >> sq & 1:
+                allowed &= line[sq]
+            for to in iter_bits(allowed):
+                moves.append(sq | (to << 6))
+        # Rooks and queens (lines)
+        for sq in iter_bits(bb[base + ROOK] | bb[base + QUEEN]):
+            allowed = rook_attacks(sq, occ) & targets
+            if pinned and pinned >> sq & 1:
+                allowed &= line[sq]
+            for to in iter_bits(allowed):
+                moves.append(sq | (to << 6))
+
+    def pseudo_legal_moves(self, captures_only=False):
+        # captures_only: captures, en passant and queen promotions (the moves quiescence search looks at)
+        moves = []
+        us = self.side
+        own = self.occ[us]
+        targets = self.occ[us ^ 1] if captures_only else ~own & FULL
+        king = self.king_square(us)
+        self._piece_moves(moves, targets, FULL, captures_only, 0, king)
+        if king >= 0:
+            for to in iter_bits(KING_ATTACKS[king] & targets):
+                moves.append(king | (to << 6))
+            if not captures_only:
+                self._castling_moves(moves, us, own | self.occ[us ^ 1], self.attack_map().danger)
+        return moves
+
+    def _castling_moves(self, moves, us, occ, danger):
+        rights = self.castling
+        mailbox = self.mailbox
+        if us == WHITE:
+            if rights & CASTLE_WK and not occ & ((1 << 61) | (1 << 62)) and mailbox[63] == ROOK:
+                if not danger & ((1 << 60) | (1 << 61) | (1 << 62)):
+                    moves.append(60 | (62 << 6) | FLAG_CASTLE)
+            if rights & CASTLE_WQ and not occ & ((1 << 57) | (1 << 58) | (1 << 59)) and mailbox[56] == ROOK:
+                if not danger & ((1 << 60) | (1 << 59) | (1 << 58)):
+                    moves.append(60 | (58 << 6) | FLAG_CASTLE)
+        else:
+            if rights & CASTLE_BK and not occ & ((1 << 5) | (1 << 6)) and mailbox[7] == 6 + ROOK:
+                if not danger & ((1 << 4) | (1 << 5) | (1 << 6)):
+                    moves.append(4 | (6 << 6) | FLAG_CASTLE)
+            if rights & CASTLE_BQ and not occ & ((1 << 1) | (1 << 2) | (1 << 3)) and mailbox[0] == 6 + ROOK:
+                if not danger & ((1 << 4) | (1 << 3) | (1 << 2)):
+                    moves.append(4 | (2 << 6) | FLAG_CASTLE)
+
+    def legal_moves(self, captures_only=False):
+        # Legal moves straight from the attack map: the king avoids attacked squares, a single check
+        # must be captured or blocked, pinned pieces stay on their line. Only en passant, which can
+        # uncover a check along the rank, is tried on the board.
+        us = self.side
+        king = self.king_square(us)
+        if king < 0:
+            return self.pseudo_legal_moves(captures_only)
+        amap = self.attack_map()
+        own = self.occ[us]
+        targets = self.occ[us ^ 1] if captures_only else ~own & FULL
+        moves = []
+        for to in iter_bits(KING_ATTACKS[king] & targets & ~amap.danger):
+            moves.append(king | (to << 6))
+        checkers = amap.checkers
+        if checkers & (checkers - 1):
+            return moves  # double check: only the king can move
+        if checkers:
+            mask = checkers | BETWEEN[king][checkers.bit_length() - 1]
+        else:
+            mask = FULL
+            if not captures_only:
+                self._castling_moves(moves, us, own | self.occ[us ^ 1], amap.danger)
+        start = len(moves)
+        self._piece_moves(moves, targets & mask, mask, captures_only, amap.pinned, king)
+        if self.ep >= 0:
+            for i in range(len(moves) - 1, start - 1, -1):
+                move = moves[i]
+                if move & FLAG_EP:
+                    self.make_move(move)
+                    if self.is_attacked(king, us ^ 1):
+                        del moves[i]
+                    self.unmake_move(move)
+        return moves
+
+    def find_move(self, from_row, from_col, to_row, to_col, promotion=QUEEN):
+        # Match a GUI (row, col) move against the generated moves, promoting to a queen by default
+        key = (from_row * 8 + from_col) | ((to_row * 8 + to_col) << 6)
+        for move in self.pseudo_legal_moves():
+            if move & 4095 == key and move_promotion(move) in (0, promotion):
+                return move
+        return None
+
+    def parse_move(self, text):
+        # Legal move from long algebraic notation (e2e4, e7e8q)
+        for move in self.legal_moves():
+            if move_name(move) == text:
+                return move
+        raise ValueError(f"Illegal move: {text!r}")
+
+    def san(self, move):
+        # Standard algebraic notation (Nf3, exd5, O-O, e8=Q+) of a legal move in this position
+        from_sq = move & 63
+        to_sq = (move >> 6) & 63
+        piece = self.mailbox[from_sq] % 6
+        if move & FLAG_CASTLE:
+            text = 'O-O' if to_sq > from_sq else 'O-O-O'
+        else:
+            capture = self.mailbox[to_sq] != EMPTY or move & FLAG_EP
+            if piece == PAWN:
+                text = (square_name(from_sq)[0] + 'x' if capture else '') + square_name(to_sq)
+                promo = move_promotion(move)
+                if promo:
+                    text += '=' + PIECE_TYPES[promo]
+            else:
+                # Disambiguate between pieces of the same kind that can reach the same square
+                rivals = [m & 63 for m in self.legal_moves()
+                          if (m >> 6) & 63 == to_sq and m & 63 != from_sq and self.mailbox[m & 63] % 6 == piece]
+                prefix = ''
+                if rivals:
+                    if all((sq & 7) != (from_sq & 7) for sq in rivals):
+                        prefix = square_name(from_sq)[0]
+                    elif all((sq >> 3) != (from_sq >> 3) for sq in rivals):
+                        prefix = square_name(from_sq)[1]
+                    else:
+                        prefix = square_name(from_sq)
+                text = PIECE_TYPES[piece] + prefix + ('x' if capture else '') + square_name(to_sq)
+        self.make_move(move)
+        if self.in_check():
+            text += '#' if not self.legal_moves() else '+'
+        self.unmake_move(move)
+        return text
+
+    def parse_san(self, text):
+        # Legal move from standard algebraic notation; check marks, annotations, a missing '=' and
+        # over-specified origins (Ng1f3) are accepted
+        clean = text.rstrip('+#!?').replace('0', 'O')
+        if clean in ('O-O', 'O-O-O'):
+            for move in self.legal_moves():
+                if move & FLAG_CASTLE and (((move >> 6) & 63) > (move & 63)) == (clean == 'O-O'):
+                    return move
+            raise ValueError(f"Illegal move: {text!r}")
+        match = SAN_RE.match(clean)
+        if not match:
+            raise ValueError(f"Unreadable move: {text!r}")
+        letter, from_file, from_rank, dest, promo = match.groups()
+        piece = PIECE_TYPES.index(letter) if letter else PAWN
+        promo = PIECE_TYPES.index(promo) if promo else 0
+        found = []
+        for move in self.legal_moves():
+            origin = square_name(move & 63)
+            if (square_name((move >> 6) & 63) == dest and self.mailbox[move & 63] % 6 == piece
+                    and move_promotion(move) == promo and from_file in (None, origin[0])
+                    and from_rank in (None, origin[1])):
+                found.append(move)
+        if len(found) != 1:
+            raise ValueError(f"{'Ambiguous' if found else 'Illegal'} move: {text!r}")
+        return found[0]
+
+    def repetitions(self):
+        # How many times the current position (pieces, side to move, castling, en passant) has occurred
+        return self.seen.get(self.key, 0)
+
+    def make_move(self, move):
+        us = self.side
+        from_sq = move & 63
+        to_sq = (move >> 6) & 63
+        piece = self.mailbox[from_sq]
+        captured = self.mailbox[to_sq]
+        # Undo info packed into one int: captured piece, castling rights, en passant square, halfmove clock
+        self.stack.append((captured + 1) | (self.castling << 4) | ((self.ep + 1) << 8) | (self.halfmove << 15))
+        self.key_stack.append(self.key)
+        self.map_stack.append(self._attack_map)
+        self._attack_map = None
+        key = self.key ^ ZOBRIST_SIDE ^ ZOBRIST_CASTLING[self.castling]
+        if self.ep >= 0:
+            key ^= ZOBRIST_EP[self.ep & 7]
+
+        self.halfmove = 0 if (piece % 6 == PAWN or captured != EMPTY) else self.halfmove + 1
+        if captured != EMPTY:
+            self._remove(to_sq)
+            key ^= ZOBRIST_PIECE[captured][to_sq]
+        self._remove(from_sq)
+        promo = (move >> 12) & 7
+        moved = us * 6 + promo if promo else piece
+        self._put(moved, to_sq)
+        key ^= ZOBRIST_PIECE[piece][from_sq] ^ ZOBRIST_PIECE[moved][to_sq]
+
+        if move & FLAG_EP:
+            cap_sq = to_sq + 8 if us == WHITE else to_sq - 8
+            key ^= ZOBRIST_PIECE[self._remove(cap_sq)][cap_sq]
+        elif move & FLAG_CASTLE:
+            if to_sq > from_sq:  # kingside
+                rook_from, rook_to = to_sq + 1, to_sq - 1
+            else:  # queenside
+                rook_from, rook_to = to_sq - 2, to_sq + 1
+            rook = self._remove(rook_from)
+            self._put(rook, rook_to)
+            key ^= ZOBRIST_PIECE[rook][rook_from] ^ ZOBRIST_PIECE[rook][rook_to]
+
+        # The en passant square is only set when an enemy pawn can capture there (see _drop_dead_ep)
+        ep = (from_sq + to_sq) // 2
+        if move & FLAG_DOUBLE and PAWN_ATTACKS[us][ep] & self.bb[(us ^ 1) * 6 + PAWN]:
+            self.ep = ep
+            key ^= ZOBRIST_EP[ep & 7]
+        else:
+            self.ep = -1
+        self.castling &= CASTLE_MASK[from_sq] & CASTLE_MASK[to_sq]
+        self.key = key = key ^ ZOBRIST_CASTLING[self.castling]
+        self.seen[key] = self.seen.get(key, 0) + 1
+        if us == BLACK:
+            self.fullmove += 1
+        self.side = us ^ 1
+
+    def unmake_move(self, move):
+        undo = self.stack.pop()
+        us = self.side ^ 1
+        self.side = us
+        if us == BLACK:
+            self.fullmove -= 1
+        from_sq = move & 63
+        to_sq = (move >> 6) & 63
+
+        if move & FLAG_CASTLE:
+            if to_sq > from_sq:  # kingside
+                self._put(self._remove(to_sq - 1), to_sq + 1)
+            else:  # queenside
+                self._put(self._remove(to_sq + 1), to_sq - 2)
+        piece = self._remove(to_sq)
+        if (move >> 12) & 7:
+            piece = us * 6 + PAWN
+        self._put(piece, from_sq)
+        captured = (undo & 15) - 1
+        if captured != EMPTY:
+            self._put(captured, to_sq)
+        if move & FLAG_EP:
+            self._put((us ^ 1) * 6 + PAWN, to_sq + 8 if us == WHITE else to_sq - 8)
+
+        self.castling = (undo >> 4) & 15
+        self.ep = ((undo >> 8) & 127) - 1
+        self.halfmove = undo >> 15
+        seen = self.seen[self.key] - 1
+        if seen:
+            self.seen[self.key] = seen
+        else:
+            del self.seen[self.key]
+        self.key = self.key_stack.pop()
+        self._attack_map = self.map_stack.pop()
+
+    def make_null_move(self):
+        # Pass the turn without moving (null-move pruning in the search); never used while in check
+        self.stack.append((self.castling << 4) | ((self.ep + 1) << 8) | (self.halfmove << 15))
+        self.key_stack.append(self.key)
+        self.map_stack.append(self._attack_map)
+        self._attack_map = None
+        key = self.key ^ ZOBRIST_SIDE
+        if self.ep >= 0:
+            key ^= ZOBRIST_EP[self.ep & 7]
+            self.ep = -1
+        self.key = key
+        self.halfmove += 1
+        self.seen[key] = self.seen.get(key, 0) + 1
+        self.side ^= 1
+
+    def unmake_null_move(self):
+        undo = self.stack.pop()
+        self.side ^= 1
+        self.ep = ((undo >> 8) & 127) - 1
+        self.halfmove = undo >> 15
+        seen = self.seen[self.key] - 1
+        if seen:
+            self.seen[self.key] = seen
+        else:
+            del self.seen[self.key]
+        self.key = self.key_stack.pop()
+        self._attack_map = self.map_stack.pop()
+
+
+def perft(pos, depth):
+    # Number of leaf nodes of the legal move tree to the given depth
+    if depth == 0:
+        return 1
+    moves = pos.legal_moves()
+    if depth == 1:
+        return len(moves)
+    nodes = 0
+    for move in moves:
+        pos.make_move(move)
+        nodes += perft(pos, depth - 1)
+        pos.unmake_move(move)
+    return nodes
+
+
+def perft_divide(pos, depth):
+    # Leaf count below each root move, for locating the move where two generators disagree
+    counts = {}
+    for move in pos.legal_moves():
+        pos.make_move(move)
+        counts[move_name(move)] = perft(pos, depth - 1)
+        pos.unmake_move(move)
+    return counts
+
+
+# Standard perft positions with known leaf counts for depth 1, 2, 3...
+PERFT_SUITE = [
+    ("start", START_FEN, [20, 400, 8902, 197281, 4865609]),
+    ("kiwipete", "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1", [48, 2039, 97862, 4085603]),
+    ("position 3", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1", [14, 191, 2812, 43238, 674624]),
+    ("position 4", "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1", [6, 264, 9467, 422333]),
+    ("position 4 mirrored", "r2q1rk1/pP1p2pp/Q4n2/bbp1p3/Np6/1B3NBn/pPPP1PPP/R3K2R b KQ - 0 1", [6, 264, 9467, 422333]),
+    ("position 5", "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8", [44, 1486, 62379, 2103487]),
+    ("position 6", "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10", [46, 2079, 89890, 3894594]),
+]
+
+
+def run_perft(fen, depth, divide=False):
+    pos = Position.from_fen(fen)
+    start = time.perf_counter()
+    if divide:
+        counts = perft_divide(pos, depth)
+        for name in sorted(counts):
+            print(f"{name}: {counts[name]}")
+        nodes = sum(counts.values())
+    else:
+        nodes = perft(pos, depth)
+    elapsed = time.perf_counter() - start
+    print(f"depth {depth}: {nodes} nodes in {elapsed:.3f}s ({int(nodes / max(elapsed, 1e-9))} nodes/sec)")
+    return nodes
+
+
+def run_perft_suite(max_depth=3):
+    # Returns True when every count matches; prints nodes/sec per position
+    ok = True
+    total_nodes = 0
+    total_time = 0.0
+    for name, fen, expected in PERFT_SUITE:
+        pos = Position.from_fen(fen)
+        for depth, want in enumerate(expected[:max_depth], 1):
+            start = time.perf_counter()
+            nodes = perft(pos, depth)
+            elapsed = time.perf_counter() - start
+            total_nodes += nodes
+            total_time += elapsed
+            status = "ok" if nodes == want else f"FAIL (expected {want})"
+            ok = ok and nodes == want
+            print(f"{name:<20} depth {depth}: {nodes:>9} nodes {elapsed:7.3f}s "
+                  f"{int(nodes / max(elapsed, 1e-9)):>8} nodes/sec  {status}")
+    print(f"total: {total_nodes} nodes in {total_time:.2f}s ({int(total_nodes / max(total_time, 1e-9))} nodes/sec) "
+          f"{'all passed' if ok else 'FAILURES'}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Perft: count leaf nodes of the legal move tree")
+    parser.add_argument("--fen", default=START_FEN, help="position to count from (default: starting position)")
+    parser.add_argument("--depth", type=int, default=3, help="depth in plies (default 3)")
+    parser.add_argument("--divide", action="store_true", help="print the leaf count below each root move")
+    parser.add_argument("--suite", action="store_true",
+                        help="run the standard positions up to --depth and compare with the known counts")
+    args = parser.parse_args()
+    if args.suite:
+        sys.exit(0 if run_perft_suite(args.depth) else 1)
+    run_perft(args.fen, args.depth, args.divide)
+
+
+if __name__ == "__main__":
+    main()
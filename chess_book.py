@@ -0,0 +1,207 @@
+## **OPENING BOOK**
+## Lets the computer play well-known opening moves instantly instead of searching them.
+## 1- The book file is a 16-byte header (magic + the start position's Zobrist key, so a book built
+##    with different keys is rejected) followed by 16-byte entries: key, move, weight (big-endian),
+##    sorted by key.
+## 2- Opening the book only memory-maps the file; a probe is a binary search over the mapped
+##    entries, so startup time and memory do not grow with the size of the book.
+## 3- Several entries can share a key; one of them is picked at random in proportion to its weight.
+## 4- `python chess_book.py --build chess_book.bin` writes a book from the built-in opening lines
+##    (or from a text file of move lines with --lines); `--probe FEN` lists the book moves for a position.
+
+import os
+import sys
+import mmap
+import random
+import struct
+import argparse
+
+from chess_bitboard import Position, START_FEN, move_name
+
+BOOK_MAGIC = b"CHSBOOK1"
+HEADER = struct.Struct(">8sQ")
+ENTRY = struct.Struct(">QII")  # position key, move, weight
+DEFAULT_BOOK = os.path.join(os.path.dirname(os.path.abspath(__file__)), "chess_book.bin")
+
+# Main lines of common openings in long algebraic notation. Moves shared by several lines get
+# a higher weight, so popular continuations are chosen more often.
+OPENING_LINES = [
+    # Open games
+    "e2e4 e7e5 g1f3 b8c6 f1b5 a7a6 b5a4 g8f6 e1g1 f8e7 f1e1 b7b5 a4b3 d7d6 c2c3 e8g8",
+    "e2e4 e7e5 g1f3 b8c6 f1b5 a7a6 b5a4 g8f6 e1g1 f8e7 f1e1 b7b5 a4b3 e8g8 c2c3 d7d5",
+    "e2e4 e7e5 g1f3 b8c6 f1b5 g8f6 e1g1 f6e4 d2d4 e4d6 b5c6 d7c6 d4e5 d6f5",
+    "e2e4 e7e5 g1f3 b8c6 f1b5 a7a6 b5c6 d7c6 e1g1 f7f6 d2d4 e5d4 f3d4",
+    "e2e4 e7e5 g1f3 b8c6 f1c4 f8c5 c2c3 g8f6 d2d4 e5d4 c3d4 c5b4 c1d2",
+    "e2e4 e7e5 g1f3 b8c6 f1c4 f8c5 d2d3 g8f6 c2c3 d7d6 e1g1 e8g8",
+    "e2e4 e7e5 g1f3 b8c6 f1c4 g8f6 d2d3 f8e7 e1g1 e8g8 f1e1 d7d6",
+    "e2e4 e7e5 g1f3 b8c6 d2d4 e5d4 f3d4 g8f6 d4c6 b7c6 e4e5 d8e7",
+    "e2e4 e7e5 g1f3 g8f6 f3e5 d7d6 e5f3 f6e4 d2d4 d6d5 f1d3 b8c6",
+    "e2e4 e7e5 g1f3 d7d6 d2d4 g8f6 b1c3 b8d7 f1c4 f8e7",
+    "e2e4 e7e5 b1c3 g8f6 f2f4 d7d5 f4e5 f6e4 g1f3",
+    # Sicilian
+    "e2e4 c7c5 g1f3 d7d6 d2d4 c5d4 f3d4 g8f6 b1c3 a7a6 c1e3 e7e5 d4b3 c8e6",
+    "e2e4 c7c5 g1f3 d7d6 d2d4 c5d4 f3d4 g8f6 b1c3 a7a6 c1g5 e7e6 f2f4",
+    "e2e4 c7c5 g1f3 d7d6 d2d4 c5d4 f3d4 g8f6 b1c3 g7g6 c1e3 f8g7 f2f3 e8g8",
+    "e2e4 c7c5 g1f3 b8c6 d2d4 c5d4 f3d4 g8f6 b1c3 e7e5 d4b5 d7d6 c1g5 a7a6",
+    "e2e4 c7c5 g1f3 e7e6 d2d4 c5d4 f3d4 a7a6 f1d3 g8f6 e1g1",
+    "e2e4 c7c5 g1f3 e7e6 d2d4 c5d4 f3d4 b8c6 b1c3 d8c7 c1e3 a7a6",
+    "e2e4 c7c5 c2c3 g8f6 e4e5 f6d5 d2d4 c5d4 g1f3 b8c6",
+    "e2e4 c7c5 b1c3 b8c6 g2g3 g7g6 f1g2 f8g7 d2d3 d7d6",
+    # French, Caro-Kann and other semi-open games
+    "e2e4 e7e6 d2d4 d7d5 b1c3 g8f6 c1g5 f8e7 e4e5 f6d7 g5e7 d8e7",
+    "e2e4 e7e6 d2d4 d7d5 b1c3 f8b4 e4e5 c7c5 a2a3 b4c3 b2c3 g8e7",
+    "e2e4 e7e6 d2d4 d7d5 b1d2 g8f6 e4e5 f6d7 f1d3 c7c5 c2c3 b8c6",
+    "e2e4 e7e6 d2d4 d7d5 e4e5 c7c5 c2c3 b8c6 g1f3 d8b6",
+    "e2e4 c7c6 d2d4 d7d5 b1c3 d5e4 c3e4 c8f5 e4g3 f5g6 h2h4 h7h6",
+    "e2e4 c7c6 d2d4 d7d5 e4e5 c8f5 g1f3 e7e6 f1e2 c6c5",
+    "e2e4 c7c6 d2d4 d7d5 e4d5 c6d5 c2c4 g8f6 b1c3 e7e6",
+    "e2e4 d7d6 d2d4 g8f6 b1c3 g7g6 g1f3 f8g7 f1e2 e8g8",
+    "e2e4 g7g6 d2d4 f8g7 b1c3 d7d6 c1e3 a7a6",
+    "e2e4 d7d5 e4d5 d8d5 b1c3 d5a5 d2d4 g8f6 g1f3 c8f5",
+    "e2e4 g8f6 e4e5 f6d5 d2d4 d7d6 g1f3 c8g4 f1e2 e7e6",
+    # Queen's pawn
+    "d2d4 d7d5 c2c4 e7e6 b1c3 g8f6 c1g5 f8e7 e2e3 e8g8 g1f3 h7h6",
+    "d2d4 d7d5 c2c4 e7e6 g1f3 g8f6 g2g3 f8e7 f1g2 e8g8 e1g1 d5c4",
+    "d2d4 d7d5 c2c4 c7c6 g1f3 g8f6 b1c3 d5c4 a2a4 c8f5 e2e3 e7e6",
+    "d2d4 d7d5 c2c4 c7c6 g1f3 g8f6 b1c3 e7e6 e2e3 b8d7 f1d3 d5c4",
+    "d2d4 d7d5 c2c4 d5c4 g1f3 g8f6 e2e3 e7e6 f1c4 c7c5 e1g1 a7a6",
+    "d2d4 g8f6 c2c4 e7e6 b1c3 f8b4 e2e3 e8g8 f1d3 d7d5 g1f3 c7c5",
+    "d2d4 g8f6 c2c4 e7e6 b1c3 f8b4 d1c2 e8g8 a2a3 b4c3 c2c3 b7b6",
+    "d2d4 g8f6 c2c4 e7e6 g1f3 b7b6 g2g3 c8a6 b2b3 f8b4 c1d2 b4e7",
+    "d2d4 g8f6 c2c4 e7e6 g1f3 d7d5 b1c3 f8e7 c1f4 e8g8 e2e3 c7c5",
+    "d2d4 g8f6 c2c4 g7g6 b1c3 f8g7 e2e4 d7d6 g1f3 e8g8 f1e2 e7e5 e1g1 b8c6",
+    "d2d4 g8f6 c2c4 g7g6 b1c3 d7d5 c4d5 f6d5 e2e4 d5c3 b2c3 f8g7",
+    "d2d4 g8f6 c2c4 c7c5 d4d5 e7e6 b1c3 e6d5 c4d5 d7d6 e2e4 g7g6",
+    "d2d4 g8f6 c2c4 c7c5 d4d5 b7b5 c4b5 a7a6 b5a6 c8a6",
+    "d2d4 g8f6 g1f3 e7e6 c1f4 c7c5 e2e3 b8c6 c2c3",
+    "d2d4 g8f6 c1g5 e7e6 e2e4 h7h6 g5f6 d8f6",
+    "d2d4 f7f5 g2g3 g8f6 f1g2 e7e6 g1f3 f8e7 e1g1 e8g8 c2c4 d7d6",
+    # Flank openings
+    "c2c4 e7e5 b1c3 g8f6 g1f3 b8c6 g2g3 d7d5 c4d5 f6d5 f1g2 d5b6",
+    "c2c4 g8f6 b1c3 e7e6 e2e4 d7d5 e4e5 d5d4",
+    "c2c4 c7c5 g1f3 b8c6 b1c3 g7g6 g2g3 f8g7 f1g2 e7e6",
+    "g1f3 d7d5 g2g3 g8f6 f1g2 c7c6 e1g1 c8g4 d2d3 b8d7",
+    "g1f3 g8f6 c2c4 g7g6 b1c3 f8g7 e2e4 d7d6 d2d4 e8g8",
+]
+
+
+def iter_line_entries(lines):
+    # Yield (key, move) for every move of every line, replayed from the start position
+    for line in lines:
+        position = Position.from_fen(START_FEN)
+        for text in line.split():
+            move = position.parse_move(text)
+            yield position.key, move
+            position.make_move(move)
+
+
+def build_book(path, lines=OPENING_LINES):
+    # Count how often each (position, move) pair occurs and write the sorted entries
+    weights = {}
+    for key, move in iter_line_entries(lines):
+        weights[key, move] = weights.get((key, move), 0) + 1
+    start_key = Position.from_fen(START_FEN).key
+    with open(path, "wb") as f:
+        f.write(HEADER.pack(BOOK_MAGIC, start_key))
+        for (key, move), weight in sorted(weights.items()):
+            f.write(ENTRY.pack(key, move, weight))
+    return len(weights)
+
+
+class OpeningBook:
+    def __init__(self, path=DEFAULT_BOOK):
+        self.path = path
+        self._file = open(path, "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        if size < HEADER.size or (size - HEADER.size) % ENTRY.size:
+            self._file.close()
+            raise ValueError(f"{path}: not an opening book")
+        self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, start_key = HEADER.unpack_from(self._data, 0)
+        if magic != BOOK_MAGIC or start_key != Position.from_fen(START_FEN).key:
+            self.close()
+            raise ValueError(f"{path}: not an opening book for this engine's position keys")
+        self.size = (size - HEADER.size) // ENTRY.size
+
+    def __len__(self):
+        return self.size
+
+    def close(self):
+        self._data.close()
+        self._file.close()
+
+    def _key_at(self, index):
+        return struct.unpack_from(">Q", self._data, HEADER.size + index * ENTRY.size)[0]
+
+    def entries(self, position):
+        # [(move, weight), ...] stored for the position; moves that are not legal here
+        # (a key collision) are dropped
+        lo, hi = 0, self.size
+        key = position.key
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key_at(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        found = []
+        while lo < self.size:
+            entry_key, move, weight = ENTRY.unpack_from(self._data, HEADER.size + lo * ENTRY.size)
+            if entry_key != key:
+                break
+            found.append((move, weight))
+            lo += 1
+        if found:
+            legal = set(position.legal_moves())
+            found = [(move, weight) for move, weight in found if move in legal]
+        return found
+
+    def choose(self, position, rng=random):
+        # A book move picked with probability proportional to its weight, or None when out of book
+        found = self.entries(position)
+        if not found:
+            return None
+        moves, weights = zip(*found)
+        return rng.choices(moves, weights)[0]
+
+
+def open_book(path=DEFAULT_BOOK):
+    # The book at path, or None if there is no usable book there
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        return OpeningBook(path)
+    except (OSError, ValueError) as e:
+        print(f"Opening book ignored: {e}", file=sys.stderr)
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or inspect the opening book")
+    parser.add_argument("--build", metavar="PATH", help="write a book to PATH")
+    parser.add_argument("--lines", metavar="FILE",
+                        help="text file with one line of moves per line (long algebraic, e.g. e2e4 e7e5)")
+    parser.add_argument("--probe", metavar="FEN", help="list the book moves for a position")
+    parser.add_argument("--book", default=DEFAULT_BOOK, metavar="PATH", help="book to probe")
+    args = parser.parse_args()
+    if args.build:
+        lines = OPENING_LINES
+        if args.lines:
+            with open(args.lines) as f:
+                lines = [line for line in f if line.strip() and not line.startswith("#")]
+        count = build_book(args.build, lines)
+        print(f"{args.build}: {count} entries from {len(lines)} lines")
+    if args.probe:
+        book = OpeningBook(args.book)
+        position = Position.from_fen(args.probe)
+        found = book.entries(position)
+        total = sum(weight for _, weight in found)
+        for move, weight in sorted(found, key=lambda entry: -entry[1]):
+            print(f"{move_name(move):<6} weight {weight:>4} ({100 * weight / total:.0f}%)")
+        if not found:
+            print("position not in book")
+        book.close()
+
+
+if __name__ == "__main__":
+    main()
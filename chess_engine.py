@@ -0,0 +1,939 @@
+## **CHESS ENGINE**
+## The computer player's evaluation and search, free of any GUI code so it can run headless.
+## 1- Evaluation: material + piece-square tables, kept incrementally by the bitboard position.
+## 2- Search: negamax alpha-beta with a transposition table, move ordering, quiescence search and
+##    time-managed iterative deepening; optionally root-parallel across worker processes.
+##    Null-move pruning, late move reductions, principal variation search and aspiration windows can each be
+##    switched off (SEARCH_FEATURES); `--bench-features DEPTH` measures what each one saves.
+## 3- UCI: `python chess_engine.py` speaks the UCI protocol on stdin/stdout, so the engine can be
+##    driven by standard chess tooling or run in batch on machines without a display.
+## 4- With endgame tablebases (chess_tablebase.py) nodes with 4 pieces or fewer are looked up exactly.
+
+import sys
+import json
+import time
+import threading
+import argparse
+import multiprocessing
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+
+from chess_bitboard import (Position, set_evaluation_tables, START_FEN, COLOR_CODES, EMPTY, PAWN, QUEEN, KING,
+                            FLAG_EP, move_name)
+from chess_tablebase import Tablebases
+
+# --- Evaluation ---
+
+PIECE_VALUES = {
+    'K': 0,  # King value is handled by checkmate
+    'Q': 900,
+    'R': 500,
+    'B': 330,
+    'N': 320,
+    'P': 100
+}
+
+# Piece-square tables for positional evaluation (simplified, for both colors)
+PIECE_SQUARE_TABLES = {
+    'P': [
+        [0, 0, 0, 0, 0, 0, 0, 0],
+        [5, 10, 10, -20, -20, 10, 10, 5],
+        [5, -5, -10, 0, 0, -10, -5, 5],
+        [0, 0, 0, 20, 20, 0, 0, 0],
+        [5, 5, 10, 25, 25, 10, 5, 5],
+        [10, 10, 20, 30, 30, 20, 10, 10],
+        [50, 50, 50, 50, 50, 50, 50, 50],
+        [0, 0, 0, 0, 0, 0, 0, 0]
+    ],
+    'N': [
+        [-50, -40, -30, -30, -30, -30, -40, -50],
+        [-40, -20, 0, 0, 0, 0, -20, -40],
+        [-30, 0, 10, 15, 15, 10, 0, -30],
+        [-30, 5, 15, 20, 20, 15, 5, -30],
+        [-30, 0, 15, 20, 20, 15, 0, -30],
+        [-30, 5, 10, 15, 15, 10, 5, -30],
+        [-40, -20, 0, 5, 5, 0, -20, -40],
+        [-50, -40, -30, -30, -30, -30, -40, -50]
+    ],
+    'B': [
+        [-20, -10, -10, -10, -10, -10, -10, -20],
+        [-10, 0, 0, 0, 0, 0, 0, -10],
+        [-10, 0, 5, 10, 10, 5, 0, -10],
+        [-10, 5, 5, 10, 10, 5, 5, -10],
+        [-10, 0, 10, 10, 10, 10, 0, -10],
+        [-10, 10, 10, 10, 10, 10, 10, -10],
+        [-10, 5, 0, 0, 0, 0, 5, -10],
+        [-20, -10, -10, -10, -10, -10, -10, -20]
+    ],
+    'R': [
+        [0, 0, 0, 0, 0, 0, 0, 0],
+        [5, 10, 10, 10, 10, 10, 10, 5],
+        [-5, 0, 0, 0, 0, 0, 0, -5],
+        [-5, 0, 0, 0, 0, 0, 0, -5],
+        [-5, 0, 0, 0, 0, 0, 0, -5],
+        [-5, 0, 0, 0, 0, 0, 0, -5],
+        [-5, 0, 0, 0, 0, 0, 0, -5],
+        [0, 0, 0, 5, 5, 0, 0, 0]
+    ],
+    'Q': [
+        [-20, -10, -10, -5, -5, -10, -10, -20],
+        [-10, 0, 0, 0, 0, 0, 0, -10],
+        [-10, 0, 5, 5, 5, 5, 0, -10],
+        [-5, 0, 5, 5, 5, 5, 0, -5],
+        [0, 0, 5, 5, 5, 5, 0, -5],
+        [-10, 5, 5, 5, 5, 5, 0, -10],
+        [-10, 0, 5, 0, 0, 0, 0, -10],
+        [-20, -10, -10, -5, -5, -10, -10, -20]
+    ],
+    'K': [
+        [-30, -40, -40, -50, -50, -40, -40, -30],
+        [-30, -40, -40, -50, -50, -40, -40, -30],
+        [-30, -40, -40, -50, -50, -40, -40, -30],
+        [-30, -40, -40, -50, -50, -40, -40, -30],
+        [-20, -30, -30, -40, -40, -30, -30, -20],
+        [-10, -20, -20, -20, -20, -20, -20, -10],
+        [20, 20, 0, 0, 0, 0, 20, 20],
+        [20, 30, 10, 0, 0, 10, 30, 20]
+    ]
+}
+
+set_evaluation_tables(PIECE_VALUES, PIECE_SQUARE_TABLES)
+
+def evaluate_board(position, color):
+    # Material + piece-square tables, kept as a running total by make/unmake (white minus black)
+    return position.score if color == 'w' else -position.score
+
+def all_legal_moves(position):
+    # Bitboard generator: pseudo-legal moves straight from the attack tables, filtered for king safety
+    return position.legal_moves()
+
+MATE_SCORE = 99999
+INFINITY = 1000000
+
+# Transposition table bound types
+BOUND_EXACT, BOUND_LOWER, BOUND_UPPER = 1, 2, 3
+
+class TranspositionTable:
+    # Fixed-size table of search results indexed by the low bits of the Zobrist key.
+    # Each slot is two 64-bit words in flat arrays, so the memory budget is exact:
+    #   keys[i] = full Zobrist key (detects index collisions)
+    #   data[i] = move | bound << 18 | depth << 20 | generation << 28 | (score + SCORE_OFFSET) << 34
+    # Replacement: an entry from an older search is always replaced, otherwise the deeper result is kept.
+    ENTRY_BYTES = 16
+    SCORE_OFFSET = 1 << 17
+
+    def __init__(self, megabytes=16):
+        slots = max(1, int(megabytes * 1024 * 1024) // self.ENTRY_BYTES)
+        size = 1 << (slots.bit_length() - 1)  # power of two so the index is a mask
+        self.mask = size - 1
+        self.keys = array('Q', bytes(8 * size))
+        self.data = array('Q', bytes(8 * size))
+        self.generation = 0
+        self.probes = self.hits = self.cutoffs = 0
+
+    def __len__(self):
+        return self.mask + 1
+
+    def new_search(self):
+        # Age the stored entries and reset the counters for the next search
+        self.generation = (self.generation + 1) & 63
+        self.probes = self.hits = self.cutoffs = 0
+
+    def clear(self):
+        size = self.mask + 1
+        self.keys = array('Q', bytes(8 * size))
+        self.data = array('Q', bytes(8 * size))
+
+    def probe(self, key):
+        # Returns (depth, score, bound, move) or None
+        self.probes += 1
+        i = key & self.mask
+        data = self.data[i]
+        if not data or self.keys[i] != key:
+            return None
+        self.hits += 1
+        return (data >> 20) & 255, (data >> 34) - self.SCORE_OFFSET, (data >> 18) & 3, data & 0x3FFFF
+
+    def store(self, key, depth, score, bound, move):
+        i = self.mask & key
+        old = self.data[i]
+        if old and ((old >> 28) & 63) == self.generation and depth < ((old >> 20) & 255):
+            if self.keys[i] != key or bound != BOUND_EXACT:
+                return
+        if not move and old and self.keys[i] == key:
+            move = old & 0x3FFFF  # keep the best move we already know for this position
+        self.keys[i] = key
+        self.data[i] = ((move or 0) | (bound << 18) | (depth << 20) | (self.generation << 28)
+                        | ((score + self.SCORE_OFFSET) << 34))
+
+    def hit_rate(self):
+        return self.hits / self.probes if self.probes else 0.0
+
+    def cutoff_rate(self):
+        return self.cutoffs / self.probes if self.probes else 0.0
+
+    def report(self):
+        return (f"TT {len(self)} slots: {self.probes} probes, hit rate {self.hit_rate():.1%}, "
+                f"cutoff rate {self.cutoff_rate():.1%}")
+
+def _score_to_table(score, ply):
+    # Mate scores are stored relative to the node, not the root
+    if score > MATE_SCORE - 1000:
+        return score + ply
+    if score < -MATE_SCORE + 1000:
+        return score - ply
+    return score
+
+def _score_from_table(score, ply):
+    if score > MATE_SCORE - 1000:
+        return score - ply
+    if score < -MATE_SCORE + 1000:
+        return score + ply
+    return score
+
+MAX_PLY = 128
+
+# Selective search features, each can be switched off for testing (SearchContext keywords)
+SEARCH_FEATURES = ('null_move', 'lmr', 'pvs', 'aspiration')
+NULL_MOVE_REDUCTION = 2  # the null-move search is this many plies shallower than a normal reply
+NULL_MOVE_MIN_DEPTH = 3
+LMR_MIN_DEPTH = 3  # late move reductions: quiet moves after the first few are searched one ply shallower
+LMR_MIN_MOVES = 3
+ASPIRATION_WINDOW = 50  # iterative deepening searches this far either side of the previous score first
+
+class SearchTimeout(Exception):
+    pass
+
+class SearchContext:
+    # State shared by every node of one search: table, node counter, deadline, principal variation
+    # and the move-ordering tables (killers per ply, history per piece and target square)
+    def __init__(self, table=None, deadline=None, ordering=True, quiescence=True, tablebases=None,
+                 null_move=True, lmr=True, pvs=True, aspiration=True):
+        self.table = table
+        self.tablebases = tablebases  # Tablebases probed at nodes with few pieces left
+        self.deadline = deadline
+        self.ordering = ordering
+        self.quiescence = quiescence
+        self.null_move = null_move  # null-move pruning
+        self.lmr = lmr  # late move reductions
+        self.pvs = pvs  # principal variation search: null windows after the first move
+        self.aspiration = aspiration  # aspiration windows in iterative deepening
+        self.stop = None  # threading.Event another thread can set to end the search early
+        self.start_time = time.perf_counter()
+        self.nodes = 0
+        self.qnodes = 0  # nodes visited by quiescence search (also counted in nodes)
+        self.cutoffs = 0  # beta cutoffs in the main search
+        self.first_cutoffs = 0  # ... of which by the first move searched (a measure of move ordering)
+        self.tablebase_hits = 0
+        self.null_cutoffs = 0  # nodes pruned by a null-move search
+        self.researches = 0  # reduced or null-window searches that had to be repeated
+        self.iterations = []  # one dict per completed iteration of iterative deepening
+        self.root_moves = None  # legal root moves to search instead of generating them (a worker's share, or the GUI's list)
+        self.pv = [()] * (MAX_PLY + 1)  # pv[ply] = best line found below the node at that ply
+        self.pv_hint = ()  # principal variation of the previous iteration, searched first
+        self.follow_pv = False
+        self.killers = [[0, 0] for _ in range(MAX_PLY + 1)]
+        self.history = [[0] * 64 for _ in range(12)]
+
+    def out_of_time(self):
+        # Polled every 1024 nodes: the deadline has passed or a stop was requested
+        if self.deadline is not None and time.perf_counter() > self.deadline:
+            return True
+        return self.stop is not None and self.stop.is_set()
+
+class SearchStats:
+    # Counters of one search for display and JSON dumps: where the nodes and the time went.
+    # Filled from a SearchContext by update(); the table counters are those since table.new_search().
+    FIELDS = ("depth", "score", "best_move", "pv", "nodes", "qnodes", "cutoffs", "first_cutoffs",
+              "table_probes", "table_hits", "table_cutoffs", "tablebase_hits", "null_cutoffs", "researches", "elapsed",
+              "iterations")
+
+    def __init__(self):
+        self.depth = 0
+        self.score = 0
+        self.best_move = None  # move name, e.g. "e2e4"
+        self.pv = []  # move names
+        self.nodes = self.qnodes = 0
+        self.cutoffs = self.first_cutoffs = 0
+        self.table_probes = self.table_hits = self.table_cutoffs = 0
+        self.tablebase_hits = 0
+        self.null_cutoffs = self.researches = 0
+        self.elapsed = 0.0
+        self.iterations = []  # {"depth", "score", "nodes", "qnodes", "time", "pv"} per completed iteration
+
+    def update(self, search):
+        self.nodes, self.qnodes = search.nodes, search.qnodes
+        self.cutoffs, self.first_cutoffs = search.cutoffs, search.first_cutoffs
+        self.tablebase_hits = search.tablebase_hits
+        self.null_cutoffs, self.researches = search.null_cutoffs, search.researches
+        if search.table is not None:
+            table = search.table
+            self.table_probes, self.table_hits, self.table_cutoffs = table.probes, table.hits, table.cutoffs
+        self.elapsed = time.perf_counter() - search.start_time
+        self.iterations = list(search.iterations)
+        if self.iterations:
+            last = self.iterations[-1]
+            self.depth, self.score, self.pv = last["depth"], last["score"], last["pv"]
+            self.best_move = self.pv[0] if self.pv else None
+
+    def merge(self, other):
+        # Add another search's counters (a worker of a parallel search); depth, score and PV are kept
+        for name in ("nodes", "qnodes", "cutoffs", "first_cutoffs", "table_probes", "table_hits",
+                     "table_cutoffs", "tablebase_hits", "null_cutoffs", "researches"):
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+        self.elapsed = max(self.elapsed, other.elapsed)
+
+    @property
+    def nps(self):
+        return int(self.nodes / max(self.elapsed, 1e-9))
+
+    @property
+    def first_cutoff_rate(self):
+        return self.first_cutoffs / self.cutoffs if self.cutoffs else 0.0
+
+    @property
+    def table_hit_rate(self):
+        return self.table_hits / self.table_probes if self.table_probes else 0.0
+
+    def to_dict(self):
+        data = {name: getattr(self, name) for name in self.FIELDS}
+        data.update(nps=self.nps, first_cutoff_rate=self.first_cutoff_rate, table_hit_rate=self.table_hit_rate)
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        stats = cls()
+        for name in cls.FIELDS:
+            setattr(stats, name, data[name])
+        return stats
+
+    def to_json(self, **kwargs):
+        return json.dumps(self.to_dict(), **kwargs)
+
+    def summary(self):
+        return (f"depth {self.depth} score {self.score} | {self.nodes} nodes ({self.qnodes} quiescence) "
+                f"in {self.elapsed:.2f}s, {self.nps} nps | cutoffs {self.cutoffs}, first move {self.first_cutoff_rate:.0%} | "
+                f"TT hits {self.table_hit_rate:.0%} | pv {' '.join(self.pv)}")
+
+# --- Move ordering ---
+
+# Attacker/victim values for MVV-LVA (most valuable victim, least valuable attacker), indexed by piece type
+MVV_LVA_VALUES = (1, 3, 3, 5, 9, 10)
+ORDER_FIRST = 1 << 30
+ORDER_CAPTURE = 1 << 24
+ORDER_KILLER = 1 << 22
+
+def order_moves(position, moves, search, ply, first=0):
+    # Hash/PV move, then captures and promotions by MVV-LVA, then the two killers, then quiet moves by history
+    mailbox = position.mailbox
+    killer1, killer2 = search.killers[ply]
+    history = search.history
+
+    def key(move):
+        if move == first:
+            return ORDER_FIRST
+        victim = mailbox[(move >> 6) & 63]
+        promo = (move >> 12) & 7
+        if victim != EMPTY or move & FLAG_EP or promo:
+            victim_value = MVV_LVA_VALUES[victim % 6] if victim != EMPTY else (1 if move & FLAG_EP else 0)
+            return ORDER_CAPTURE + 16 * (victim_value + MVV_LVA_VALUES[promo] * (promo != 0)) - MVV_LVA_VALUES[mailbox[move & 63] % 6]
+        if move == killer1:
+            return ORDER_KILLER + 1
+        if move == killer2:
+            return ORDER_KILLER
+        return history[mailbox[move & 63]][(move >> 6) & 63]
+
+    moves.sort(key=key, reverse=True)
+
+def _record_cutoff(position, search, move, depth, ply):
+    # Quiet moves that cause a beta cutoff become killers for this ply and earn history credit
+    to_sq = (move >> 6) & 63
+    if position.mailbox[to_sq] != EMPTY or move & (FLAG_EP | (7 << 12)):
+        return
+    killers = search.killers[ply]
+    if killers[0] != move:
+        killers[1] = killers[0]
+        killers[0] = move
+    search.history[position.mailbox[move & 63]][to_sq] += depth * depth
+
+def minimax(position, depth, alpha, beta, search=None, ply=0, allow_null=True):
+    # Negamax alpha-beta. Returns (score, move), score from the side to move's point of view.
+    # Moves are made and unmade on the one position object, nothing is copied per node.
+    # allow_null is False directly below a null move, so two passes never follow each other.
+    if search is None:
+        search = SearchContext()
+    search.nodes += 1
+    if not search.nodes & 1023 and search.out_of_time():
+        raise SearchTimeout
+    search.pv[ply] = ()
+    if ply > 0 and position.seen[position.key] > 1:
+        return 0, None  # a repeated position inside the search is scored as a draw
+    tablebases = search.tablebases
+    if ply > 0 and tablebases is not None and (position.occ[0] | position.occ[1]).bit_count() <= tablebases.max_pieces:
+        result = tablebases.probe(position)
+        if result is not None:
+            search.tablebase_hits += 1
+            wdl, plies = result
+            return wdl * (MATE_SCORE - ply - plies), None  # exact distance to mate, or 0 for a draw
+    if depth == 0:
+        if search.quiescence:
+            return quiescence(position, alpha, beta, search, ply), None
+        return evaluate_board(position, COLOR_CODES[position.side]), None
+    alpha_orig = alpha
+    table = search.table
+    table_move = 0
+    if table is not None:
+        entry = table.probe(position.key)
+        if entry:
+            table_depth, table_score, bound, table_move = entry
+            if ply > 0 and table_depth >= depth:
+                score = _score_from_table(table_score, ply)
+                if bound == BOUND_EXACT or (bound == BOUND_LOWER and score >= beta) or (bound == BOUND_UPPER and score <= alpha):
+                    table.cutoffs += 1
+                    return score, table_move
+    in_check = position.in_check()
+    # Null-move pruning: if passing the turn still leaves a shallow search at or above beta, a real move
+    # would too. Skipped in check, along the previous PV, near mate scores, and without pieces other than
+    # pawns (zugzwang, where passing would be the best move)
+    if (search.null_move and allow_null and ply > 0 and depth >= NULL_MOVE_MIN_DEPTH and not in_check
+            and not search.follow_pv and abs(beta) < MATE_SCORE - 1000):
+        us = position.side
+        bb = position.bb
+        if (position.occ[us] & ~(bb[us * 6 + PAWN] | bb[us * 6 + KING])
+                and evaluate_board(position, COLOR_CODES[us]) >= beta):
+            position.make_null_move()
+            try:
+                score = -minimax(position, depth - 1 - NULL_MOVE_REDUCTION, -beta, -beta + 1, search, ply + 1, False)[0]
+            finally:
+                position.unmake_null_move()
+            if score >= beta:
+                search.null_cutoffs += 1
+                return beta, None
+    if ply == 0 and search.root_moves is not None:
+        moves = list(search.root_moves)  # legal moves the caller already generated for this position
+    else:
+        moves = all_legal_moves(position)
+    if not moves:
+        if in_check:
+            return -(MATE_SCORE - ply), None
+        return 0, None  # Stalemate
+    # Previous iteration's principal variation first, then the stored best move
+    first = table_move
+    if search.follow_pv:
+        if ply < len(search.pv_hint) and search.pv_hint[ply] in moves:
+            first = search.pv_hint[ply]
+        else:
+            search.follow_pv = False
+    if search.ordering:
+        order_moves(position, moves, search, ply, first)
+    elif first in moves:
+        moves.remove(first)
+        moves.insert(0, first)
+    best_score = -INFINITY
+    best_move = None
+    mailbox = position.mailbox
+    killers = search.killers[ply]
+    for i, move in enumerate(moves):
+        # Late quiet moves are searched one ply shallower first (not in check, not killers)
+        reduction = int(search.lmr and i >= LMR_MIN_MOVES and depth >= LMR_MIN_DEPTH and not in_check
+                        and mailbox[(move >> 6) & 63] == EMPTY and not move & (FLAG_EP | (7 << 12))
+                        and move not in killers)
+        position.make_move(move)
+        try:
+            if i == 0 or not (search.pvs or reduction):
+                score = -minimax(position, depth-1, -beta, -alpha, search, ply+1)[0]
+            else:
+                # Later moves only need to prove they are no better than alpha: a null window if PVS is on
+                window = -alpha - 1 if search.pvs else -beta
+                if reduction and position.in_check():
+                    reduction = 0  # checking moves are searched fully
+                score = -minimax(position, depth - 1 - reduction, window, -alpha, search, ply+1)[0]
+                if reduction and score > alpha:
+                    search.researches += 1
+                    score = -minimax(position, depth-1, window, -alpha, search, ply+1)[0]
+                if search.pvs and alpha < score < beta:
+                    search.researches += 1
+                    score = -minimax(position, depth-1, -beta, -alpha, search, ply+1)[0]
+        finally:
+            position.unmake_move(move)
+        search.follow_pv = False  # only the first child can lie on the previous PV
+        if score > best_score:
+            best_score = score
+            best_move = move
+        if score > alpha:
+            alpha = score
+            search.pv[ply] = (move,) + search.pv[ply + 1]
+        if alpha >= beta:
+            search.cutoffs += 1
+            if i == 0:
+                search.first_cutoffs += 1
+            if search.ordering:
+                _record_cutoff(position, search, move, depth, ply)
+            break
+    if table is not None:
+        if best_score <= alpha_orig:
+            bound = BOUND_UPPER
+        elif best_score >= beta:
+            bound = BOUND_LOWER
+        else:
+            bound = BOUND_EXACT
+        table.store(position.key, depth, _score_to_table(best_score, ply), bound, best_move)
+    return best_score, best_move
+
+# Piece values by piece type index (P, N, B, R, Q, K) and the safety margin for delta pruning
+PIECE_TYPE_VALUES = [PIECE_VALUES[kind] for kind in 'PNBRQK']
+DELTA_MARGIN = 200
+
+def quiescence(position, alpha, beta, search, ply):
+    # Capture-only search below the horizon so leaves are never scored in the middle of an exchange.
+    # The side to move may stand pat on the static score; in check every evasion is searched instead.
+    search.nodes += 1
+    search.qnodes += 1
+    if not search.nodes & 1023 and search.out_of_time():
+        raise SearchTimeout
+    in_check = position.in_check()
+    if in_check:
+        moves = position.legal_moves()
+        if not moves:
+            return -(MATE_SCORE - ply)
+        best_score = -INFINITY
+    else:
+        stand_pat = evaluate_board(position, COLOR_CODES[position.side])
+        if stand_pat >= beta or ply >= MAX_PLY:
+            return stand_pat
+        # Delta pruning: not even winning a queen would lift the score to alpha
+        if stand_pat + PIECE_TYPE_VALUES[QUEEN] + DELTA_MARGIN < alpha:
+            return stand_pat
+        if stand_pat > alpha:
+            alpha = stand_pat
+        best_score = stand_pat
+        moves = position.legal_moves(captures_only=True)
+    order_moves(position, moves, search, ply)
+    mailbox = position.mailbox
+    for move in moves:
+        if not in_check:
+            victim = mailbox[(move >> 6) & 63]
+            if victim != EMPTY:
+                gain = PIECE_TYPE_VALUES[victim % 6]
+            else:
+                gain = PIECE_TYPE_VALUES[PAWN] if move & FLAG_EP else 0
+            if (move >> 12) & 7:
+                gain += PIECE_TYPE_VALUES[QUEEN] - PIECE_TYPE_VALUES[PAWN]
+            # Delta pruning per capture: this capture cannot raise the score to alpha
+            if stand_pat + gain + DELTA_MARGIN <= alpha:
+                continue
+        position.make_move(move)
+        try:
+            score = -quiescence(position, -beta, -alpha, search, ply + 1)
+        finally:
+            position.unmake_move(move)
+        if score > best_score:
+            best_score = score
+        if score >= beta:
+            return score
+        if score > alpha:
+            alpha = score
+    return best_score
+
+def allocate_time(remaining, increment=0, moves_to_go=None):
+    # Seconds to spend on one move: an even share of the clock plus most of the increment,
+    # never more than half of what is left
+    budget = remaining / (moves_to_go or 30) + increment * 0.8
+    return max(0.05, min(budget, remaining * 0.5 - 0.5))
+
+def iterative_deepening(position, max_depth, time_budget=None, table=None, root_moves=None, on_iteration=None,
+                        stop=None, tablebases=None, stats=None, features=None):
+    # Search depth 1, 2, 3... and return (score, move, depth) of the deepest completed iteration.
+    # Depth 1 always completes; deeper iterations are abandoned when the budget runs out or stop is set.
+    # on_iteration(depth, score, move, search) is called after every completed iteration.
+    # stats: a SearchStats filled in when the search ends, the nodes of an unfinished iteration included.
+    # features: {"null_move": False, ...} to switch selective search features off (see SEARCH_FEATURES).
+    search = SearchContext(table, tablebases=tablebases, **(features or {}))
+    search.root_moves = root_moves
+    start = search.start_time
+    best_score, best_move, completed = 0, None, 0
+    for depth in range(1, max_depth + 1):
+        search.follow_pv = True
+        iteration_start = time.perf_counter()
+        nodes, qnodes = search.nodes, search.qnodes
+        try:
+            score, move = _aspiration_search(position, depth, best_score if completed else None, search)
+        except SearchTimeout:
+            break
+        best_score, best_move, completed = score, move, depth
+        search.pv_hint = search.pv[0]
+        line = search.pv[0] or ((move,) if move else ())
+        search.iterations.append({"depth": depth, "score": score, "nodes": search.nodes - nodes,
+                                  "qnodes": search.qnodes - qnodes, "time": time.perf_counter() - iteration_start,
+                                  "pv": [move_name(m) for m in line]})
+        if on_iteration is not None:
+            on_iteration(depth, score, move, search)
+        if move is None or abs(score) > MATE_SCORE - 1000:
+            break  # no legal moves, or a forced mate was found
+        search.stop = stop
+        if stop is not None and stop.is_set():
+            break
+        if time_budget is not None:
+            elapsed = time.perf_counter() - start
+            if elapsed > time_budget * 0.5:
+                break  # the next iteration would not finish in time
+            search.deadline = start + time_budget
+    if stats is not None:
+        stats.update(search)
+    return best_score, best_move, completed
+
+def multipv_search(position, max_depth, count=3, table=None, on_iteration=None, stop=None, tablebases=None):
+    # The best `count` moves with exact scores and their lines. Every depth searches the root once per
+    # line, each time without the moves already chosen, so later lines are real scores and not bounds.
+    # on_iteration(depth, lines, search) after each completed depth, lines = [(score, pv), ...] best first.
+    # Returns the lines of the deepest completed depth.
+    moves = position.legal_moves()
+    search = SearchContext(table, tablebases=tablebases)
+    search.stop = stop
+    lines = []
+    for depth in range(1, max_depth + 1):
+        found = []
+        remaining = list(moves)
+        try:
+            while remaining and len(found) < count:
+                # The same line of the previous depth is searched first
+                hint = lines[len(found)][1] if len(found) < len(lines) else ()
+                search.pv_hint = hint if hint and hint[0] in remaining else ()
+                search.follow_pv = bool(search.pv_hint)
+                search.root_moves = remaining
+                score, move = minimax(position, depth, -INFINITY, INFINITY, search)
+                found.append((score, search.pv[0] or (move,)))
+                remaining = [m for m in remaining if m != move]
+        except SearchTimeout:
+            break
+        found.sort(key=lambda line: -line[0])
+        lines = found
+        if on_iteration is not None:
+            on_iteration(depth, lines, search)
+        if not lines or (stop is not None and stop.is_set()):
+            break
+    return lines
+
+def _aspiration_search(position, depth, previous, search):
+    # Root search in a narrow window around the previous iteration's score; a result outside it is
+    # searched again with that side of the window opened up
+    if not search.aspiration or previous is None or abs(previous) > MATE_SCORE - 1000:
+        return minimax(position, depth, -INFINITY, INFINITY, search)
+    alpha, beta = previous - ASPIRATION_WINDOW, previous + ASPIRATION_WINDOW
+    while True:
+        search.follow_pv = True
+        score, move = minimax(position, depth, alpha, beta, search)
+        if score <= alpha:
+            alpha = -INFINITY
+        elif score >= beta:
+            beta = INFINITY
+        else:
+            return score, move
+        search.researches += 1
+
+# --- Root-parallel search ---
+
+_worker_table = None  # each worker process keeps its own table between moves
+_worker_tablebases = None
+
+def _init_search_worker(hash_megabytes, tablebase_dir=None):
+    global _worker_table, _worker_tablebases
+    _worker_table = TranspositionTable(hash_megabytes)
+    if tablebase_dir is not None:
+        _worker_tablebases = Tablebases(tablebase_dir)
+
+def _search_root_share(position, root_moves, max_depth, time_budget):
+    # Runs in a worker process: iterative deepening over a share of the root moves.
+    # Returns [(depth, score, move), ...] for every completed iteration, and the search stats as a dict.
+    _worker_table.new_search()
+    iterations = []
+    stats = SearchStats()
+    iterative_deepening(position, max_depth, time_budget, _worker_table, root_moves,
+                        lambda depth, score, move, search: iterations.append((depth, score, move)),
+                        tablebases=_worker_tablebases, stats=stats)
+    return iterations, stats.to_dict()
+
+def create_search_pool(workers, hash_megabytes=16, tablebase_dir=None):
+    # Worker processes are spawned, not forked, so they never inherit the Tk connection
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                               initializer=_init_search_worker, initargs=(hash_megabytes, tablebase_dir))
+
+def parallel_search(executor, position, max_depth, time_budget=None, workers=2, moves=None, stats=None):
+    # Root-parallel search: the ordered root moves are dealt round-robin to the workers, so every share
+    # mixes strong and weak candidates. Each worker searches its share with a full window, so scores are
+    # comparable across shares. The merge uses the deepest depth every worker completed and breaks
+    # ties by root order, so the result does not depend on which process finished first. A worker that
+    # stopped on a mate score has its final result carried to deeper depths, so a share of moves that
+    # all get mated does not hold the others back to its shallow depth.
+    # moves: the position's legal moves if the caller already has them.
+    # stats: a SearchStats that receives the summed counters of all workers and the winning line.
+    moves = list(moves) if moves is not None else position.legal_moves()
+    if not moves:
+        return (-MATE_SCORE if position.in_check() else 0), None, 0
+    order_moves(position, moves, SearchContext(), 0)
+    shares = [moves[i::workers] for i in range(workers)]
+    futures = [executor.submit(_search_root_share, position, share, max_depth, time_budget)
+               for share in shares if share]
+    results = [future.result() for future in futures]
+    settled = [abs(iterations[-1][1]) > MATE_SCORE - 1000 for iterations, _ in results]
+    open_depths = [iterations[-1][0] for (iterations, _), done in zip(results, settled) if not done]
+    depth = min(open_depths) if open_depths else max(iterations[-1][0] for iterations, _ in results)
+    rank = {move: i for i, move in enumerate(moves)}
+    best_score, best_move, best_stats, best_depth = -INFINITY, None, None, 0
+    for iterations, worker_stats in results:
+        worker_depth, score, move = iterations[min(depth, len(iterations)) - 1]
+        if score > best_score or (score == best_score and rank[move] < rank[best_move]):
+            best_score, best_move, best_stats, best_depth = score, move, worker_stats, worker_depth
+    if stats is not None:
+        winner = SearchStats.from_dict(best_stats)
+        for name in SearchStats.FIELDS:
+            setattr(stats, name, getattr(winner, name))
+        stats.iterations = winner.iterations[:best_depth]
+        stats.depth, stats.score = best_depth, best_score  # a settled share may have stopped short of `depth`
+        stats.pv = winner.iterations[best_depth - 1]["pv"]
+        stats.best_move = move_name(best_move)
+        for _, worker_stats in results:
+            if worker_stats is not best_stats:
+                stats.merge(SearchStats.from_dict(worker_stats))
+    return best_score, best_move, best_depth
+
+# Fixed positions for search benchmarks: start, the standard perft positions and a quiet middlegame
+BENCH_POSITIONS = [
+    "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+    "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+    "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+    "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+    "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+    "r1bq1rk1/pp2bppp/2n1pn2/3p4/2PP4/2N1PN2/PP3PPP/R2QKB1R w KQ - 0 8",
+]
+
+def ordering_benchmark(depth=3, fens=BENCH_POSITIONS, quiescence=False):
+    # Nodes and time of a fixed-depth search with and without move ordering on each position.
+    # Quiescence is off by default so both runs search exactly the same tree shape.
+    totals = {False: [0, 0.0], True: [0, 0.0]}
+    for fen in fens:
+        line = []
+        for ordering in (False, True):
+            position = Position.from_fen(fen)
+            search = SearchContext(ordering=ordering, quiescence=quiescence)
+            start = time.perf_counter()
+            minimax(position, depth, -INFINITY, INFINITY, search)
+            elapsed = time.perf_counter() - start
+            totals[ordering][0] += search.nodes
+            totals[ordering][1] += elapsed
+            line.append(f"{search.nodes:>8} nodes {elapsed:6.2f}s")
+        print(f"{fen[:40]:<40} | unordered {line[0]} | ordered {line[1]}")
+    before, after = totals[False][0], totals[True][0]
+    print(f"total: unordered {before} nodes {totals[False][1]:.2f}s | ordered {after} nodes {totals[True][1]:.2f}s | "
+          f"{before / max(after, 1):.1f}x fewer nodes")
+    return totals
+
+
+def bench(depth=4, fens=BENCH_POSITIONS):
+    # Fixed-depth search over the bench positions; prints total nodes and nodes per second
+    nodes = 0
+    start = time.perf_counter()
+    for fen in fens:
+        search = SearchContext(TranspositionTable(16))
+        minimax(Position.from_fen(fen), depth, -INFINITY, INFINITY, search)
+        nodes += search.nodes
+    elapsed = time.perf_counter() - start
+    print(f"{nodes} nodes {elapsed:.2f}s {int(nodes / max(elapsed, 1e-9))} nps")
+    return nodes, elapsed
+
+def feature_benchmark(depth=4, fens=BENCH_POSITIONS):
+    # Nodes and time to depth on the bench positions: no selective features, each feature alone,
+    # all but one, and all of them, so each feature's effect shows both in isolation and combined
+    configs = [("none", {name: False for name in SEARCH_FEATURES})]
+    configs += [(f"only {name}", {other: other == name for other in SEARCH_FEATURES}) for name in SEARCH_FEATURES]
+    configs += [(f"all but {name}", {name: False}) for name in SEARCH_FEATURES]
+    configs.append(("all", {}))
+    results = {}
+    for label, features in configs:
+        nodes, elapsed = 0, 0.0
+        for fen in fens:
+            stats = SearchStats()
+            start = time.perf_counter()
+            iterative_deepening(Position.from_fen(fen), depth, None, TranspositionTable(16), stats=stats,
+                                features=features)
+            elapsed += time.perf_counter() - start
+            nodes += stats.nodes
+        results[label] = (nodes, elapsed)
+        base_nodes, base_time = results["none"]
+        print(f"{label:<22} {nodes:>9} nodes {elapsed:7.2f}s | {nodes / base_nodes:6.1%} of the nodes, "
+              f"{elapsed / max(base_time, 1e-9):6.1%} of the time of no features")
+    return results
+
+# --- UCI protocol ---
+
+def format_score(score):
+    # UCI score: centipawns, or moves to mate when a forced mate was found
+    if abs(score) > MATE_SCORE - 1000:
+        plies = MATE_SCORE - abs(score)
+        return f"mate {(plies + 1) // 2 if score > 0 else -((plies + 1) // 2)}"
+    return f"cp {score}"
+
+class UCIEngine:
+    # UCI front end: uci, isready, ucinewgame, setoption (Hash), position, go, stop, quit.
+    # The search runs on its own thread so stop can be read while it thinks.
+    name = "Simulation-projects Chess"
+    author = "omaressa123"
+
+    def __init__(self, out=None, hash_megabytes=16, tablebases=None):
+        self.out = out or sys.stdout
+        self.table = TranspositionTable(hash_megabytes)
+        self.tablebases = tablebases
+        self.position = Position.from_fen(START_FEN)
+        self.stop_event = threading.Event()
+        self.search_thread = None
+        self.infinite = False
+        self.output_lock = threading.Lock()
+
+    def send(self, line):
+        with self.output_lock:
+            self.out.write(line + "\n")
+            self.out.flush()
+
+    def run(self, lines=None):
+        for line in (lines if lines is not None else sys.stdin):
+            if not self.handle(line.strip()):
+                break
+        self.stop()
+
+    def handle(self, line):
+        # Returns False when the engine should exit
+        tokens = line.split()
+        if not tokens:
+            return True
+        command = tokens[0]
+        if command == "uci":
+            self.send(f"id name {self.name}")
+            self.send(f"id author {self.author}")
+            self.send("option name Hash type spin default 16 min 1 max 4096")
+            self.send("uciok")
+        elif command == "isready":
+            self.send("readyok")
+        elif command == "ucinewgame":
+            self.wait()
+            self.table.clear()
+        elif command == "setoption":
+            self.wait()
+            try:
+                self.set_option(tokens)
+            except ValueError as error:
+                self.send(f"info string {error}")
+        elif command == "position":
+            self.wait()
+            try:
+                self.set_position(tokens[1:])
+            except ValueError as error:
+                # A bad FEN or move from the GUI must not end the engine: report it and keep the old position
+                self.send(f"info string {error}")
+        elif command == "go":
+            self.wait()
+            try:
+                self.go(tokens[1:])
+            except ValueError as error:
+                self.send(f"info string {error}")  # the command is ignored, no search is started
+        elif command == "stop":
+            self.stop()
+        elif command == "quit":
+            return False
+        return True
+
+    def set_option(self, tokens):
+        # setoption name Hash value <MB>
+        if "name" in tokens and "value" in tokens:
+            name = " ".join(tokens[tokens.index("name") + 1:tokens.index("value")])
+            value = tokens[tokens.index("value") + 1]
+            if name.lower() == "hash":
+                self.table = TranspositionTable(int(value))
+
+    def set_position(self, tokens):
+        # position startpos|fen <fen> [moves <m1> <m2> ...]
+        if "moves" in tokens:
+            split = tokens.index("moves")
+            setup, moves = tokens[:split], tokens[split + 1:]
+        else:
+            setup, moves = tokens, []
+        if setup and setup[0] == "fen":
+            position = Position.from_fen(" ".join(setup[1:]))
+        else:
+            position = Position.from_fen(START_FEN)
+        for text in moves:
+            position.make_move(position.parse_move(text))
+        self.position = position  # only replaced once the whole command has been read
+
+    def go(self, tokens):
+        options = {}
+        for i, token in enumerate(tokens):
+            if token in ("depth", "movetime", "wtime", "btime", "winc", "binc", "movestogo"):
+                if i + 1 >= len(tokens):
+                    raise ValueError(f"Missing value for go {token}")
+                options[token] = int(tokens[i + 1])
+        infinite = "infinite" in tokens
+        max_depth = options.get("depth", MAX_PLY - 1)
+        budget = None
+        if "movetime" in options:
+            budget = options["movetime"] / 1000
+        elif not infinite and ("wtime" in options or "btime" in options):
+            side = "w" if COLOR_CODES[self.position.side] == "w" else "b"
+            remaining = options.get(side + "time", 0) / 1000
+            increment = options.get(side + "inc", 0) / 1000
+            budget = allocate_time(remaining, increment, options.get("movestogo"))
+        self.stop_event = threading.Event()
+        self.infinite = infinite
+        self.search_thread = threading.Thread(target=self._search, args=(self.position.copy(), max_depth, budget, infinite),
+                                              daemon=True)
+        self.search_thread.start()
+
+    def _search(self, position, max_depth, budget, infinite):
+        self.table.new_search()
+        _, move, _ = iterative_deepening(position, max_depth, budget, self.table, on_iteration=self._info,
+                                         stop=self.stop_event, tablebases=self.tablebases)
+        if infinite:
+            self.stop_event.wait()  # UCI: no bestmove before "stop" in infinite mode
+        self.send(f"bestmove {move_name(move) if move else '0000'}")
+
+    def _info(self, depth, score, move, search):
+        elapsed = time.perf_counter() - search.start_time
+        nps = int(search.nodes / max(elapsed, 1e-9))
+        pv = " ".join(move_name(m) for m in search.pv[0]) or move_name(move)
+        self.send(f"info depth {depth} score {format_score(score)} nodes {search.nodes} nps {nps} "
+                  f"time {int(elapsed * 1000)} pv {pv}")
+
+    def wait(self):
+        # Commands piped in during a search apply after it; an infinite search is stopped instead
+        if self.infinite:
+            self.stop()
+        elif self.search_thread is not None:
+            self.search_thread.join()
+            self.search_thread = None
+
+    def stop(self):
+        if self.search_thread is not None:
+            self.stop_event.set()
+            self.search_thread.join()
+            self.search_thread = None
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless chess engine (UCI protocol on stdin/stdout)")
+    parser.add_argument("--hash", type=int, default=16, metavar="MB", help="transposition table size (default 16)")
+    parser.add_argument("--tablebases", metavar="DIR", help="endgame tablebase directory (see chess_tablebase.py)")
+    parser.add_argument("--bench", type=int, metavar="DEPTH",
+                        help="search the bench positions to a fixed depth, print nodes and nps, then exit")
+    parser.add_argument("--bench-features", type=int, metavar="DEPTH",
+                        help="time to DEPTH on the bench positions with each of " + ", ".join(SEARCH_FEATURES)
+                             + " on and off, then exit")
+    args = parser.parse_args()
+    if args.bench:
+        bench(args.bench)
+        return
+    if args.bench_features:
+        feature_benchmark(args.bench_features)
+        return
+    tablebases = Tablebases(args.tablebases) if args.tablebases else None
+    UCIEngine(hash_megabytes=args.hash, tablebases=tablebases).run()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+## **PGN IMPORT AND EXPORT**
+## Reads and writes games in Portable Game Notation so they can be replayed headlessly or passed to
+## other chess programs.
+## 1- A game is its tag pairs (Event, White, Black, Result, FEN...) plus the moves in standard algebraic notation.
+## 2- read_pgn() streams the games of a file one at a time, so large collections do not have to fit in memory;
+##    comments, variations and annotation glyphs are skipped.
+## 3- replay() turns a game back into positions and encoded moves with the bitboard position.
+
+import re
+import datetime
+
+from chess_bitboard import Position, START_FEN
+
+RESULTS = ("1-0", "0-1", "1/2-1/2", "*")
+TAG_RE = re.compile(r'^\[(\w+)\s+"((?:[^"\\]|\\.)*)"\]\s*$')
+MOVE_NUMBER_RE = re.compile(r"^\d+\.+")
+TAG_ESCAPE_RE = re.compile(r"\\(.)")
+
+
+class PGNGame:
+    def __init__(self, headers=None, moves=None):
+        self.headers = dict(headers or {})  # tag pairs, in order
+        self.moves = list(moves or [])  # SAN
+
+    @property
+    def result(self):
+        return self.headers.get("Result", "*")
+
+    @property
+    def start_fen(self):
+        return self.headers.get("FEN", START_FEN)
+
+    def replay(self):
+        # (final position, encoded moves); raises ValueError on an illegal or unreadable move
+        position = Position.from_fen(self.start_fen)
+        moves = []
+        for text in self.moves:
+            move = position.parse_san(text)
+            moves.append(move)
+            position.make_move(move)
+        return position, moves
+
+    def to_pgn(self):
+        return format_pgn(self.headers, self.moves, self.result, self.start_fen)
+
+
+def default_headers(white="?", black="?", result="*", event="Casual game", start_fen=START_FEN):
+    # The seven tags every PGN game carries, plus SetUp/FEN for games from a set-up position
+    headers = {"Event": event, "Site": "local", "Date": datetime.date.today().strftime("%Y.%m.%d"),
+               "Round": "-", "White": white, "Black": black, "Result": result}
+    if start_fen != START_FEN:
+        headers["SetUp"] = "1"
+        headers["FEN"] = start_fen
+    return headers
+
+
+def _escape_tag(value):
+    # Tag values are quoted, so backslashes and quotes inside them (player names, say) are escaped
+    return str(value).replace("\\", "\\\\").replace('"', '\\"')
+
+
+def format_pgn(headers, san_moves, result="*", start_fen=START_FEN, annotations=None):
+    # Tag pairs, a blank line, then the numbered move text wrapped at 79 columns.
+    # annotations: optional text per move written after it, e.g. "$2 {-140 cp, best Nf3}"
+    fields = start_fen.split()
+    fullmove = int(fields[5]) if len(fields) > 5 else 1
+    black_first = len(fields) > 1 and fields[1] == "b"
+    tokens = []
+    for index, text in enumerate(san_moves):
+        i = index + black_first
+        if i % 2 == 0:
+            tokens.append(f"{fullmove + i // 2}.")
+        elif not tokens or tokens[-1].endswith("}"):
+            tokens.append(f"{fullmove + i // 2}...")  # black's move is numbered again after a comment
+        tokens.append(text)
+        if annotations and annotations[index]:
+            tokens.extend(annotations[index].split())
+    tokens.append(result)
+    lines, line = [], ""
+    for token in tokens:
+        if line and len(line) + len(token) + 1 > 79:
+            lines.append(line)
+            line = token
+        else:
+            line = f"{line} {token}" if line else token
+    lines.append(line)
+    tags = "\n".join(f'[{key} "{_escape_tag(value)}"]' for key, value in headers.items())
+    return tags + "\n\n" + "\n".join(lines) + "\n"
+
+
+def _strip_movetext(text):
+    # Remove {comments}, ; comments, (variations) and $n glyphs from move text
+    out = []
+    depth = 0
+    i = 0
+    while i < len(text):
+        ch = text[i]
+        if ch == "{":
+            end = text.find("}", i)
+            i = len(text) if end < 0 else end + 1
+            out.append(" ")
+            continue
+        if ch == ";":
+            end = text.find("\n", i)
+            i = len(text) if end < 0 else end
+            continue
+        if ch == "(":
+            depth += 1
+        elif ch == ")":
+            depth = max(depth - 1, 0)
+        elif not depth:
+            out.append(ch)
+        i += 1
+    return "".join(out)
+
+
+def _parse_game(tag_lines, move_lines):
+    headers = {}
+    for line in tag_lines:
+        match = TAG_RE.match(line)
+        if match:
+            headers[match.group(1)] = TAG_ESCAPE_RE.sub(r"\1", match.group(2))
+    moves = []
+    # Lines are kept apart: a ; comment only runs to the end of its own line
+    for token in _strip_movetext("\n".join(move_lines)).split():
+        if token.startswith("$"):
+            continue
+        if token in RESULTS:
+            headers.setdefault("Result", token)
+            continue
+        token = MOVE_NUMBER_RE.sub("", token)
+        if token:
+            moves.append(token)
+    return PGNGame(headers, moves)
+
+
+def iter_pgn(lines):
+    # Games from an iterable of lines
+    tag_lines, move_lines = [], []
+    for line in lines:
+        line = line.strip()
+        if line.startswith("%"):
+            continue  # escape line
+        if line.startswith("["):
+            if move_lines:
+                yield _parse_game(tag_lines, move_lines)
+                tag_lines, move_lines = [], []
+            tag_lines.append(line)
+        elif line:
+            move_lines.append(line)
+    if tag_lines or move_lines:
+        yield _parse_game(tag_lines, move_lines)
+
+
+def parse_pgn(text):
+    # All games in a PGN string
+    return list(iter_pgn(text.splitlines()))
+
+
+def read_pgn(path):
+    # Games in a PGN file, read one at a time
+    with open(path, encoding="utf-8", errors="replace") as f:
+        yield from iter_pgn(f)
+
+
+def write_pgn(path, games):
+    with open(path, "w", encoding="utf-8") as f:
+        for game in games:
+            f.write(game.to_pgn() + "\n")
@@ -0,0 +1,194 @@
+## **BATCH GAME REVIEW**
+## Finds the inaccuracies, mistakes and blunders in stored games, for example the PGN files written by
+## chess.py --save-pgn or chess_tournament.py --pgn.
+## 1- Every position of every game is searched to a fixed depth in a pool of worker processes.
+## 2- Evaluations are cached by the position's Zobrist key, so positions shared between games (openings above all)
+##    are searched only once; --cache keeps them on disk for the next run.
+## 3- Each move's centipawn loss is how much worse it is than the engine's best move, from the mover's side.
+## 4- Output: annotated PGN (NAGs and {loss, best move} comments) and/or JSON with the per-move numbers and each
+##    player's average loss; the run reports positions searched per second.
+## Example: python chess_review.py games.pgn --depth 4 --workers 4 --pgn reviewed.pgn --json review.json
+
+import json
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+from chess_bitboard import Position, WHITE, move_name
+from chess_pgn import read_pgn, format_pgn
+from chess_engine import TranspositionTable, SearchStats, iterative_deepening
+
+# Centipawn loss from which a move is marked, with its NAG ($6 ?!, $2 ?, $4 ??)
+CLASSES = (
+    (300, "blunder", "$4"),
+    (100, "mistake", "$2"),
+    (50, "inaccuracy", "$6"),
+)
+PLURALS = {"blunder": "blunders", "mistake": "mistakes", "inaccuracy": "inaccuracies"}
+LOSS_CAP = 1000  # mate scores count as this many centipawns, so one missed mate does not swamp the average
+
+_worker_table = None  # each worker keeps its table, positions of the same game often share subtrees
+
+
+def _init_review_worker(hash_megabytes):
+    global _worker_table
+    _worker_table = TranspositionTable(hash_megabytes)
+
+
+def evaluate_position(fen, depth):
+    # Runs in a worker process: (score for the side to move, best move name or None, nodes)
+    position = Position.from_fen(fen)
+    stats = SearchStats()
+    _worker_table.new_search()
+    score, move, _ = iterative_deepening(position, depth, None, _worker_table, stats=stats)
+    return score, move_name(move) if move else None, stats.nodes
+
+
+def load_cache(path):
+    # {key: (score, best move, depth searched)} of previous runs
+    try:
+        with open(path) as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return {}
+    return {int(key): (score, best, depth) for key, (score, best, depth) in data.items()}
+
+
+def save_cache(path, cache):
+    # Every entry keeps the depth it was searched to, so deeper results of earlier runs stay usable
+    with open(path, "w") as f:
+        json.dump({str(key): [score, best, depth] for key, (score, best, depth) in cache.items()}, f)
+
+
+def capped(score):
+    return max(-LOSS_CAP, min(LOSS_CAP, score))
+
+
+def classify(loss):
+    for threshold, name, nag in CLASSES:
+        if loss >= threshold:
+            return name, nag
+    return None, None
+
+
+def replay(game):
+    # [(key, fen, side to move)] of every position of the game, the start included, and the encoded moves
+    position, moves = Position.from_fen(game.start_fen), []
+    positions = [(position.key, position.fen(), position.side)]
+    for text in game.moves:
+        move = position.parse_san(text)
+        moves.append(move)
+        position.make_move(move)
+        positions.append((position.key, position.fen(), position.side))
+    return positions, moves
+
+
+def review_game(game, positions, cache):
+    # Per-move report of one game from the evaluations of its positions
+    report = []
+    totals = {WHITE: [0, 0], 1 - WHITE: [0, 0]}  # side -> [loss sum, moves]
+    for ply, san in enumerate(game.moves):
+        key, fen, side = positions[ply]
+        best_score, best, _ = cache[key]
+        after_score = -cache[positions[ply + 1][0]][0]  # the reply's evaluation, seen from the mover
+        loss = max(0, capped(best_score) - capped(after_score))
+        name, nag = classify(loss)
+        totals[side][0] += loss
+        totals[side][1] += 1
+        report.append({"ply": ply + 1, "san": san, "fen": fen, "eval": best_score, "eval_after": after_score,
+                       "best": best, "cp_loss": loss, "class": name, "nag": nag})
+    average = {color: round(loss / moves, 1) if moves else 0.0 for color, (loss, moves) in totals.items()}
+    return {"headers": game.headers, "moves": report,
+            "average_cp_loss": {"white": average[WHITE], "black": average[1 - WHITE]}}
+
+
+def annotated_pgn(game, reviewed):
+    annotations = []
+    for entry in reviewed["moves"]:
+        if entry["nag"]:
+            position = Position.from_fen(entry["fen"])
+            best = position.san(position.parse_move(entry["best"]))
+            annotations.append(f"{entry['nag']} {{{entry['class']}, -{entry['cp_loss']} cp, best {best}}}")
+        else:
+            annotations.append("")
+    headers = dict(game.headers)
+    headers["Annotator"] = "chess_review.py"
+    return format_pgn(headers, game.moves, game.result, game.start_fen, annotations)
+
+
+def review(paths, depth=4, workers=1, hash_megabytes=16, cache_path=None, log=print):
+    # Review every game of the PGN files; returns (games, reviews)
+    games, replays = [], []
+    for path in paths:
+        for game in read_pgn(path):
+            try:
+                positions, _ = replay(game)
+            except ValueError as error:
+                log(f"skipping {game.headers.get('White', '?')} - {game.headers.get('Black', '?')}: {error}")
+                continue
+            games.append(game)
+            replays.append(positions)
+    cache = load_cache(cache_path) if cache_path else {}
+    pending = {}
+    total = 0
+    for positions in replays:
+        for key, fen, _ in positions:
+            total += 1
+            if key not in cache or cache[key][2] < depth:  # shallower entries are searched again
+                pending.setdefault(key, fen)
+    log(f"{len(games)} games, {total} positions, {len(pending)} to search at depth {depth} "
+        f"({total - len(pending)} repeated or cached)")
+    nodes = 0
+    started = time.perf_counter()
+    if pending:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_review_worker,
+                                 initargs=(hash_megabytes,)) as executor:
+            keys = list(pending)
+            results = executor.map(evaluate_position, [pending[key] for key in keys], [depth] * len(keys),
+                                   chunksize=max(1, min(32, len(keys) // (workers * 4))))
+            for done, (key, (score, best, searched)) in enumerate(zip(keys, results), 1):
+                cache[key] = (score, best, depth)
+                nodes += searched
+                if done % 200 == 0:
+                    log(f"  {done}/{len(keys)} positions")
+    elapsed = time.perf_counter() - started
+    log(f"searched {len(pending)} positions in {elapsed:.1f}s: {len(pending) / max(elapsed, 1e-9):.1f} positions/sec, "
+        f"{nodes / max(elapsed, 1e-9):.0f} nodes/sec")
+    if cache_path and pending:
+        save_cache(cache_path, cache)
+    reviews = [review_game(game, positions, cache) for game, positions in zip(games, replays)]
+    return games, reviews
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Annotate stored games with the centipawn loss of every move")
+    parser.add_argument("files", nargs="+", metavar="PGN", help="games to review")
+    parser.add_argument("--depth", type=int, default=4, help="search depth per position (default 4)")
+    parser.add_argument("--workers", type=int, default=1, help="worker processes (default 1)")
+    parser.add_argument("--hash", type=int, default=16, metavar="MB", help="transposition table per worker (default 16)")
+    parser.add_argument("--cache", metavar="FILE", help="JSON file of evaluations kept between runs")
+    parser.add_argument("--pgn", metavar="FILE", help="write the games annotated with NAGs and comments")
+    parser.add_argument("--json", metavar="FILE", help="write the per-move report as JSON")
+    args = parser.parse_args()
+    games, reviews = review(args.files, args.depth, args.workers, args.hash, args.cache)
+    for reviewed in reviews:
+        headers = reviewed["headers"]
+        counts = {}
+        for entry in reviewed["moves"]:
+            if entry["class"]:
+                counts[entry["class"]] = counts.get(entry["class"], 0) + 1
+        summary = ", ".join(f"{count} {name if count == 1 else PLURALS[name]}" for name, count in counts.items()) or "clean"
+        print(f"{headers.get('White', '?')} - {headers.get('Black', '?')} {headers.get('Result', '*')}: "
+              f"average loss white {reviewed['average_cp_loss']['white']} cp, "
+              f"black {reviewed['average_cp_loss']['black']} cp; {summary}")
+    if args.pgn:
+        with open(args.pgn, "w") as f:
+            for game, reviewed in zip(games, reviews):
+                f.write(annotated_pgn(game, reviewed) + "\n")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(reviews, f, indent=1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,405 @@
+## **ENDGAME TABLEBASES**
+## Exact results for positions with 3 or 4 pieces (kings included), so the search and the game's
+## end-of-game checks look endgames up instead of searching them.
+## 1- A table covers one material signature, e.g. KQK or KRKP (white pieces, then black pieces).
+##    Positions where black has the stronger material are looked up colour-flipped.
+## 2- Every position gets one byte: 0 draw, odd n = side to move mates in n plies,
+##    even n = side to move is mated in n - 2 plies, 255 = illegal position.
+## 3- Tables are generated by retrograde analysis: checkmates first, then positions one ply further
+##    from mate at a time, walking moves backwards from each solved position. Captures and
+##    promotions lead into smaller (or different) tables, which are generated first.
+## 4- Board symmetry keeps the files small: the white king is kept in the a8-d5 quarter of the
+##    board (pawnless tables) or on files a-d (tables with pawns).
+## 5- Castling rights and en passant are not covered: positions that have them are not probed, and
+##    a double pawn push in a pawn-vs-pawn table is scored as if it could not be taken en passant.
+## 6- `python chess_tablebase.py --build` writes the 3-piece tables into tablebases/;
+##    `--build KQKR KRKP ...` generates 4-piece tables (several minutes each); `--probe FEN` looks one up.
+
+import os
+import sys
+import mmap
+import time
+import argparse
+from itertools import product
+
+from chess_bitboard import (Position, WHITE, BLACK, PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING, PIECE_TYPES,
+                            KNIGHT_ATTACKS, KING_ATTACKS, rook_attacks, bishop_attacks, iter_bits, move_name)
+
+TB_MAGIC = b"CHSTB001"
+TB_MAX_PIECES = 4
+DEFAULT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tablebases")
+THREE_PIECE_TABLES = ["KQK", "KRK", "KBK", "KNK", "KPK"]
+ILLEGAL = 255
+DRAW = 0
+
+# Squares the white king is kept on, and the matching index of each square (-1 elsewhere)
+PAWNLESS_REGION = [r * 8 + c for r in range(4) for c in range(4)]
+PAWN_REGION = [r * 8 + c for r in range(8) for c in range(4)]
+
+
+def _region_index(region):
+    index = [-1] * 64
+    for i, sq in enumerate(region):
+        index[sq] = i
+    return index
+
+
+def _side_strength(types):
+    # Orders the two sides of a signature: more pieces first, then stronger pieces
+    return len(types), sorted(types, reverse=True)
+
+
+def signature(pieces):
+    # Table name for a list of pieces, e.g. KQKR, plus whether it has to be looked up colour-flipped
+    white = sorted((p for p in pieces if p < 6 and p != KING), reverse=True)
+    black = sorted((p - 6 for p in pieces if p >= 6 and p != 6 + KING), reverse=True)
+    flip = _side_strength(white) < _side_strength(black)
+    if flip:
+        white, black = black, white
+    name = 'K' + ''.join(PIECE_TYPES[t] for t in white) + 'K' + ''.join(PIECE_TYPES[t] for t in black)
+    return name, flip
+
+
+def _parse_name(name):
+    # 'KQKR' -> pieces in table slot order: white king, black king, white pieces, black pieces
+    name = name.upper()
+    second = name.find('K', 1)
+    if not name.startswith('K') or second < 0 or any(ch not in 'QRBNP' for ch in name[1:second] + name[second + 1:]):
+        raise ValueError(f"Invalid table name: {name!r}")
+    white = [PIECE_TYPES.index(ch) for ch in name[1:second]]
+    black = [PIECE_TYPES.index(ch) + 6 for ch in name[second + 1:]]
+    pieces = [KING, 6 + KING] + white + black
+    if len(pieces) > TB_MAX_PIECES:
+        raise ValueError(f"{name}: tables go up to {TB_MAX_PIECES} pieces")
+    if signature(pieces) != (name, False):
+        raise ValueError(f"{name}: write the stronger side first ({signature(pieces)[0]})")
+    return pieces
+
+
+class Table:
+    # One material signature: index <-> squares, and the value byte per position
+    def __init__(self, name, values=None):
+        self.name = name
+        self.pieces = _parse_name(name)
+        self.count = len(self.pieces)
+        self.pawns = any(p % 6 == PAWN for p in self.pieces)
+        self.region = PAWN_REGION if self.pawns else PAWNLESS_REGION
+        self.region_index = _region_index(self.region)
+        self.shift = 6 * (self.count - 1)
+        self.size = 2 * len(self.region) << self.shift
+        self.values = values
+
+    def canonical(self, squares):
+        # Reflect the board so the white king lands in the table's region
+        wk = squares[0]
+        mask = 0
+        if wk & 7 > 3:
+            mask = 7  # mirror files
+        if not self.pawns and wk >> 3 > 3:
+            mask |= 56  # mirror ranks
+        if mask:
+            return [sq ^ mask for sq in squares]
+        return squares
+
+    def index(self, squares, side):
+        # squares in slot order, already canonical
+        idx = side * len(self.region) + self.region_index[squares[0]]
+        for sq in squares[1:]:
+            idx = (idx << 6) | sq
+        return idx
+
+    def squares(self, idx):
+        rest = []
+        for _ in range(self.count - 1):
+            rest.append(idx & 63)
+            idx >>= 6
+        rest.reverse()
+        side, wk = divmod(idx, len(self.region))
+        return [self.region[wk]] + rest, side
+
+    def value(self, squares, side):
+        return self.values[self.index(self.canonical(squares), side)]
+
+
+def _position(pieces, squares, side):
+    # Bare position (no castling, en passant, key or score) for move generation
+    pos = Position()
+    for piece, sq in zip(pieces, squares):
+        bit = 1 << sq
+        pos.bb[piece] |= bit
+        pos.occ[piece // 6] |= bit
+        pos.mailbox[sq] = piece
+    pos.side = side
+    return pos
+
+
+def decode(value):
+    # Table byte -> (wdl, plies) for the side to move: wdl 1 win, 0 draw, -1 loss
+    if value == DRAW:
+        return 0, 0
+    if value & 1:
+        return 1, value
+    return -1, value - 2
+
+
+class Tablebases:
+    # Tables are loaded (memory-mapped) from directory the first time they are needed
+    def __init__(self, directory=DEFAULT_DIR):
+        self.directory = directory
+        self.tables = {}
+        self.max_pieces = TB_MAX_PIECES
+        self.hits = 0
+
+    def path(self, name):
+        return os.path.join(self.directory, name + ".tb")
+
+    def table(self, name):
+        # The named table, or None if it has not been generated
+        if name not in self.tables:
+            self.tables[name] = self._load(name)
+        return self.tables[name]
+
+    def _load(self, name):
+        path = self.path(name)
+        if not os.path.exists(path):
+            return None
+        table = Table(name)
+        with open(path, "rb") as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if data[:8] != TB_MAGIC or data[8:16].rstrip(b"\0").decode() != name or len(data) != 16 + table.size:
+            data.close()
+            raise ValueError(f"{path}: not a tablebase file for {name}")
+        table.values = memoryview(data)[16:]
+        return table
+
+    def raw_value(self, pieces, squares, side):
+        # Value byte for any piece list, or None if the table is missing
+        if len(pieces) == 2:
+            return DRAW  # bare kings
+        name, flip = signature(pieces)
+        if flip:
+            pieces = [p - 6 if p >= 6 else p + 6 for p in pieces]
+            squares = [sq ^ 56 for sq in squares]
+            side ^= 1
+        table = self.table(name)
+        if table is None:
+            return None
+        # Deal the squares out to the table's slots
+        by_piece = {}
+        for piece, sq in zip(pieces, squares):
+            by_piece.setdefault(piece, []).append(sq)
+        slots = [by_piece[piece].pop() for piece in table.pieces]
+        return table.value(slots, side)
+
+    def probe(self, position):
+        # (wdl, plies) for the side to move, or None if the position is not covered
+        occ = position.occ[0] | position.occ[1]
+        if occ.bit_count() > self.max_pieces or position.castling or position.ep >= 0:
+            return None
+        squares = list(iter_bits(occ))
+        value = self.raw_value([position.mailbox[sq] for sq in squares], squares, position.side)
+        if value is None or value == ILLEGAL:
+            return None
+        self.hits += 1
+        return decode(value)
+
+    def best_move(self, position):
+        # The fastest win, else a drawing move, else the longest resistance; None if not covered
+        if self.probe(position) is None:
+            return None
+        best, best_rank = None, None
+        for move in position.legal_moves():
+            position.make_move(move)
+            result = self.probe(position)
+            position.unmake_move(move)
+            if result is None:
+                return None
+            wdl, plies = result
+            # The child is scored for the opponent: their loss is our win
+            rank = (-wdl, plies if wdl < 0 else -plies)
+            if best_rank is None or rank > best_rank:
+                best, best_rank = move, rank
+        return best
+
+    def generate(self, name, log=print):
+        # Generate a table (and any smaller tables it depends on) and write it to the directory
+        pieces = _parse_name(name)
+        for sub in _dependencies(pieces):
+            if self.table(sub) is None:
+                self.generate(sub, log)
+        start = time.perf_counter()
+        table = Table(name, bytearray(Table(name).size))
+        _retrograde(self, table)
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self.path(name), "wb") as f:
+            f.write(TB_MAGIC + name.encode().ljust(8, b"\0"))
+            f.write(table.values)
+        self.tables[name] = table
+        values = table.values
+        wins = sum(1 for v in values if v != ILLEGAL and v & 1)
+        losses = sum(1 for v in values if v != ILLEGAL and v and not v & 1)
+        draws = values.count(DRAW)
+        longest = max((v for v in values if v != ILLEGAL and v & 1), default=0)
+        log(f"{name}: {wins} wins, {losses} losses, {draws} draws, longest mate {longest} plies "
+            f"({time.perf_counter() - start:.1f}s)")
+        return table
+
+
+def _dependencies(pieces):
+    # Tables reached by a capture or a promotion
+    subs = set()
+    for i in range(2, len(pieces)):
+        rest = pieces[:i] + pieces[i + 1:]
+        if len(rest) > 2:
+            subs.add(signature(rest)[0])
+        if pieces[i] % 6 == PAWN:
+            for promo in (QUEEN, ROOK, BISHOP, KNIGHT):
+                subs.add(signature(pieces[:i] + [pieces[i] - PAWN + promo] + pieces[i + 1:])[0])
+    return sorted(subs)
+
+
+def _retrograde(tablebases, table):
+    pieces = table.pieces
+    count = table.count
+    values = table.values
+    pending = bytearray(table.size)  # quiet moves not yet known to lose
+    exit_max = bytearray(table.size)  # longest loss through a capture/promotion, NO_LOSS if one holds
+    NO_LOSS = 255
+    buckets = [[] for _ in range(256)]  # buckets[n]: positions decided n plies from mate
+
+    # Pass 1: legality, checkmates, moves into other tables, and a quiet-move count per position
+    for side in (WHITE, BLACK):
+        for wk in table.region:
+            for rest in product(range(64), repeat=count - 1):
+                squares = [wk, *rest]
+                idx = table.index(squares, side)
+                if len(set(squares)) < count or KING_ATTACKS[wk] >> rest[0] & 1:
+                    values[idx] = ILLEGAL
+                    continue
+                if any(p % 6 == PAWN and not 8 <= sq < 56 for p, sq in zip(pieces, squares)):
+                    values[idx] = ILLEGAL
+                    continue
+                pos = _position(pieces, squares, side)
+                if pos.is_attacked(squares[side ^ 1], side):
+                    values[idx] = ILLEGAL  # the side not to move is in check
+                    continue
+                moves = pos.legal_moves()
+                if not moves:
+                    if pos.in_check():
+                        buckets[0].append(idx)
+                    continue  # stalemate stays a draw
+                quiet = 0
+                for move in moves:
+                    from_sq = move & 63
+                    to_sq = (move >> 6) & 63
+                    promo = (move >> 12) & 7
+                    slot = squares.index(from_sq)
+                    captured = pos.mailbox[to_sq]
+                    if captured < 0 and not promo:
+                        quiet += 1
+                        continue
+                    child_pieces = pieces[:]
+                    child_squares = squares[:]
+                    child_squares[slot] = to_sq
+                    if promo:
+                        child_pieces[slot] = side * 6 + promo
+                    if captured >= 0:
+                        gone = squares.index(to_sq)
+                        del child_pieces[gone], child_squares[gone]
+                    value = tablebases.raw_value(child_pieces, child_squares, side ^ 1)
+                    if value == DRAW:
+                        exit_max[idx] = NO_LOSS
+                    elif value & 1:
+                        exit_max[idx] = max(exit_max[idx], value)  # the opponent wins in value plies (NO_LOSS stays)
+                    else:
+                        buckets[value - 1].append(idx)  # the opponent is mated in value - 2 plies
+                        exit_max[idx] = NO_LOSS
+                pending[idx] = quiet
+                if not quiet and exit_max[idx] != NO_LOSS:
+                    buckets[exit_max[idx] + 1].append(idx)
+
+    # Pass 2: settle positions in order of distance to mate, un-making moves from each one
+    for level in range(255):
+        for idx in buckets[level]:
+            if values[idx] != DRAW:
+                continue
+            values[idx] = level if level & 1 else level + 2
+            for pred in _predecessors(table, idx):
+                if values[pred] != DRAW:
+                    continue
+                if not level & 1:
+                    buckets[level + 1].append(pred)  # a move into a lost position wins
+                else:
+                    pending[pred] -= 1
+                    if not pending[pred] and exit_max[pred] != NO_LOSS:
+                        buckets[max(level, exit_max[pred]) + 1].append(pred)
+        buckets[level] = None
+
+
+def _predecessors(table, idx):
+    # Positions one quiet move before this one (by the side that is not to move here)
+    squares, side = table.squares(idx)
+    mover = side ^ 1
+    occ = 0
+    for sq in squares:
+        occ |= 1 << sq
+    empty = ~occ
+    result = []
+    for slot, piece in enumerate(table.pieces):
+        if piece // 6 != mover:
+            continue
+        to_sq = squares[slot]
+        kind = piece % 6
+        if kind == PAWN:
+            step = 8 if mover == WHITE else -8
+            origins = []
+            back = to_sq + step
+            if 8 <= back < 56 and empty >> back & 1:
+                origins.append(back)
+                start_row = 4 if mover == WHITE else 3
+                if to_sq >> 3 == start_row and empty >> (back + step) & 1:
+                    origins.append(back + step)
+        elif kind == KNIGHT:
+            origins = iter_bits(KNIGHT_ATTACKS[to_sq] & empty)
+        elif kind == KING:
+            origins = iter_bits(KING_ATTACKS[to_sq] & empty)
+        else:
+            attacks = 0
+            if kind in (ROOK, QUEEN):
+                attacks |= rook_attacks(to_sq, occ)
+            if kind in (BISHOP, QUEEN):
+                attacks |= bishop_attacks(to_sq, occ)
+            origins = iter_bits(attacks & empty)
+        for from_sq in origins:
+            before = squares[:]
+            before[slot] = from_sq
+            result.append(table.index(table.canonical(before), mover))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate or probe the endgame tablebases")
+    parser.add_argument("--build", nargs="*", metavar="NAME",
+                        help="generate tables, e.g. KQKR KRKP (default: all 3-piece tables)")
+    parser.add_argument("--dir", default=DEFAULT_DIR, help="tablebase directory (default tablebases/)")
+    parser.add_argument("--probe", metavar="FEN", help="look a position up")
+    args = parser.parse_args()
+    tablebases = Tablebases(args.dir)
+    if args.build is not None:
+        for name in args.build or THREE_PIECE_TABLES:
+            tablebases.generate(name.upper())
+    if args.probe:
+        position = Position.from_fen(args.probe)
+        result = tablebases.probe(position)
+        if result is None:
+            print("position not covered by the tablebases in", args.dir)
+            sys.exit(1)
+        wdl, plies = result
+        print(["loss", "draw", "win"][wdl + 1] + (f", mate in {plies} plies" if wdl else ""))
+        move = tablebases.best_move(position)
+        if move is not None:
+            print("best move", move_name(move))
+
+
+if __name__ == "__main__":
+    main()
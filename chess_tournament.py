@@ -0,0 +1,257 @@
+## **SELF-PLAY TOURNAMENT**
+## Plays the chess AI against itself without the GUI, to measure whether an engine change is an improvement.
+## 1- Two engine settings (search depth, time per move or a clock, evaluation tables) play a match;
+##    every opening is played twice with colours reversed so neither side gets the better openings.
+## 2- Games run in parallel, one per worker process.
+## 3- Games end by checkmate, stalemate, threefold repetition, the 50-move rule, insufficient material,
+##    loss on time, or are adjudicated drawn after --max-plies.
+## 4- The report gives the score, the Elo difference with a 95% error bar, and nodes/sec for each engine;
+##    --pgn writes every game out for replay in any chess program.
+## Example: python chess_tournament.py --games 40 --workers 4 --engine name=d3,depth=3 --engine name=d4,depth=4
+
+import json
+import math
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from chess_bitboard import Position, START_FEN, WHITE, KNIGHT, BISHOP
+from chess_book import OPENING_LINES
+from chess_pgn import default_headers, format_pgn
+from chess_engine import (PIECE_VALUES, PIECE_SQUARE_TABLES, set_evaluation_tables, TranspositionTable,
+                          iterative_deepening, allocate_time, SearchStats, SEARCH_FEATURES)
+
+MAX_SEARCH_DEPTH = 64
+
+
+class EngineConfig:
+    # One side of the match: name, search limits and optional evaluation overrides
+    def __init__(self, name, depth=None, movetime=None, base=None, increment=0.0, hash_megabytes=16,
+                 values=None, features=None):
+        self.name = name
+        if depth is None:
+            depth = MAX_SEARCH_DEPTH if movetime or base else 3  # some limit is needed
+        self.depth = depth
+        self.movetime = movetime  # seconds per move
+        self.base = base  # seconds on the clock at the start (with increment per move)
+        self.increment = increment
+        self.hash_megabytes = hash_megabytes
+        self.features = dict(features or {})  # selective search features switched off, e.g. {"lmr": False}
+        self.piece_values = dict(PIECE_VALUES)
+        self.piece_square_tables = dict(PIECE_SQUARE_TABLES)
+        if values:
+            # JSON file with "piece_values" and/or "piece_square_tables", merged over the defaults
+            with open(values) as f:
+                overrides = json.load(f)
+            self.piece_values.update(overrides.get("piece_values", {}))
+            self.piece_square_tables.update(overrides.get("piece_square_tables", {}))
+
+    @classmethod
+    def parse(cls, text):
+        # "name=A,depth=4,movetime=0.5,tc=60+0.5,hash=32,values=tuned.json,lmr=off"
+        options = dict(item.split("=", 1) for item in text.split(",") if item)
+        config = {"name": options.pop("name", text)}
+        if "depth" in options:
+            config["depth"] = int(options.pop("depth"))
+        if "movetime" in options:
+            config["movetime"] = float(options.pop("movetime"))
+        if "tc" in options:
+            base, _, increment = options.pop("tc").partition("+")
+            config["base"] = float(base)
+            config["increment"] = float(increment or 0)
+        if "hash" in options:
+            config["hash_megabytes"] = int(options.pop("hash"))
+        if "values" in options:
+            config["values"] = options.pop("values")
+        features = {name: options.pop(name).lower() not in ("0", "off", "false", "no")
+                    for name in SEARCH_FEATURES if name in options}
+        if features:
+            config["features"] = features
+        if options:
+            raise ValueError(f"Unknown engine options: {', '.join(options)}")
+        return cls(**config)
+
+    def use_evaluation(self, position):
+        # The running score in a position depends on the tables, so recompute it after switching
+        set_evaluation_tables(self.piece_values, self.piece_square_tables)
+        position.score = position.compute_score()
+
+
+def load_openings(path=None, plies=6):
+    # Start positions: lines of a file (a FEN, or moves like "e2e4 e7e5") or the opening book's main lines
+    if path:
+        with open(path) as f:
+            lines = [line.strip() for line in f if line.strip() and not line.startswith("#")]
+    else:
+        lines = sorted({" ".join(line.split()[:plies]) for line in OPENING_LINES})
+    openings = []
+    for line in lines:
+        if "/" in line:
+            openings.append((line, []))
+        else:
+            openings.append((START_FEN, line.split()))
+    return openings
+
+
+def insufficient_material(position):
+    # Bare kings, or a single knight or bishop against a bare king
+    bb = position.bb
+    occ = position.occ[0] | position.occ[1]
+    count = occ.bit_count()
+    if count == 2:
+        return True
+    minors = bb[KNIGHT] | bb[BISHOP] | bb[6 + KNIGHT] | bb[6 + BISHOP]
+    return count == 3 and minors != 0
+
+
+def play_game(white, black, fen, opening_moves, max_plies=400):
+    # Play one game; returns a dict with the result, moves (SAN) and per-engine node/time totals
+    position = Position.from_fen(fen)
+    san = []
+    for text in opening_moves:
+        move = position.parse_move(text)
+        san.append(position.san(move))
+        position.make_move(move)
+    engines = (white, black)
+    tables = [TranspositionTable(engine.hash_megabytes) for engine in engines]
+    clocks = [engine.base for engine in engines]
+    nodes = [0, 0]
+    think = [0.0, 0.0]
+    result, termination = "1/2-1/2", "max plies"
+    while len(san) < max_plies:
+        legal = position.legal_moves()
+        if not legal:
+            if position.in_check():
+                result = "0-1" if position.side == WHITE else "1-0"
+                termination = "checkmate"
+            else:
+                termination = "stalemate"
+            break
+        if position.repetitions() >= 3:
+            termination = "threefold repetition"
+            break
+        if position.halfmove >= 100:
+            termination = "50-move rule"
+            break
+        if insufficient_material(position):
+            termination = "insufficient material"
+            break
+        side = position.side
+        engine = engines[side]
+        budget = engine.movetime
+        if clocks[side] is not None:
+            budget = allocate_time(clocks[side], engine.increment)
+        engine.use_evaluation(position)
+        tables[side].new_search()
+        stats = SearchStats()  # counts the nodes of an unfinished last iteration too
+        started = time.perf_counter()
+        _, move, _ = iterative_deepening(position.copy(), engine.depth, budget, tables[side], legal, stats=stats,
+                                         features=engine.features)
+        elapsed = time.perf_counter() - started
+        nodes[side] += stats.nodes
+        think[side] += elapsed
+        if clocks[side] is not None:
+            clocks[side] -= elapsed
+            if clocks[side] < 0:
+                result = "0-1" if side == WHITE else "1-0"
+                termination = "time forfeit"
+                break
+            clocks[side] += engine.increment
+        san.append(position.san(move))
+        position.make_move(move)
+    return {"white": white.name, "black": black.name, "fen": fen, "result": result,
+            "termination": termination, "san": san, "nodes": nodes, "time": think}
+
+
+def game_pgn(game, round_number, event="Self-play match"):
+    headers = default_headers(game["white"], game["black"], game["result"], event, game["fen"])
+    headers["Round"] = str(round_number)
+    headers["Termination"] = game["termination"]
+    return format_pgn(headers, game["san"], game["result"], game["fen"])
+
+
+def elo_difference(wins, draws, losses):
+    # Elo difference implied by the score, and the half-width of its 95% confidence interval
+    games = wins + draws + losses
+    if not games:
+        return 0.0, float("inf")
+    score = (wins + 0.5 * draws) / games
+    variance = (wins * (1 - score) ** 2 + draws * (0.5 - score) ** 2 + losses * score ** 2) / games
+    margin = 1.96 * math.sqrt(variance / games)
+
+    def elo(s):
+        s = min(max(s, 1e-6), 1 - 1e-6)
+        return -400 * math.log10(1 / s - 1)
+
+    if variance == 0:
+        return elo(score), float("inf")  # every game had the same result: no spread to measure the error from
+    return elo(score), (elo(score + margin) - elo(score - margin)) / 2
+
+
+def run_match(engine_a, engine_b, games, workers=1, openings=None, max_plies=400, pgn_path=None, log=print):
+    openings = openings or load_openings()
+    schedule = []
+    for i in range(games):
+        fen, opening_moves = openings[(i // 2) % len(openings)]
+        if i % 2 == 0:
+            schedule.append((engine_a, engine_b, fen, opening_moves))
+        else:
+            schedule.append((engine_b, engine_a, fen, opening_moves))
+    wins = draws = losses = 0
+    nodes = {engine_a.name: 0, engine_b.name: 0}
+    think = {engine_a.name: 0.0, engine_b.name: 0.0}
+    results = [None] * games
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(play_game, *task, max_plies): i for i, task in enumerate(schedule)}
+        for done, future in enumerate(as_completed(futures), 1):
+            game = future.result()
+            results[futures[future]] = game
+            for side, name in enumerate((game["white"], game["black"])):
+                nodes[name] += game["nodes"][side]
+                think[name] += game["time"][side]
+            if game["result"] == "1/2-1/2":
+                draws += 1
+            elif (game["result"] == "1-0") == (game["white"] == engine_a.name):
+                wins += 1
+            else:
+                losses += 1
+            log(f"game {done}/{games}: {game['white']} vs {game['black']} {game['result']} ({game['termination']}, "
+                f"{len(game['san'])} plies) | {engine_a.name} +{wins} ={draws} -{losses}")
+    elapsed = time.perf_counter() - started
+    elo, margin = elo_difference(wins, draws, losses)
+    log(f"{engine_a.name} vs {engine_b.name}: +{wins} ={draws} -{losses} in {elapsed:.1f}s, "
+        f"score {(wins + 0.5 * draws) / max(games, 1):.3f}, Elo {elo:+.1f} +/- {margin:.1f}")
+    for name in (engine_a.name, engine_b.name):
+        log(f"  {name}: {nodes[name]} nodes, {nodes[name] / max(think[name], 1e-9):.0f} nodes/sec")
+    if pgn_path:
+        with open(pgn_path, "w") as f:
+            for round_number, game in enumerate(results, 1):
+                f.write(game_pgn(game, round_number) + "\n")
+        log(f"wrote {games} games to {pgn_path}")
+    return {"wins": wins, "draws": draws, "losses": losses, "elo": elo, "margin": margin,
+            "nodes": nodes, "time": think, "games": results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Play the chess AI against itself and report the Elo difference")
+    parser.add_argument("--engine", action="append", default=[], metavar="SPEC",
+                        help="engine settings, twice: name=A,depth=N,movetime=SECONDS,tc=BASE+INC,hash=MB,values=FILE.json, "
+                             "and null_move/lmr/pvs/aspiration=on|off")
+    parser.add_argument("--games", type=int, default=20, help="number of games (default 20)")
+    parser.add_argument("--workers", type=int, default=1, help="games played in parallel (default 1)")
+    parser.add_argument("--openings", metavar="FILE", help="one FEN or move line per line (default: opening book lines)")
+    parser.add_argument("--max-plies", type=int, default=400, help="adjudicate a draw after this many plies (default 400)")
+    parser.add_argument("--pgn", metavar="FILE", help="write the games as PGN")
+    args = parser.parse_args()
+    specs = args.engine or ["name=depth2,depth=2", "name=depth3,depth=3"]
+    if len(specs) != 2:
+        parser.error("give exactly two --engine settings")
+    engine_a, engine_b = (EngineConfig.parse(spec) for spec in specs)
+    if engine_a.name == engine_b.name:
+        parser.error("the two engines need different names")
+    run_match(engine_a, engine_b, args.games, args.workers, load_openings(args.openings), args.max_plies, args.pgn)
+
+
+if __name__ == "__main__":
+    main()
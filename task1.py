@@ -1,8 +1,119 @@
+import math
 import tkinter as tk
 from tkinter import ttk, messagebox
 import numpy as np
 import matplotlib.pyplot as plt
 
+# Bits per symbol of each modulation
+BITS_PER_SYMBOL = {"BPSK": 1, "QPSK": 2}
+
+# Largest number of noise samples held at once by the BER simulation (per chunk, all Eb/N0 points together)
+BER_CHUNK_SAMPLES = 1 << 22
+
+def modulate(mod_type, bits):
+    """
+    Map bits to unit-energy symbols.
+
+    Arguments:
+    mod_type -- "BPSK" or "QPSK" (str)
+    bits     -- 0/1 array; for QPSK the last axis has even length
+
+    Returns:
+    symbols -- BPSK: -1/+1 per bit; QPSK: Gray-coded complex symbol per bit pair
+               (00 -> (1+1j)/sqrt2, 01 -> (1-1j)/sqrt2, 10 -> (-1+1j)/sqrt2, 11 -> (-1-1j)/sqrt2)
+    """
+    if mod_type == "BPSK":
+        return 2 * bits.astype(np.int8) - 1
+    elif mod_type == "QPSK":
+        levels = 1 - 2 * bits.astype(np.float32)
+        return (levels[..., 0::2] + 1j * levels[..., 1::2]) / np.sqrt(2)
+    raise ValueError("Unknown modulation")
+
+def demodulate(mod_type, received):
+    """
+    Hard decisions on received symbols (the inverse of modulate for noiseless input).
+
+    Arguments:
+    mod_type -- "BPSK" or "QPSK" (str)
+    received -- received symbols, any leading axes (e.g. one row per Eb/N0 point)
+
+    Returns:
+    bits -- 0/1 array (uint8); QPSK gives two bits per symbol along the last axis
+    """
+    if mod_type == "BPSK":
+        return (received > 0).astype(np.uint8)
+    elif mod_type == "QPSK":
+        bits = np.empty(received.shape[:-1] + (2 * received.shape[-1],), dtype=np.uint8)
+        bits[..., 0::2] = received.real < 0
+        bits[..., 1::2] = received.imag < 0
+        return bits
+    raise ValueError("Unknown modulation")
+
+def theoretical_ber(mod_type, ebn0_db):
+    """
+    Bit error rate over AWGN with coherent detection: Q(sqrt(2 Eb/N0)).
+    Gray-coded QPSK has the same BER per bit as BPSK.
+
+    Arguments:
+    mod_type -- "BPSK" or "QPSK" (str)
+    ebn0_db  -- Eb/N0 values in dB (array-like)
+
+    Returns:
+    ber -- theoretical bit error rate for each Eb/N0 (np.ndarray)
+    """
+    if mod_type not in BITS_PER_SYMBOL:
+        raise ValueError("Unknown modulation")
+    ebn0 = 10 ** (np.asarray(ebn0_db, dtype=float) / 10)
+    return np.array([0.5 * math.erfc(math.sqrt(x)) for x in ebn0.ravel()]).reshape(ebn0.shape)
+
+def simulate_ber(mod_type, ebn0_db, n_bits, chunk_samples=BER_CHUNK_SAMPLES, seed=None, progress=None):
+    """
+    Monte Carlo bit error rate over AWGN for a whole grid of Eb/N0 values.
+
+    Each chunk of random bits is modulated once and sent through every Eb/N0 point at the same
+    time (one row of noise per point), so the sweep is a single vectorised computation per chunk.
+    Chunks keep memory bounded by chunk_samples, so 10^8 bits or more can be simulated.
+
+    Arguments:
+    mod_type      -- "BPSK" or "QPSK" (str)
+    ebn0_db       -- Eb/N0 values in dB (array-like)
+    n_bits        -- bits to simulate at every Eb/N0 point (int)
+    chunk_samples -- most noise samples held at once, all points together (int)
+    seed          -- random seed for repeatable runs (int or None)
+    progress      -- optional callback(bits_done, n_bits) after each chunk
+
+    Returns:
+    ber    -- measured bit error rate per Eb/N0 point (np.ndarray)
+    errors -- bit errors counted per Eb/N0 point (np.ndarray)
+    """
+    k = BITS_PER_SYMBOL.get(mod_type)
+    if k is None:
+        raise ValueError("Unknown modulation")
+    if n_bits % k != 0:
+        raise ValueError(f"{mod_type} requires a multiple of {k} bits")
+    rng = np.random.default_rng(seed)
+    ebn0 = 10 ** (np.atleast_1d(np.asarray(ebn0_db, dtype=float)) / 10)
+    # Unit-energy symbols carry Es = k * Eb, so N0 = 1 / (k * Eb/N0) and each real dimension gets N0 / 2
+    sigma = np.sqrt(1 / (2 * k * ebn0)).astype(np.float32)[:, None]
+    chunk_bits = max(k, (chunk_samples // len(ebn0)) // k * k)
+    errors = np.zeros(len(ebn0), dtype=np.int64)
+    done = 0
+    while done < n_bits:
+        count = min(chunk_bits, n_bits - done)
+        bits = rng.integers(0, 2, count, dtype=np.uint8)
+        symbols = modulate(mod_type, bits)
+        shape = (len(ebn0), len(symbols))
+        if mod_type == "BPSK":
+            received = symbols + sigma * rng.standard_normal(shape, dtype=np.float32)
+        else:
+            received = symbols + sigma * (rng.standard_normal(shape, dtype=np.float32)
+                                          + 1j * rng.standard_normal(shape, dtype=np.float32))
+        errors += np.count_nonzero(demodulate(mod_type, received) != bits, axis=1)
+        done += count
+        if progress is not None:
+            progress(done, n_bits)
+    return errors / n_bits, errors
+
 def generate_signal(mod_type, n_bits, snr):
     """
     Generate a digital modulated signal (BPSK or QPSK) with specified SNR.
@@ -37,17 +148,8 @@ def generate_signal(mod_type, n_bits, snr):
         # QPSK requires even number of bits (2 bits per symbol)
         if n_bits % 2 != 0:
             raise ValueError("QPSK requires EVEN number of bits")
-        # Group bits into pairs
-        bits = bits.reshape(-1, 2)
-        # Define QPSK mapping (Gray code)
-        mapping = {
-            (0, 0): (1+1j)/np.sqrt(2),
-            (0, 1): (1-1j)/np.sqrt(2),
-            (1, 0): (-1+1j)/np.sqrt(2),
-            (1, 1): (-1-1j)/np.sqrt(2),
-        }
-        # Map each bit-pair to a QPSK symbol
-        symbols = np.array([mapping[tuple(b)] for b in bits])
+        # Map each bit pair to a Gray-coded QPSK symbol (see modulate)
+        symbols = modulate("QPSK", bits)
         # Calculate SNR in linear scale
         snr_linear = 10 ** (snr / 10)
         # Compute power of the QPSK symbols (should be 1)
@@ -57,8 +159,7 @@ def generate_signal(mod_type, n_bits, snr):
         # Create complex AWGN (both I and Q components)
         noise = (np.random.randn(*symbols.shape) + 1j * np.random.randn(*symbols.shape)) * np.sqrt(noise_power/2)
         noisy = symbols + noise
-        # Return bits as flattened 1D array, symbols, and noisy
-        return bits.flatten(), symbols, noisy
+        return bits, symbols, noisy
     else:
         # Unsupported modulation
         raise ValueError("Unknown modulation")
@@ -82,6 +183,30 @@ def plot_signal(t, s, title, ylabel):
     plt.grid(True)
     plt.show()
 
+def plot_ber(ebn0_db, simulated, theory, mod_type, n_bits):
+    """
+    Plot the simulated BER against the theoretical curve on a log scale.
+
+    Arguments:
+    ebn0_db   -- Eb/N0 values in dB (X-axis)
+    simulated -- measured BER per Eb/N0 point
+    theory    -- theoretical BER per Eb/N0 point
+    mod_type  -- modulation name for the title (str)
+    n_bits    -- bits simulated per point, for the legend (int)
+    """
+    plt.figure(figsize=(7,4.5))
+    # Points without any error cannot be drawn on a log scale, so they are left out
+    measured = simulated > 0
+    plt.semilogy(ebn0_db[measured], simulated[measured], 'o', label=f"Simulated ({n_bits:.0e} bits/point)")
+    plt.semilogy(ebn0_db, theory, '-', label="Theory: Q(sqrt(2 Eb/N0))")
+    plt.title(f"{mod_type} Bit Error Rate over AWGN")
+    plt.xlabel("Eb/N0 (dB)")
+    plt.ylabel("BER")
+    plt.legend()
+    plt.grid(True, which="both")
+    plt.tight_layout()
+    plt.show()
+
 def on_calculate_and_plot():
     """
     Callback function for the GUI button.
@@ -114,6 +239,35 @@ def on_calculate_and_plot():
         # Show any errors (e.g., input errors) in a pop-up dialog
         messagebox.showerror("Error", str(e))
 
+def on_simulate_ber():
+    """
+    Callback function for the BER button.
+    Sweeps the Eb/N0 range from the GUI, then plots the measured BER against theory.
+    """
+    try:
+        # Eb/N0 grid from start, stop and step (stop included)
+        start, stop, step = (float(entry.get()) for entry in (ebn0_start_entry, ebn0_stop_entry, ebn0_step_entry))
+        if step <= 0 or stop < start:
+            raise ValueError("Eb/N0 range needs start <= stop and a positive step")
+        ebn0_db = np.arange(start, stop + step / 2, step)
+        # Accept 1e8 as well as 100000000
+        n_bits = int(float(ber_bits_entry.get()))
+        mod_type = mod_choice.get()
+        if mod_type == "QPSK":
+            n_bits -= n_bits % 2
+
+        def show_progress(done, total):
+            # Keep the window responsive during long runs
+            status_label.config(text=f"Simulating... {100 * done // total}%")
+            root.update()
+
+        ber, errors = simulate_ber(mod_type, ebn0_db, n_bits, progress=show_progress)
+        status_label.config(text=f"Simulated {n_bits} bits at {len(ebn0_db)} Eb/N0 points")
+        plot_ber(ebn0_db, ber, theoretical_ber(mod_type, ebn0_db), mod_type, n_bits)
+    except Exception as e:
+        status_label.config(text="")
+        messagebox.showerror("Error", str(e))
+
 # --- Tkinter UI Setup ---
 
 # Create main application window
@@ -141,5 +295,31 @@ mod_choice.grid(row=2, column=1)
 # Add the main button that triggers calculation and plotting
 tk.Button(root, text="Show Signal Format", command=on_calculate_and_plot).grid(row=3, column=0, columnspan=2, pady=10)
 
+# Create entries for the BER sweep: Eb/N0 range (dB) and bits per point
+tk.Label(root, text="Eb/N0 start (dB):").grid(row=4, column=0)
+ebn0_start_entry = tk.Entry(root)
+ebn0_start_entry.insert(0, "0")
+ebn0_start_entry.grid(row=4, column=1)
+
+tk.Label(root, text="Eb/N0 stop (dB):").grid(row=5, column=0)
+ebn0_stop_entry = tk.Entry(root)
+ebn0_stop_entry.insert(0, "10")
+ebn0_stop_entry.grid(row=5, column=1)
+
+tk.Label(root, text="Eb/N0 step (dB):").grid(row=6, column=0)
+ebn0_step_entry = tk.Entry(root)
+ebn0_step_entry.insert(0, "1")
+ebn0_step_entry.grid(row=6, column=1)
+
+tk.Label(root, text="BER bits per point:").grid(row=7, column=0)
+ber_bits_entry = tk.Entry(root)
+ber_bits_entry.insert(0, "1e6")
+ber_bits_entry.grid(row=7, column=1)
+
+# Button that runs the BER simulation, and a label for its progress
+tk.Button(root, text="Simulate BER", command=on_simulate_ber).grid(row=8, column=0, columnspan=2, pady=10)
+status_label = tk.Label(root, text="")
+status_label.grid(row=9, column=0, columnspan=2)
+
 # Start the Tkinter event loop
 root.mainloop()
\ No newline at end of file